@@ -0,0 +1,91 @@
+import argparse
+import threading
+import time
+
+from proxy_scheduler import ProxyScheduler
+from rate_limiting import TokenBucket
+
+class LinearProxySelector:
+    """Прежний выбор прокси из declaration_details_downloader (для сравнения).
+
+    На каждый запрос под общей блокировкой строятся списки активных и
+    свободных прокси и выполняется min() по всем, включая опрос лимитера
+    каждого прокси.
+    """
+    def __init__(self, proxies, limiters):
+        self.proxy_list = list(proxies)
+        self.proxy_stats = {p: {"success": 0, "errors": 0, "rate_limit_errors": 0, "last_used": 0, "active": True}
+                            for p in self.proxy_list}
+        self.proxy_in_flight = {}
+        self.limiters = limiters
+        self.lock = threading.Lock()
+
+    def acquire(self, exclude=None):
+        with self.lock:
+            active_proxies = [p for p in self.proxy_list if self.proxy_stats[p]["active"]]
+            if exclude:
+                active_proxies = [p for p in active_proxies if p not in exclude] or active_proxies
+            free_proxies = [p for p in active_proxies if self.proxy_in_flight.get(p, 0) < 1]
+            if not free_proxies:
+                return None
+            selected = min(
+                free_proxies,
+                key=lambda p: (self.limiters[p].delay_until_ready(), self.proxy_in_flight.get(p, 0), self.proxy_stats[p]["last_used"])
+            )
+            self.proxy_stats[selected]["last_used"] = time.time()
+            self.proxy_in_flight[selected] = self.proxy_in_flight.get(selected, 0) + 1
+            return selected
+
+    def release(self, proxy):
+        with self.lock:
+            if self.proxy_in_flight.get(proxy, 0) > 0:
+                self.proxy_in_flight[proxy] -= 1
+
+def make_proxies(count):
+    return [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}:8080" for i in range(count)]
+
+def run_workers(selector, workers, calls_per_worker):
+    """Потоки выбирают и освобождают прокси; возвращает пар выбор+освобождение в секунду"""
+    def worker():
+        done = 0
+        while done < calls_per_worker:
+            proxy = selector.acquire()
+            if proxy is None:
+                continue
+            selector.release(proxy)
+            done += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return workers * calls_per_worker / (time.perf_counter() - start)
+
+def benchmark(proxy_counts, workers_list, calls_per_worker):
+    print(f"{'Прокси':>8} | {'Потоков':>7} | {'Перебор, оп/с':>14} | {'Куча, оп/с':>12} | {'Ускорение':>9}")
+    for count in proxy_counts:
+        proxies = make_proxies(count)
+        limiters = {p: TokenBucket(rate=10 ** 9, burst=10 ** 6) for p in proxies}
+        for workers in workers_list:
+            linear = LinearProxySelector(proxies, limiters)
+            scheduler = ProxyScheduler(proxies, get_ready_time=lambda p: limiters[p].next_ready_time())
+            # Для медленного перебора хватает меньшего числа вызовов
+            linear_calls = max(1, min(calls_per_worker, 200000 // count))
+            linear_rate = run_workers(linear, workers, linear_calls)
+            heap_rate = run_workers(scheduler, workers, calls_per_worker)
+            print(f"{count:>8} | {workers:>7} | {linear_rate:>14,.0f} | {heap_rate:>12,.0f} | {heap_rate / linear_rate:>8.0f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Микробенчмарк выбора прокси: перебор списка против индексированного планировщика')
+    parser.add_argument('--proxies', type=str, default="100,1000,10000", help='Количество прокси через запятую (по умолчанию: 100,1000,10000)')
+    parser.add_argument('--workers', type=str, default="1,4,16", help='Количество потоков через запятую (по умолчанию: 1,4,16)')
+    parser.add_argument('--calls', type=int, default=5000, help='Количество выборов на поток (по умолчанию: 5000)')
+    args = parser.parse_args()
+
+    benchmark(
+        [int(c) for c in args.proxies.split(",") if c.strip()],
+        [int(w) for w in args.workers.split(",") if w.strip()],
+        args.calls
+    )
@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import threading
+import time
+
+from rate_limiting import TokenBucket
+
+class SlidingWindowLimiter:
+    """Прежний ограничитель из declarations_downloader (для сравнения): спит под блокировкой"""
+    def __init__(self, max_calls_per_second=1):
+        self.max_calls = max_calls_per_second
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def _cleanup_old_calls(self):
+        current_time = time.time()
+        self.calls = [t for t in self.calls if current_time - t < 1.0]
+
+    def wait_for_permission(self):
+        with self.lock:
+            self._cleanup_old_calls()
+            if len(self.calls) >= self.max_calls:
+                sleep_time = 1.0 - (time.time() - self.calls[0])
+                if sleep_time > 0:
+                    time.sleep(sleep_time + 0.1)
+                self._cleanup_old_calls()
+
+            self.calls.append(time.time())
+
+def max_calls_in_window(timestamps, window=1.0):
+    """Максимальное количество вызовов в любом окне заданной длины"""
+    timestamps = sorted(timestamps)
+    best = 0
+    start = 0
+    for end, t in enumerate(timestamps):
+        while t - timestamps[start] >= window:
+            start += 1
+        best = max(best, end - start + 1)
+    return best
+
+def run_threads(limiter, workers, duration):
+    """Потоки непрерывно запрашивают разрешения; возвращает времена выдачи и задержки ожидания.
+    
+    Учитываются только разрешения, выданные до окончания прогона: слоты,
+    зарезервированные на потом, в лимит этого интервала не входят.
+    """
+    grants = []
+    waits = []
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def worker():
+        local_grants = []
+        local_waits = []
+        while True:
+            requested = time.monotonic()
+            if requested >= stop_at:
+                break
+            limiter.wait_for_permission()
+            granted = time.monotonic()
+            if granted <= stop_at:
+                local_grants.append(granted)
+                local_waits.append(granted - requested)
+        with lock:
+            grants.extend(local_grants)
+            waits.extend(local_waits)
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return grants, waits
+
+async def run_coroutines(limiter, workers, duration):
+    """Асинхронный вариант run_threads для wait_for_permission_async"""
+    grants = []
+    stop_at = time.monotonic() + duration
+
+    async def worker():
+        while time.monotonic() < stop_at:
+            await limiter.wait_for_permission_async()
+            granted = time.monotonic()
+            if granted <= stop_at:
+                grants.append(granted)
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    return grants
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def benchmark_overhead(workers_list, calls_per_worker):
+    """Пропускная способность самого ограничителя при очень высоком лимите"""
+    print("\nНакладные расходы (лимит не достигается, разрешений в секунду):")
+    print(f"{'Потоков':>8} | {'Скользящее окно':>16} | {'GCRA':>12}")
+    for workers in workers_list:
+        row = []
+        for limiter in (SlidingWindowLimiter(max_calls_per_second=10 ** 6), TokenBucket(rate=10 ** 9, burst=10 ** 6)):
+            def worker():
+                for _ in range(calls_per_worker):
+                    limiter.wait_for_permission()
+            threads = [threading.Thread(target=worker) for _ in range(workers)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            row.append(workers * calls_per_worker / (time.perf_counter() - start))
+        print(f"{workers:>8} | {row[0]:>16,.0f} | {row[1]:>12,.0f}")
+
+def benchmark_limit(workers_list, rate, burst, duration):
+    """Соблюдение лимита и задержки ожидания при заданной скорости"""
+    allowed = burst + rate * duration
+    print(f"\nСоблюдение лимита {rate} запр/с (burst {burst}) за {duration} с:")
+    print(f"допустимо не больше {allowed:.0f} разрешений всего и {rate + burst - 1} в любом окне 1 с")
+    print(f"{'Ограничитель':>16} | {'Потоков':>7} | {'Выдано':>6} | {'Макс/1с':>7} | {'Ожидание p50':>12} | {'p99':>8}")
+    for workers in workers_list:
+        for name, limiter in (("Скользящее окно", SlidingWindowLimiter(max_calls_per_second=rate)),
+                              ("GCRA", TokenBucket(rate=rate, burst=burst))):
+            grants, waits = run_threads(limiter, workers, duration)
+            print(f"{name:>16} | {workers:>7} | {len(grants):>6} | {max_calls_in_window(grants):>7} | "
+                  f"{percentile(waits, 0.5):>10.3f} с | {percentile(waits, 0.99):>6.3f} с")
+
+    print("\nАсинхронный вариант (GCRA):")
+    for workers in workers_list:
+        grants = asyncio.run(run_coroutines(TokenBucket(rate=rate, burst=burst), workers, duration))
+        print(f"{'корутин':>16} | {workers:>7} | {len(grants):>6} | {max_calls_in_window(grants):>7}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Микробенчмарк ограничителей частоты запросов')
+    parser.add_argument('--workers', type=str, default="1,4,16,64", help='Количество потоков через запятую (по умолчанию: 1,4,16,64)')
+    parser.add_argument('--rate', type=int, default=50, help='Лимит запросов в секунду для проверки соблюдения (по умолчанию: 50)')
+    parser.add_argument('--burst', type=int, default=5, help='Допустимая пачка запросов для GCRA (по умолчанию: 5)')
+    parser.add_argument('--duration', type=float, default=2.0, help='Длительность каждого прогона в секундах (по умолчанию: 2.0)')
+    parser.add_argument('--calls', type=int, default=2000, help='Количество вызовов на поток при замере накладных расходов (по умолчанию: 2000)')
+    args = parser.parse_args()
+
+    workers_list = [int(w) for w in args.workers.split(",") if w.strip()]
+    benchmark_overhead(workers_list, args.calls)
+    benchmark_limit(workers_list, args.rate, args.burst, args.duration)
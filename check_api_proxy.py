@@ -1,10 +1,9 @@
-import requests
 import urllib3
-import time
 import sys
 import os
-import socket
 from tqdm import tqdm
+from proxy_model import parse_proxies
+from proxy_checker import check_proxies, save_check_results, rank_results, DEFAULT_CHECK_WORKERS
 
 # Отключаем предупреждения о небезопасных SSL соединениях
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -22,8 +21,10 @@ def load_proxies(proxy_file):
         for encoding in encodings:
             try:
                 with open(proxy_file, 'r', encoding=encoding) as f:
-                    proxies = [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+                    proxies, invalid = parse_proxies(f)
                 print(f"Успешно загружено {len(proxies)} прокси из файла {proxy_file} (кодировка: {encoding})")
+                if invalid:
+                    print(f"[ПРЕДУПРЕЖДЕНИЕ] Пропущено {len(invalid)} строк неподдерживаемого формата, например: {invalid[0]}")
                 
                 # Выводим первые 5 прокси для проверки
                 if len(proxies) > 0:
@@ -41,67 +42,18 @@ def load_proxies(proxy_file):
         print(f"[ОШИБКА] Ошибка при загрузке прокси: {e}")
         return []
 
-def check_proxy(proxy, target_url, timeout=10, user_agent=None):
-    """Проверяет работу прокси для доступа к целевому URL"""
-    headers = {
-        "User-Agent": user_agent or "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
-    
-    # Определяем тип прокси по префиксу
-    proxy_type = proxy.split('://')[0] if '://' in proxy else 'http'
-    
-    # Настройка прокси в соответствии с типом
-    proxies = {
-        "http": proxy,
-        "https": proxy
-    }
-    
-    try:
-        start_time = time.time()
-        
-        # Используем специальные настройки для SOCKS прокси
-        if 'socks' in proxy_type.lower():
-            print(f"[ИНФО] Используется SOCKS прокси: {proxy}")
-        
-        # Увеличиваем таймаут для проверки через прокси
-        response = requests.get(
-            target_url, 
-            proxies=proxies, 
-            timeout=timeout, 
-            verify=False,  # Отключаем проверку SSL сертификата
-            headers=headers
-        )
-        elapsed = time.time() - start_time
-        
-        return {
-            "success": response.status_code == 200,
-            "status_code": response.status_code,
-            "time": elapsed,
-            "response_size": len(response.content),
-            "error": None
-        }
-    except requests.exceptions.ProxyError as e:
-        return {"success": False, "error": f"Ошибка прокси: {e}"}
-    except requests.exceptions.ConnectTimeout:
-        return {"success": False, "error": "Таймаут соединения"}
-    except requests.exceptions.ReadTimeout:
-        return {"success": False, "error": "Таймаут чтения"}
-    except socket.timeout:
-        return {"success": False, "error": "Таймаут сокета"}
-    except Exception as e:
-        return {"success": False, "error": str(e)}
-
 def main():
     if len(sys.argv) < 2:
-        print("Использование: python check_api_proxy.py <файл_с_прокси> [url] [timeout]")
-        print("Пример: python check_api_proxy.py formatted_proxies.txt https://api.belgiss.by/ 15")
+        print("Использование: python check_api_proxy.py <файл_с_прокси> [url] [timeout] [потоков]")
+        print("Пример: python check_api_proxy.py formatted_proxies.txt https://api.belgiss.by/ 15 200")
         return
     
     proxy_file = sys.argv[1]
     target_url = sys.argv[2] if len(sys.argv) > 2 else "https://api.belgiss.by/"
     timeout = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else DEFAULT_CHECK_WORKERS
     
-    print(f"Проверка прокси для доступа к {target_url} (таймаут: {timeout} сек)")
+    print(f"Проверка прокси для доступа к {target_url} (таймаут: {timeout} сек, одновременно: {workers})")
     print("Убедитесь, что установлен пакет 'requests[socks]' для поддержки SOCKS прокси:")
     print("  pip install requests[socks]")
     
@@ -115,19 +67,24 @@ def main():
     working_proxies = []
     non_working_proxies = []
     
-    # Проверка каждого прокси
+    # Прокси проверяются параллельно, результаты выводятся по мере готовности
     print(f"Начинаем проверку {len(proxies)} прокси...")
     
-    for proxy in tqdm(proxies, desc="Проверка прокси"):
-        result = check_proxy(proxy, target_url, timeout)
-        if result["success"]:
-            working_proxies.append((proxy, result))
-            # Выводим информацию о рабочем прокси
-            print(f"\n[УСПЕХ] {proxy} - Статус: {result['status_code']}, Время: {result['time']:.2f} сек, Размер ответа: {result['response_size']} байт")
-        else:
-            non_working_proxies.append((proxy, result))
-            # Выводим информацию о нерабочем прокси, но менее подробную
-            print(f"\n[ОШИБКА] {proxy} - {result['error']}")
+    with tqdm(total=len(proxies), desc="Проверка прокси") as progress_bar:
+        def on_result(result):
+            proxy = result["proxy"]
+            if result["success"]:
+                working_proxies.append((proxy, result))
+                # Выводим информацию о рабочем прокси
+                progress_bar.write(f"[УСПЕХ] {proxy} - Статус: {result['status_code']}, Соединение: {result['connect_time']:.2f} сек, "
+                                   f"Первый байт: {result['ttfb']:.2f} сек, Время: {result['time']:.2f} сек, Размер ответа: {result['response_size']} байт")
+            else:
+                non_working_proxies.append((proxy, result))
+                # Выводим информацию о нерабочем прокси, но менее подробную
+                progress_bar.write(f"[ОШИБКА] {proxy} - {result['error']}")
+            progress_bar.update(1)
+        
+        results = check_proxies(proxies, target_url, timeout, workers, on_result=on_result)
     
     # Выводим общую статистику
     print("\n" + "="*80)
@@ -140,16 +97,14 @@ def main():
     # Если есть рабочие прокси, выводим топ-5 по скорости
     if working_proxies:
         print("\nТоп 5 самых быстрых прокси:")
-        sorted_proxies = sorted(working_proxies, key=lambda x: x[1]["time"])
-        for i, (proxy, result) in enumerate(sorted_proxies[:5], 1):
-            print(f"{i}. {proxy} - Время: {result['time']:.2f} сек")
+        for i, result in enumerate(rank_results(results)[:5], 1):
+            print(f"{i}. {result['proxy']} - Первый байт: {result['ttfb']:.2f} сек, Время: {result['time']:.2f} сек")
         
-        # Сохраняем рабочие прокси в файл
+        # Сохраняем рабочие прокси (от быстрых к медленным) и отчет по всем проверкам
         working_file = f"working_{os.path.basename(proxy_file)}"
-        with open(working_file, 'w', encoding='utf-8') as f:
-            for proxy, _ in working_proxies:
-                f.write(f"{proxy}\n")
+        report_file = save_check_results(results, working_file, target_url)
         print(f"\nРабочие прокси сохранены в файл {working_file}")
+        print(f"Отчет о проверке сохранен в файл {report_file}")
     else:
         print("\n[ВНИМАНИЕ] Рабочих прокси не найдено!")
     
@@ -0,0 +1,148 @@
+import heapq
+import itertools
+import threading
+import time
+
+# Состояния автомата защиты прокси
+CLOSED = "closed"        # Прокси работает в обычном режиме
+OPEN = "open"            # Прокси отключен до истечения таймаута
+HALF_OPEN = "half_open"  # Таймаут истек, через прокси пропускается один пробный запрос
+
+class CircuitBreakers:
+    """Автоматы защиты (circuit breaker) для набора прокси.
+
+    Пока автомат прокси закрыт, считаются ответы 429; после
+    failure_threshold таких ответов автомат открывается и прокси
+    отключается на open_timeout секунд. По истечении таймаута автомат
+    переходит в полуоткрытое состояние: через прокси пропускается ровно
+    один пробный запрос. Успех закрывает автомат и возвращает прокси
+    полный поток запросов, неудача снова открывает его.
+
+    Вместо отдельного threading.Timer на каждый отключенный прокси сроки
+    хранятся в одной куче, которую разбирает один фоновый поток. Смена
+    состояний сообщается через on_open, on_half_open и on_close; они
+    вызываются без удержания внутренней блокировки.
+    """
+    def __init__(self, failure_threshold=5, open_timeout=300, on_open=None, on_half_open=None, on_close=None):
+        self.failure_threshold = failure_threshold
+        self.open_timeout = open_timeout
+        self.on_open = on_open
+        self.on_half_open = on_half_open
+        self.on_close = on_close
+
+        self.states = {}
+        self.failures = {}
+        self.trials = set()    # Прокси, через которые сейчас идет пробный запрос
+        self.versions = {}     # Версия срока: устаревшие записи в куче пропускаются
+        self.heap = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def get_state(self, proxy):
+        with self.condition:
+            return self.states.get(proxy, CLOSED)
+
+    def get_state_counts(self):
+        """Количество прокси в открытом и полуоткрытом состоянии"""
+        with self.condition:
+            counts = {OPEN: 0, HALF_OPEN: 0}
+            for state in self.states.values():
+                if state in counts:
+                    counts[state] += 1
+            return counts
+
+    def _open(self, proxy, timeout):
+        """Открывает автомат и ставит срок перехода в полуоткрытое состояние (под блокировкой)"""
+        self.states[proxy] = OPEN
+        self.trials.discard(proxy)
+        version = self.versions.get(proxy, 0) + 1
+        self.versions[proxy] = version
+        heapq.heappush(self.heap, (time.monotonic() + timeout, next(self.counter), proxy, version))
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        self.condition.notify()
+
+    def _close(self, proxy):
+        self.states.pop(proxy, None)
+        self.failures.pop(proxy, None)
+        self.trials.discard(proxy)
+        self.versions[proxy] = self.versions.get(proxy, 0) + 1
+
+    def record_success(self, proxy):
+        """Учитывает успешный ответ; успешный пробный запрос закрывает автомат"""
+        with self.condition:
+            if self.states.get(proxy) != HALF_OPEN:
+                return
+            self._close(proxy)
+        if self.on_close:
+            self.on_close(proxy)
+
+    def record_failure(self, proxy, rate_limit_error=False, timeout=None):
+        """Учитывает неудачный ответ.
+
+        В закрытом состоянии считаются только ответы 429, в полуоткрытом
+        любая неудача пробного запроса снова открывает автомат. Возвращает
+        True, если автомат открылся.
+        """
+        with self.condition:
+            state = self.states.get(proxy, CLOSED)
+            if state == OPEN:
+                # Ответы на запросы, отправленные до открытия автомата
+                return False
+            if state == CLOSED:
+                if not rate_limit_error:
+                    return False
+                self.failures[proxy] = self.failures.get(proxy, 0) + 1
+                if self.failures[proxy] < self.failure_threshold:
+                    return False
+            self._open(proxy, self.open_timeout if timeout is None else timeout)
+        if self.on_open:
+            self.on_open(proxy)
+        return True
+
+    def start_trial(self, proxy):
+        """Отмечает выдачу прокси под запрос; True, если это пробный запрос полуоткрытого автомата.
+
+        Пока пробный запрос не завершится, прокси не должен выдаваться
+        под другие запросы.
+        """
+        with self.condition:
+            if self.states.get(proxy) != HALF_OPEN or proxy in self.trials:
+                return False
+            self.trials.add(proxy)
+            return True
+
+    def finish_trial(self, proxy):
+        """Вызывается при освобождении прокси; True, если пробный запрос завершился без результата.
+
+        Так бывает, когда запрос отменен (например, проиграл дублирующему):
+        автомат остается полуоткрытым и ждет следующей пробы.
+        """
+        with self.condition:
+            if self.states.get(proxy) != HALF_OPEN or proxy not in self.trials:
+                return False
+            self.trials.discard(proxy)
+            return True
+
+    def reset_all(self):
+        """Закрывает все автоматы и сбрасывает счетчики 429; ожидающие сроки становятся устаревшими"""
+        with self.condition:
+            for proxy in list(self.states):
+                self._close(proxy)
+            self.failures.clear()
+            self.heap = []
+
+    def _run(self):
+        """Фоновый поток: переводит открытые автоматы в полуоткрытое состояние по истечении срока"""
+        while True:
+            with self.condition:
+                while not self.heap or self.heap[0][0] > time.monotonic():
+                    self.condition.wait(max(0.0, self.heap[0][0] - time.monotonic()) if self.heap else None)
+                _, _, proxy, version = heapq.heappop(self.heap)
+                if version != self.versions.get(proxy) or self.states.get(proxy) != OPEN:
+                    continue
+                self.states[proxy] = HALF_OPEN
+            if self.on_half_open:
+                self.on_half_open(proxy)
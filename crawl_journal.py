@@ -0,0 +1,139 @@
+import json
+import os
+import threading
+
+# Расширение файлов журнала (не .json, чтобы сканеры списков их не читали)
+JOURNAL_EXTENSION = ".journal"
+
+def get_shard_key(shard):
+    """Возвращает ключ шарда для журнала (пустая строка - весь период без шардов)"""
+    if not shard:
+        return ""
+    return f"{shard['date_from']}-{shard['date_to']}"
+
+class CrawlJournal:
+    """Журнал обхода списка деклараций для продолжения после сбоя.
+
+    Файл журнала - NDJSON: первая строка описывает обход (параметры фильтра,
+    шарды, общее количество записей), каждая следующая фиксирует одну
+    завершенную страницу. Страница записывается в журнал только после того,
+    как ее данные сохранены на диск, поэтому при продолжении повторно
+    запрашиваются лишь страницы, которые точно не были сохранены.
+    """
+    def __init__(self, path, header, pages=None, complete=False):
+        self.path = path
+        self.header = header
+        self.pages = pages or {}
+        self.complete = complete
+        self.lock = threading.Lock()
+
+    @property
+    def timestamp(self):
+        return self.header["timestamp"]
+
+    @classmethod
+    def create(cls, directory, timestamp, params, shards, total_count):
+        """Создает журнал нового обхода"""
+        header = {
+            "type": "crawl",
+            "timestamp": timestamp,
+            "params": params,
+            "shards": shards,
+            "total_count": total_count
+        }
+        path = os.path.join(directory, f"crawl_{timestamp}{JOURNAL_EXTENSION}")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+        return cls(path, header)
+
+    @classmethod
+    def load(cls, path):
+        """Читает журнал; недописанная последняя строка игнорируется"""
+        header = None
+        pages = {}
+        complete = False
+
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+
+                record_type = record.get("type")
+                if record_type == "crawl":
+                    header = record
+                elif record_type == "page":
+                    pages[(record["shard"], record["page"])] = record
+                elif record_type == "complete":
+                    complete = True
+
+        if header is None:
+            return None
+        return cls(path, header, pages, complete)
+
+    @classmethod
+    def find_resumable(cls, directory, params):
+        """Находит последний незавершенный журнал обхода с теми же параметрами"""
+        journal_files = sorted(
+            (f for f in os.listdir(directory) if f.startswith("crawl_") and f.endswith(JOURNAL_EXTENSION)),
+            reverse=True
+        )
+        for filename in journal_files:
+            try:
+                journal = cls.load(os.path.join(directory, filename))
+            except OSError:
+                continue
+            if journal and not journal.complete and journal.header.get("params") == params:
+                return journal
+        return None
+
+    def _append(self, record):
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def record_page(self, shard, page, count, last_id=None, max_id=None, newest_date=None):
+        """Отмечает страницу шарда как сохраненную.
+
+        last_id нужен для продолжения keyset-цепочки, max_id и newest_date -
+        для состояния инкрементальной синхронизации после продолжения.
+        """
+        record = {
+            "type": "page",
+            "shard": get_shard_key(shard),
+            "page": page,
+            "count": count,
+            "last_id": last_id,
+            "max_id": max_id,
+            "newest_date": newest_date.strftime("%d.%m.%Y") if newest_date else None
+        }
+        self._append(record)
+        with self.lock:
+            self.pages[(record["shard"], page)] = record
+
+    def mark_complete(self):
+        """Отмечает обход как полностью завершенный"""
+        self._append({"type": "complete"})
+        self.complete = True
+
+    def is_page_done(self, shard, page):
+        return (get_shard_key(shard), page) in self.pages
+
+    def done_count(self):
+        """Возвращает количество записей на уже сохраненных страницах"""
+        return sum(record["count"] for record in self.pages.values())
+
+    def get_chain_state(self, shard, per_page):
+        """Возвращает состояние keyset-цепочки шарда: (следующая страница, before_id, завершена ли)"""
+        shard_key = get_shard_key(shard)
+        last_record = None
+        for (key, page), record in self.pages.items():
+            if key == shard_key and (last_record is None or page > last_record["page"]):
+                last_record = record
+
+        if last_record is None:
+            return 1, None, False
+
+        finished = last_record["count"] < per_page or last_record["last_id"] is None
+        return last_record["page"] + 1, last_record["last_id"], finished
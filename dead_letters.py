@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+
+from ndjson_sink import NdjsonSink, iter_ndjson_items
+from retry_queue import NON_RETRYABLE_ERRORS
+
+# Имя хранилища неудачных загрузок в каталоге с деталями деклараций
+DEAD_LETTERS_FILENAME = "failed.ndjson"
+
+class DeadLetterStore:
+    """Постоянное хранилище деклараций, которые не удалось загрузить.
+
+    Каждая окончательная неудача сразу дописывается в NDJSON-файл: ID, класс
+    ошибки, прокси, число попыток и время. Когда декларация позже загружается
+    успешно, дописывается отметка resolved. При чтении действует последняя
+    запись для каждого ID, поэтому файл переживает аварийное завершение и
+    не требует отчета download_report.json.
+    """
+    def __init__(self, directory):
+        self.path = os.path.join(directory, DEAD_LETTERS_FILENAME)
+        self.entries = {}
+        self.lock = threading.Lock()
+
+        line_count = 0
+        if os.path.exists(self.path):
+            for record in iter_ndjson_items(self.path):
+                line_count += 1
+                if "id" not in record:
+                    continue
+                if record.get("resolved"):
+                    self.entries.pop(record["id"], None)
+                else:
+                    self.entries[record["id"]] = record
+
+        if line_count > 2 * len(self.entries) + 1000:
+            self._compact()
+
+        self.sink = NdjsonSink(self.path)
+
+    def _compact(self):
+        """Переписывает файл, оставляя только нерешенные неудачи"""
+        temp_path = self.path + ".tmp"
+        with NdjsonSink(temp_path) as sink:
+            sink.write_items(list(self.entries.values()))
+        os.replace(temp_path, self.path)
+
+    def record_result(self, result):
+        """Учитывает итог загрузки декларации: неудачу записывает, успех снимает прежнюю неудачу"""
+        declaration_id = result["id"]
+        if result["success"]:
+            with self.lock:
+                if self.entries.pop(declaration_id, None) is None:
+                    return
+            self.sink.write_items([{"id": declaration_id, "resolved": True}])
+            return
+
+        entry = {
+            "id": declaration_id,
+            "error_class": result.get("error_class"),
+            "error": result.get("error"),
+            "proxy": result.get("proxy"),
+            "attempts": result.get("attempts", 1),
+            "failed_at": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        with self.lock:
+            previous = self.entries.get(declaration_id)
+            if previous:
+                # Попытки накапливаются между запусками
+                entry["attempts"] += previous.get("attempts", 0)
+            self.entries[declaration_id] = entry
+        self.sink.write_items([entry])
+
+    def get_failed_ids(self, include_permanent=False):
+        """Возвращает ID нерешенных неудач; по умолчанию без ошибок, повтор которых бессмыслен (404)"""
+        with self.lock:
+            return [
+                declaration_id for declaration_id, entry in self.entries.items()
+                if include_permanent or entry.get("error_class") not in NON_RETRYABLE_ERRORS
+            ]
+
+    def get_error_counts(self):
+        """Количество нерешенных неудач по классам ошибок"""
+        counts = {}
+        with self.lock:
+            for entry in self.entries.values():
+                error_class = entry.get("error_class") or "unknown"
+                counts[error_class] = counts.get(error_class, 0) + 1
+        return counts
+
+    def close(self):
+        self.sink.close()
@@ -1,4 +1,5 @@
 import requests
+import asyncio
 import json
 import os
 import time
@@ -14,6 +15,24 @@ import random
 import queue
 import logging
 from colorama import init, Fore, Style
+from http_transport import http_get, AsyncSessionPool, aiohttp
+from ndjson_sink import is_ndjson_file, iter_ndjson_items
+from rate_limiting import TokenBucket
+from validator_cache import ValidatorCache, NOT_MODIFIED, get_content_hash, get_conditional_headers, update_validators
+from refresh_planner import plan_refresh
+from details_priority import order_declaration_ids, PRIORITY_KEYS
+from retry_queue import RetryQueue, should_retry, RATE_LIMIT_DELAY
+from hedging import HedgePolicy, LATENCY_WINDOW
+from dead_letters import DeadLetterStore
+from details_storage import (SAVE_MODES, is_details_file, get_details_id, get_details_filename,
+                             looks_like_json_object, scan_doc_id, write_raw_details, replace_with_temp)
+from collections import deque
+from proxy_scheduler import ProxyScheduler
+from circuit_breaker import CircuitBreakers
+from proxy_reputation import ProxyReputationStore, REPUTATION_FILENAME, LATENCY_SAMPLES, get_initial_rate
+from proxy_model import parse_proxies
+from proxy_checker import check_proxies, save_check_report, get_report_filename, DEFAULT_CHECK_WORKERS
+from proxy_health import update_health, get_health_score, get_expected_cost
 
 # Инициализация colorama для поддержки цветов в Windows
 init()
@@ -73,11 +92,15 @@ proxy_list = []
 proxy_lock = threading.Lock()
 proxy_stats = {}  # Статистика работы прокси-серверов
 proxy_limiters = {}  # Ограничители для каждого прокси
-current_proxy_index = 0
+proxy_scheduler = None  # Планировщик выбора прокси (создается в load_proxies)
+proxy_breakers = None  # Автоматы защиты прокси от частых ответов 429 (создаются в load_proxies)
+proxy_reputation_file = REPUTATION_FILENAME  # Файл истории прокси между запусками (None - не использовать)
+proxy_reputation = None  # История прокси, загруженная в load_proxies
+recent_latencies = deque(maxlen=LATENCY_WINDOW)  # Время последних успешных ответов по всему пулу
 
 def load_proxies(proxy_file=None):
     """Загружает список прокси-серверов из файла или использует встроенный список"""
-    global proxy_list, proxy_stats, proxy_limiters
+    global proxy_list, proxy_stats, proxy_limiters, proxy_scheduler, proxy_breakers, proxy_reputation
     
     # Если указан файл с прокси, загружаем из него
     if proxy_file and os.path.exists(proxy_file):
@@ -87,13 +110,12 @@ def load_proxies(proxy_file=None):
         for encoding in encodings:
             try:
                 with open(proxy_file, 'r', encoding=encoding) as f:
-                    loaded_proxies = []
-                    for line in f:
-                        line = line.strip()
-                        if line and not line.startswith('#'):
-                            loaded_proxies.append(line)
+                    # Строки разбираются один раз: запросы берут готовые URL и словарь proxies
+                    loaded_proxies, invalid = parse_proxies(f)
                     
                     proxy_list = loaded_proxies
+                    if invalid:
+                        print_message(f"Пропущено {len(invalid)} строк неподдерживаемого формата, например: {invalid[0]}", True)
                     
                     # Инициализируем статистику и лимитеры для каждого прокси
                     for proxy in proxy_list:
@@ -102,6 +124,11 @@ def load_proxies(proxy_file=None):
                             "errors": 0,         # Ошибки
                             "rate_limit_errors": 0,  # Ошибки превышения лимита
                             "last_used": 0,      # Время последнего использования
+                            "latency": None,     # Сглаженное время ответа в секундах
+                            "success_rate": 1.0,     # Сглаженная доля успешных запросов
+                            "rate_limit_rate": 0.0,  # Сглаженная доля ответов 429
+                            "latencies": deque(maxlen=LATENCY_SAMPLES),  # Последние времена ответа
+                            "last_ban": None,    # Время последнего отключения из-за ответов 429
                             "active": True       # Флаг активности
                         }
                         
@@ -113,6 +140,9 @@ def load_proxies(proxy_file=None):
                             recovery_factor=1.05
                         )
                     
+                    proxy_reputation = seed_proxy_stats_from_reputation()
+                    proxy_scheduler = ProxyScheduler(proxy_list, get_ready_time=get_proxy_ready_time, get_cost=get_proxy_cost)
+                    proxy_breakers = create_proxy_breakers()
                     print_message(f"Загружено {len(proxy_list)} прокси-серверов из файла {proxy_file} (кодировка: {encoding})")
                     return
             except UnicodeDecodeError:
@@ -135,6 +165,9 @@ def load_proxies(proxy_file=None):
                     except:
                         pass
                 
+                loaded_proxies, invalid = parse_proxies(loaded_proxies)
+                if invalid:
+                    print_message(f"Пропущено {len(invalid)} строк неподдерживаемого формата, например: {invalid[0]}", True)
                 if loaded_proxies:
                     proxy_list = loaded_proxies
                     
@@ -145,6 +178,11 @@ def load_proxies(proxy_file=None):
                             "errors": 0,
                             "rate_limit_errors": 0,
                             "last_used": 0,
+                            "latency": None,
+                            "success_rate": 1.0,
+                            "rate_limit_rate": 0.0,
+                            "latencies": deque(maxlen=LATENCY_SAMPLES),
+                            "last_ban": None,
                             "active": True
                         }
                         
@@ -155,6 +193,9 @@ def load_proxies(proxy_file=None):
                             recovery_factor=1.05
                         )
                     
+                    proxy_reputation = seed_proxy_stats_from_reputation()
+                    proxy_scheduler = ProxyScheduler(proxy_list, get_ready_time=get_proxy_ready_time, get_cost=get_proxy_cost)
+                    proxy_breakers = create_proxy_breakers()
                     print_message(f"Загружено {len(proxy_list)} прокси-серверов из файла {proxy_file} (бинарный режим)")
                     return
         except Exception as e:
@@ -162,47 +203,141 @@ def load_proxies(proxy_file=None):
     
     # Если файл не указан или произошла ошибка, используем пустой список
     proxy_list = []
+    proxy_scheduler = None
+    proxy_breakers = None
+    proxy_reputation = None
     print_message("Прокси-серверы не загружены. Запросы будут выполняться напрямую.")
 
-def get_next_proxy():
-    """Возвращает следующий прокси-сервер из списка с учетом статистики использования"""
-    global current_proxy_index
+def seed_proxy_stats_from_reputation():
+    """Подставляет в статистику и лимитеры прокси историю прошлых запусков.
     
-    if not proxy_list:
+    Сглаженные показатели, времена ответа и время последнего бана берутся
+    из файла репутации, а лимитер стартует с выученной безопасной скорости
+    вместо начальной. Возвращает хранилище репутации или None.
+    """
+    if not proxy_reputation_file:
         return None
     
-    with proxy_lock:
-        # Подсчитываем количество активных прокси
-        active_proxies = [p for p in proxy_list if proxy_stats[p]["active"]]
+    store = ProxyReputationStore(proxy_reputation_file)
+    seeded_count = 0
+    for proxy in proxy_list:
+        entry = store.get(str(proxy))
+        if not entry:
+            continue
+        stats = proxy_stats[proxy]
+        for key in ("success_rate", "rate_limit_rate", "latency", "last_ban"):
+            if entry.get(key) is not None:
+                stats[key] = entry[key]
+        stats["latencies"].extend(entry.get("latency_samples", []))
         
+        limiter = proxy_limiters[proxy]
+        limiter.set_rate(get_initial_rate(entry, limiter.get_rate(), limiter.min_rate, limiter.max_rate))
+        seeded_count += 1
+    
+    if seeded_count:
+        print_message(f"История прошлых запусков найдена для {seeded_count} прокси ({proxy_reputation_file})")
+    return store
+
+def save_proxy_reputation():
+    """Сохраняет историю прокси для следующих запусков: показатели, выученную скорость и времена ответа"""
+    if proxy_reputation is None or not proxy_list:
+        return False
+    
+    try:
+        with proxy_lock:
+            for proxy in proxy_list:
+                stats = proxy_stats[proxy]
+                proxy_reputation.update(str(proxy), stats, proxy_limiters[proxy].get_rate(), stats["latencies"])
+        proxy_reputation.save()
+        print_message(f"История {len(proxy_list)} прокси сохранена в файл {proxy_reputation.path}")
+        return True
+    except Exception as e:
+        print_message(f"Ошибка при сохранении истории прокси: {e}", True)
+        return False
+
+def get_proxy_ready_time(proxy):
+    """Момент, когда лимитер прокси выдаст следующий слот без ожидания"""
+    return proxy_limiters[proxy].bucket.next_ready_time()
+
+def get_proxy_cost(proxy):
+    """Ожидаемое время получения ответа через прокси по его сглаженной статистике (см. proxy_health)"""
+    return get_expected_cost(proxy_stats[proxy])
+
+def on_proxy_circuit_open(proxy):
+    with proxy_lock:
+        proxy_stats[proxy]["active"] = False
+        proxy_stats[proxy]["last_ban"] = time.time()
+    proxy_scheduler.deactivate(proxy)
+    print_message(f"Прокси {proxy} временно деактивирован из-за частых ошибок превышения лимита")
+
+def on_proxy_circuit_half_open(proxy):
+    with proxy_lock:
+        proxy_stats[proxy]["active"] = True
+    proxy_scheduler.activate(proxy)
+    print_message(f"Прокси {proxy} получит пробный запрос")
+
+def on_proxy_circuit_close(proxy):
+    proxy_scheduler.activate(proxy)
+    print_message(f"Прокси {proxy} снова активен")
+
+def create_proxy_breakers():
+    """Создает автоматы защиты: после 5 ответов 429 прокси отключается на 300 секунд,
+    затем через него проходит один пробный запрос"""
+    return CircuitBreakers(
+        failure_threshold=5,
+        open_timeout=300,
+        on_open=on_proxy_circuit_open,
+        on_half_open=on_proxy_circuit_half_open,
+        on_close=on_proxy_circuit_close
+    )
+
+def acquire_proxy(exclude=None):
+    """Занимает свободный прокси, который раньше других сможет выполнить запрос.
+    
+    Через один прокси одновременно выполняется не больше
+    proxy_scheduler.max_in_flight запросов (в режиме "1 прокси - 1
+    декларация" - один). Выбор делает планировщик: прокси упорядочены по
+    ожидаемому завершению запроса: когда лимитер выдаст слот плюс сколько
+    по статистике прокси займет успешный ответ. Прокси из exclude
+    (через них эту задачу уже пробовали) используются, только если других
+    активных прокси нет. Возвращает None, если все подходящие слоты заняты.
+    
+    Прокси с полуоткрытым автоматом защиты выдается под один пробный
+    запрос и до его завершения снимается с выбора.
+    """
+    if not proxy_list:
+        return None
+    
+    if proxy_scheduler.active_count == 0:
         # Если активных прокси нет, пробуем восстановить все
-        if not active_proxies:
-            print_message("Нет активных прокси. Восстанавливаем все прокси.", True)
+        print_message("Нет активных прокси. Восстанавливаем все прокси.", True)
+        with proxy_lock:
             for proxy in proxy_list:
                 proxy_stats[proxy]["active"] = True
-            active_proxies = proxy_list
-                
-        # Если все еще нет активных прокси, возвращаем None
-        if not active_proxies:
-            return None
-        
-        # Находим прокси, который давно не использовался и активен
-        current_time = time.time()
-        selected_proxy = min(
-            active_proxies, 
-            key=lambda p: proxy_stats[p]["last_used"]
-        )
-        
-        # Обновляем время последнего использования
-        proxy_stats[selected_proxy]["last_used"] = current_time
-        
-        # Получаем лимитер для этого прокси
-        limiter = proxy_limiters[selected_proxy]
-        
-        return selected_proxy
+        proxy_breakers.reset_all()
+        proxy_scheduler.activate_all()
+    
+    proxy = proxy_scheduler.acquire(exclude)
+    if proxy is not None:
+        proxy_stats[proxy]["last_used"] = time.time()
+        if proxy_breakers.start_trial(proxy):
+            proxy_scheduler.deactivate(proxy)
+    return proxy
+
+def release_proxy(proxy):
+    """Освобождает слот прокси после завершения запроса"""
+    proxy_scheduler.release(proxy)
+    if proxy_breakers.finish_trial(proxy):
+        # Пробный запрос отменен, не дав результата: прокси ждет следующей пробы
+        proxy_scheduler.activate(proxy)
 
-def update_proxy_stats(proxy, success=True, rate_limit_error=False, timeout=300):
-    """Обновляет статистику использования прокси"""
+def update_proxy_stats(proxy, success=True, rate_limit_error=False, timeout=None, latency=None):
+    """Обновляет статистику использования прокси; latency - время ответа в секундах.
+    
+    Ответы 429 считает автомат защиты прокси: после нескольких таких
+    ответов прокси отключается на timeout секунд (по умолчанию - на
+    open_timeout автомата, см. CircuitBreakers).
+    """
     if not proxy or proxy not in proxy_stats:
         return
     
@@ -211,35 +346,43 @@ def update_proxy_stats(proxy, success=True, rate_limit_error=False, timeout=300)
             proxy_stats[proxy]["success"] += 1
         else:
             proxy_stats[proxy]["errors"] += 1
+        
+        # Сглаженные доля успехов, доля 429 и время ответа определяют вес прокси при выборе
+        update_health(proxy_stats[proxy], success, rate_limit_error, latency)
+        if latency is not None:
+            # Запоминаем время ответа для порога дублирования запросов и для истории прокси
+            recent_latencies.append(latency)
+            proxy_stats[proxy]["latencies"].append(latency)
             
         if rate_limit_error:
             proxy_stats[proxy]["rate_limit_errors"] += 1
-            
-            # Если много ошибок с превышением лимита, деактивируем прокси на время
-            if proxy_stats[proxy]["rate_limit_errors"] >= 5:
-                proxy_stats[proxy]["active"] = False
-                print_message(f"Прокси {proxy} временно деактивирован из-за частых ошибок превышения лимита")
-                
-                # Планируем реактивацию через некоторое время
-                # Создаем таймер для восстановления прокси через указанное время
-                def reactivate_proxy():
-                    with proxy_lock:
-                        if proxy in proxy_stats:
-                            proxy_stats[proxy]["active"] = True
-                            proxy_stats[proxy]["rate_limit_errors"] = 0
-                            print_message(f"Прокси {proxy} снова активен")
-                
-                # Запускаем таймер в отдельном потоке
-                timer_thread = threading.Timer(timeout, reactivate_proxy)
-                timer_thread.daemon = True
-                timer_thread.start()
+    
+    # Автомат вызывает обработчики смены состояния, поэтому вызывается без proxy_lock
+    if proxy_breakers:
+        if success:
+            proxy_breakers.record_success(proxy)
+        else:
+            proxy_breakers.record_failure(proxy, rate_limit_error, timeout)
+    
+    # Подстраиваем темп запросов через этот прокси
+    limiter = proxy_limiters.get(proxy)
+    if limiter:
+        if success:
+            limiter.report_success()
+        elif rate_limit_error:
+            limiter.report_error()
+
+def get_recent_latencies():
+    """Возвращает снимок времен последних успешных ответов по всему пулу"""
+    with proxy_lock:
+        return list(recent_latencies)
 
 def get_proxy_stats():
     """Возвращает статистику использования прокси-серверов для отображения"""
     with proxy_lock:
         total_success = sum(stats["success"] for stats in proxy_stats.values())
         total_errors = sum(stats["errors"] for stats in proxy_stats.values())
-        active_count = sum(1 for stats in proxy_stats.values() if stats["active"])
+        active_count = proxy_scheduler.active_count if proxy_scheduler else 0
         
         return {
             "total": len(proxy_list),
@@ -276,7 +419,7 @@ class AdaptiveRateLimiter:
         self.max_rate = max_rate          # Максимальное количество запросов в секунду
         self.backoff_factor = backoff_factor  # Множитель для снижения скорости при ошибках
         self.recovery_factor = recovery_factor  # Множитель для постепенного восстановления скорости
-        self.calls = []
+        self.bucket = TokenBucket(rate=initial_rate)  # Выдает слоты запросов с текущей скоростью
         self.lock = threading.Lock()
         self.error_count = 0              # Счетчик последовательных ошибок
         self.success_count = 0            # Счетчик последовательных успехов
@@ -284,30 +427,21 @@ class AdaptiveRateLimiter:
         self.cooldown_period = 10.0       # Время в секундах между корректировками скорости
         self.min_rate = 0.1               # Минимальная скорость запросов
 
-    def _cleanup_old_calls(self):
-        current_time = time.time()
-        self.calls = [t for t in self.calls if current_time - t < 1.0]
-
     def wait_for_permission(self):
-        with self.lock:
-            self._cleanup_old_calls()
-            delay = 0
-            
-            # Рассчитываем время ожидания на основе текущей скорости
-            if len(self.calls) >= self.current_rate:
-                delay = max(0, (1.0 / self.current_rate) - (time.time() - self.calls[0]))
-                
-            # Добавляем случайность для избежания синхронных запросов
-            jitter = random.uniform(0, 0.3)
-            delay += jitter
-            
-            if delay > 0:
-                time.sleep(delay)
-                
-            # Записываем время нового запроса
-            self.calls.append(time.time())
-            
-            return delay
+        # Слот резервируется без ожидания под блокировкой, спим уже вне ее
+        delay = self.bucket.reserve()
+        
+        # Добавляем случайность для избежания синхронных запросов
+        delay += random.uniform(0, 0.3)
+        time.sleep(delay)
+        
+        return delay
+
+    async def wait_for_permission_async(self):
+        """Асинхронный вариант wait_for_permission для движка asyncio"""
+        delay = self.bucket.reserve() + random.uniform(0, 0.3)
+        await asyncio.sleep(delay)
+        return delay
 
     def report_success(self):
         """Сообщаем о успешном запросе для корректировки скорости"""
@@ -321,6 +455,7 @@ class AdaptiveRateLimiter:
                 current_time - self.last_adjustment_time >= self.cooldown_period and 
                 self.current_rate < self.max_rate):
                 self.current_rate = min(self.max_rate, self.current_rate * self.recovery_factor)
+                self.bucket.set_rate(self.current_rate)
                 self.last_adjustment_time = current_time
                 self.success_count = 0
                 return True  # Скорость была изменена
@@ -339,19 +474,28 @@ class AdaptiveRateLimiter:
                 # Если получили несколько ошибок подряд, снижаем скорость еще больше
                 if self.error_count > 3:
                     self.current_rate = max(self.min_rate, self.current_rate * 0.7)
+                self.bucket.set_rate(self.current_rate)
                 self.last_adjustment_time = time.time()
                 return old_rate != self.current_rate  # Скорость была изменена
         return False
 
+    def set_rate(self, rate):
+        """Устанавливает текущую скорость запросов (например, выученную в прошлых запусках)"""
+        with self.lock:
+            self.current_rate = max(self.min_rate, min(self.max_rate, rate))
+            self.bucket.set_rate(self.current_rate)
+    
     def get_rate(self):
         """Возвращает текущую скорость запросов"""
         with self.lock:
             return self.current_rate
 
-# Функция для сохранения данных в JSON файл
+# Функция для сохранения данных в JSON файл (через временный файл, см. replace_with_temp)
 def save_to_json(data, filename):
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    def write(temp_path):
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    replace_with_temp(filename, write)
 
 # Функция для вывода сообщений в консоль
 def print_message(message, is_error=False, log_only=True, important=False):
@@ -428,51 +572,104 @@ def update_status_line(completed, total, success, errors, rate=None, proxy_info=
     # Убеждаемся, что вывод немедленно отображается
     sys.stdout.flush()
 
+# Сколько ждать завершения текущих запросов после Ctrl+C, секунд
+WORKER_STOP_TIMEOUT = 15
+
+# Результат handle_response: попытка неудачна, запрос можно повторить
+RETRY = object()
+
+def handle_response(status, reason, content, response_headers, latency, proxy, proxy_timeout, validators, outcome, raw):
+    """Разбирает ответ API и обновляет статистику прокси; общий для движков threads и async.
+    
+    Возвращает данные (JSON или байты при raw=True), NOT_MODIFIED, None для
+    отсутствующей декларации или RETRY, если попытку нужно повторить. Класс
+    ошибки записывается в outcome["error_class"].
+    """
+    if status == 200:
+        if validators is not None:
+            # Содержимое не изменилось - не разбираем и не сохраняем его
+            if validators.get("hash") == get_content_hash(content):
+                update_proxy_stats(proxy, success=True, latency=latency)
+                validators["size"] = len(content)
+                return NOT_MODIFIED
+            update_validators(validators, response_headers, content)
+        
+        if raw:
+            # Тело будет записано как есть - проверяем только, что ответ целый
+            if looks_like_json_object(content):
+                update_proxy_stats(proxy, success=True, latency=latency)
+                return content
+            print_message("Ответ не похож на JSON-объект (статус 200)", is_error=True)
+        else:
+            try:
+                data = json.loads(content)
+            except ValueError:
+                print_message("Ошибка декодирования JSON (статус 200)", is_error=True)
+                # Записываем ответ в файл для отладки
+                with open(f"error_response_{int(time.time())}.html", "w", encoding="utf-8") as f:
+                    f.write(content.decode("utf-8", errors="replace"))
+            else:
+                update_proxy_stats(proxy, success=True, latency=latency)
+                return data
+        outcome["error_class"] = "invalid_json"
+        update_proxy_stats(proxy, success=False)
+        return RETRY
+    
+    if status == 304 and validators:
+        # Декларация не изменилась с прошлой загрузки
+        update_proxy_stats(proxy, success=True, latency=latency)
+        validators["size"] = 0
+        return NOT_MODIFIED
+    
+    if status == 429:
+        # Превышение лимита запросов
+        print_message("Превышен лимит запросов (HTTP 429)", is_error=True)
+        outcome["error_class"] = "rate_limit"
+        update_proxy_stats(proxy, success=False, rate_limit_error=True, timeout=proxy_timeout)
+        return RETRY
+    
+    if status == 404:
+        print_message("Декларация не найдена (HTTP 404)", log_only=True)
+        outcome["error_class"] = "not_found"
+        update_proxy_stats(proxy, success=True, latency=latency)  # Считаем успешным, т.к. это не ошибка прокси
+        return None
+    
+    print_message(f"HTTP ошибка {status}: {reason}", is_error=True)
+    outcome["error_class"] = "http_error"
+    update_proxy_stats(proxy, success=False)
+    return RETRY
+
 # Функция для выполнения запроса с повторными попытками и адаптивным контролем скорости
-def make_request_with_retry(url, proxy=None, max_retries=5, initial_delay=2.0, proxy_timeout=300):
-    """Выполняет запрос к API с контролем скорости и повторными попытками"""
+def make_request_with_retry(url, proxy=None, max_retries=5, initial_delay=2.0, proxy_timeout=300, validators=None, outcome=None, raw=False):
+    """Выполняет запрос к API с контролем скорости и повторными попытками.
+    
+    Если передан словарь validators с сохраненными валидаторами, запрос
+    делается условным: при ответе 304 или совпадении хеша тела возвращается
+    NOT_MODIFIED без разбора JSON. При новом содержимом словарь заполняется
+    новыми валидаторами и размером ответа.
+    
+    При raw=True тело ответа не разбирается: после быстрой проверки, что это
+    JSON-объект, возвращаются исходные байты.
+    
+    В словарь outcome, если он передан, записывается класс ошибки последней
+    попытки (error_class): rate_limit, not_found, http_error, timeout,
+    connection, invalid_json или unexpected.
+    """
+    if outcome is None:
+        outcome = {}
+
     # Получаем случайные заголовки для имитации браузера
     headers = get_random_headers()
+    if validators:
+        headers.update(get_conditional_headers(validators))
     
     proxies = None
     proxy_used = None
     
     if proxy:
-        # Для SOCKS прокси
-        if proxy.lower().startswith(('socks4://', 'socks5://')):
-            proxies = {
-                "http": proxy,
-                "https": proxy
-            }
-        # Для HTTP/HTTPS прокси
-        else:
-            parts = proxy.split(':')
-            # Если прокси содержит логин и пароль
-            if len(parts) == 4:
-                ip, port, username, password = parts
-                proxy_auth = f"{username}:{password}@{ip}:{port}"
-                proxies = {
-                    "http": f"http://{proxy_auth}",
-                    "https": f"http://{proxy_auth}"
-                }
-            # Если прокси без аутентификации
-            elif len(parts) == 2:
-                ip, port = parts
-                proxies = {
-                    "http": f"http://{ip}:{port}",
-                    "https": f"http://{ip}:{port}"
-                }
-            # Если прокси уже содержит протокол
-            else:
-                if not proxy.startswith(('http://', 'https://')):
-                    proxy = f"http://{proxy}"
-                
-                proxies = {
-                    "http": proxy,
-                    "https": proxy
-                }
-        
-        proxy_used = proxy.split('@')[-1] if '@' in proxy else proxy
+        # Словарь proxies и подпись без логина и пароля готовы с момента загрузки списка
+        proxies = proxy.proxies
+        proxy_used = proxy.label
         print_message(f"Использую прокси: {proxy_used}", log_only=True)
     
     # Счетчик попыток
@@ -486,77 +683,45 @@ def make_request_with_retry(url, proxy=None, max_retries=5, initial_delay=2.0, p
                 print_message(f"Повторная попытка {attempt}/{max_retries} через {delay:.1f} сек...", log_only=True)
                 time.sleep(delay)
             
-            # Выполняем запрос с фиксированным таймаутом 10 секунд
-            response = requests.get(
+            # Выполняем запрос через пул сессий прокси с фиксированным таймаутом 10 секунд
+            request_start = time.monotonic()
+            response = http_get(
                 url, 
                 headers=headers,
                 proxies=proxies,
-                verify=False,
                 timeout=10  # Фиксированный таймаут 10 секунд
             )
+            latency = time.monotonic() - request_start
             
-            # Проверяем код статуса
-            if response.status_code == 200:
-                # Успешный запрос
-                if proxy:
-                    # Обновляем статистику прокси
-                    update_proxy_stats(proxy, success=True)
-                
-                # Возвращаем JSON-данные
-                try:
-                    return response.json()
-                except json.JSONDecodeError:
-                    print_message(f"Ошибка декодирования JSON (статус 200)", is_error=True)
-                    if proxy:
-                        update_proxy_stats(proxy, success=False)
-                    # Записываем ответ в файл для отладки
-                    with open(f"error_response_{int(time.time())}.html", "w", encoding="utf-8") as f:
-                        f.write(response.text)
-                    continue
-            
-            # Обрабатываем различные коды статуса
-            elif response.status_code == 429:
-                # Превышение лимита запросов
-                print_message(f"Превышен лимит запросов (HTTP 429)", is_error=True)
-                if proxy:
-                    update_proxy_stats(proxy, success=False, rate_limit_error=True)
-                
-                # Увеличиваем задержку для этого прокси
-                time.sleep(5)  # Фиксированная задержка при 429
-                continue
-            
-            elif response.status_code == 404:
-                # Ресурс не найден
-                print_message(f"Декларация не найдена (HTTP 404)", log_only=True)
-                if proxy:
-                    update_proxy_stats(proxy, success=True)  # Считаем успешным, т.к. это не ошибка прокси
-                return None
-            
-            else:
-                # Другие ошибки HTTP
-                print_message(f"HTTP ошибка {response.status_code}: {response.reason}", is_error=True)
-                if proxy:
-                    update_proxy_stats(proxy, success=False)
+            result = handle_response(response.status_code, response.reason, response.content, response.headers, latency,
+                                     proxy, proxy_timeout, validators, outcome, raw)
+            if result is not RETRY:
+                return result
+            if outcome["error_class"] == "rate_limit" and attempt < max_retries:
+                time.sleep(RATE_LIMIT_DELAY)  # Та же задержка после 429, что и в очереди повторов
         
         except requests.exceptions.Timeout:
-            print_message(f"Таймаут запроса", is_error=True)
+            print_message("Таймаут запроса", is_error=True)
+            outcome["error_class"] = "timeout"
             if proxy:
                 update_proxy_stats(proxy, success=False)
         
         except requests.exceptions.ConnectionError:
             proxy_info = f" через {proxy_used}" if proxy_used else ""
             print_message(f"Ошибка соединения{proxy_info}", is_error=True)
+            outcome["error_class"] = "connection"
             if proxy:
                 update_proxy_stats(proxy, success=False)
         
         except Exception as e:
             proxy_info = f" через {proxy_used}" if proxy_used else ""
             print_message(f"Непредвиденная ошибка{proxy_info}: {e}", is_error=True)
+            outcome["error_class"] = "unexpected"
             if proxy:
                 update_proxy_stats(proxy, success=False)
     
     # Если все попытки были неудачными
-    print_message(f"Все попытки выполнить запрос были неудачными", is_error=True, log_only=True)
+    print_message("Все попытки выполнить запрос были неудачными", is_error=True, log_only=True)
     return None
 
 # Функция для загрузки деталей по одному ID
@@ -583,6 +748,473 @@ def download_declaration_details(declaration_id, batch_folder, limiter):
         "doc_id": data.get("DocId", "Unknown")
     }
 
+def get_not_modified_result(declaration_id, cached, validators, proxy_label):
+    """Запись для отчета о декларации, которая не изменилась с прошлой загрузки"""
+    return {
+        "id": declaration_id,
+        "success": True,
+        "not_modified": True,
+        "path": cached["path"],
+        "proxy": proxy_label,
+        "bytes": validators.get("size", 0)
+    }
+
+def get_failed_result(declaration_id, outcome, proxy_label):
+    """Запись для отчета о декларации, которую не удалось получить"""
+    error_class = outcome.get("error_class", "unexpected")
+    return {
+        "id": declaration_id,
+        "success": False,
+        "error": "Декларация не найдена" if error_class == "not_found" else "Не удалось получить данные",
+        "error_class": error_class,
+        "proxy": proxy_label
+    }
+
+# Функция для загрузки и сохранения одной декларации через выделенный прокси
+def fetch_and_save_declaration(declaration_id, batch_folder, proxy, max_retries=5, initial_delay=2.0, proxy_timeout=300, cache=None, cancel_event=None,
+                               save_mode="json"):
+    """Загружает декларацию через указанный прокси, сохраняет ее и возвращает запись для отчета.
+    
+    С кешем валидаторов ранее сохраненная декларация запрашивается условно и
+    при отсутствии изменений остается в прежнем файле. Если cancel_event
+    установлен к моменту ответа (дублирующий запрос уже победил), ответ
+    отбрасывается без сохранения. save_mode - режим сохранения из SAVE_MODES.
+    """
+    proxy_label = proxy.label
+    try:
+        url = f"{base_url}/{declaration_id}"
+        cached = cache.get(declaration_id) if cache else None
+        validators = cached or {}
+        outcome = {}
+        data = make_request_with_retry(
+            url, 
+            proxy=proxy, 
+            max_retries=max_retries, 
+            initial_delay=initial_delay,
+            proxy_timeout=proxy_timeout,
+            validators=validators,
+            outcome=outcome,
+            raw=save_mode != "json"
+        )
+        
+        if data is NOT_MODIFIED:
+            cache.confirm(declaration_id)
+            return get_not_modified_result(declaration_id, cached, validators, proxy_label)
+        
+        # Обрабатываем результат
+        if data is None:
+            return get_failed_result(declaration_id, outcome, proxy_label)
+        
+        if cancel_event is not None and cancel_event.is_set():
+            return get_failed_result(declaration_id, {"error_class": "cancelled"}, proxy_label)
+        
+        # Сохраняем полученные данные
+        filename = os.path.join(batch_folder, get_details_filename(declaration_id, save_mode))
+        if save_mode == "json":
+            save_to_json(data, filename)
+            doc_id = data.get("DocId", "Unknown")
+        else:
+            write_raw_details(data, filename, compress=save_mode == "gzip")
+            doc_id = scan_doc_id(data)
+        if cache:
+            cache.update(declaration_id, validators, filename)
+        
+        return {
+            "id": declaration_id,
+            "success": True,
+            "doc_id": doc_id,
+            "proxy": proxy_label,
+            "bytes": validators.get("size", 0)
+        }
+    except Exception as e:
+        # В случае непредвиденной ошибки
+        logger.error(f"Ошибка при обработке декларации {declaration_id}: {e}")
+        return {
+            "id": declaration_id,
+            "success": False,
+            "error": f"Ошибка: {str(e)}",
+            "error_class": "unexpected",
+            "proxy": proxy_label
+        }
+
+def finish_attempt(task, result, proxies, retry_queue, max_retries, on_result):
+    """Учитывает попытку через proxies: откладывает повтор через другой прокси или передает итог в on_result"""
+    task["attempts"] += 1
+    task["tried_proxies"].extend(proxies)
+    
+    if should_retry(result, task, max_retries):
+        delay = retry_queue.get_delay(task["attempts"], result.get("error_class"))
+        print_message(f"Декларация {task['id']}: попытка {task['attempts']}/{max_retries} неудачна "
+                      f"({result.get('error_class')}), повтор через {delay:.1f} сек через другой прокси", log_only=True)
+        retry_queue.defer(task, delay)
+        return
+    
+    result["attempts"] = task["attempts"]
+    if on_result:
+        on_result(result)
+
+# Функция для запуска потоков, загружающих декларации из очереди
+def run_details_workers(id_queue, batch_folder, workers, max_retries=5, initial_delay=2.0, proxy_timeout=300, on_result=None, cache=None,
+                        hedge_policy=None, save_mode="json", stop_event=None):
+    """Запускает пул потоков, которые берут ID из очереди, пока не получат None.
+    
+    Потоки работают непрерывно, без общих циклов и пауз: как только запрос
+    завершен, поток берет следующий ID и свободный прокси, который раньше
+    других готов к запросу. Темп каждого прокси задает его собственный
+    лимитер, поэтому медленный прокси не задерживает остальные.
+    
+    Каждая попытка выполняется один раз; неудачная откладывается в очередь
+    повторов с растущей задержкой и затем уходит через другой прокси, а поток
+    тем временем берет новые ID. Итоговая запись для отчета передается в
+    on_result. Возвращает список запущенных потоков.
+    
+    С hedge_policy запрос, который идет дольше порога, дублируется через
+    второй прокси (см. HedgePolicy); попытки тогда выполняются в отдельном
+    пуле, чтобы поток мог дождаться первого успешного ответа.
+    
+    Установленный stop_event останавливает потоки после текущего запроса
+    (см. stop_details_workers).
+    """
+    retry_queue = RetryQueue(base_delay=initial_delay)
+    attempt_pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers * 2) if hedge_policy else None
+    
+    def run_attempt(task, proxy, cancel_event=None, permitted=False):
+        # Прокси уже занят вызывающим, здесь он освобождается.
+        # permitted - разрешение лимитера уже получено вызывающим
+        try:
+            if not permitted:
+                proxy_limiters[proxy].wait_for_permission()
+            return fetch_and_save_declaration(
+                task["id"], batch_folder, proxy, 1, initial_delay, proxy_timeout, cache, cancel_event, save_mode
+            )
+        finally:
+            release_proxy(proxy)
+    
+    def run_hedged_attempt(task, proxy):
+        """Выполняет попытку и при превышении порога дублирует ее; возвращает результат и использованные прокси"""
+        hedge_policy.count_request()
+        # Порог дублирования отсчитывается от выдачи разрешения лимитера,
+        # иначе ожидание в лимитере принималось бы за медленный ответ
+        try:
+            proxy_limiters[proxy].wait_for_permission()
+        except BaseException:
+            release_proxy(proxy)
+            raise
+        cancel_events = {proxy: threading.Event()}
+        futures = {attempt_pool.submit(run_attempt, task, proxy, cancel_events[proxy], True): proxy}
+        
+        delay = hedge_policy.get_delay(get_recent_latencies)
+        if delay is not None:
+            done, _ = concurrent.futures.wait(futures, timeout=delay)
+            if not done:
+                hedge_proxy = acquire_proxy(exclude=task["tried_proxies"] + [proxy])
+                if hedge_proxy is not None and hedge_proxy != proxy and hedge_policy.try_hedge():
+                    print_message(f"Декларация {task['id']}: ответа нет дольше {delay:.2f} сек, дублируем через {hedge_proxy}", log_only=True)
+                    cancel_events[hedge_proxy] = threading.Event()
+                    futures[attempt_pool.submit(run_attempt, task, hedge_proxy, cancel_events[hedge_proxy])] = hedge_proxy
+                elif hedge_proxy is not None:
+                    release_proxy(hedge_proxy)
+        
+        # Побеждает первый успешный ответ; неудачный ждет второй попытки, если она еще идет
+        pending = set(futures)
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            finished = next((f for f in done if f.result()["success"]), next(iter(done)))
+            result, winner = finished.result(), futures[finished]
+            if result["success"]:
+                break
+        
+        # Проигравший запрос нельзя прервать в сети, но его ответ не будет сохранен
+        for other_proxy, event in cancel_events.items():
+            if other_proxy != winner:
+                event.set()
+        if winner != proxy:
+            hedge_policy.count_hedge_win()
+        return result, list(futures.values())
+    
+    def process(task):
+        proxy = acquire_proxy(exclude=task["tried_proxies"])
+        while proxy is None:
+            # Все прокси заняты - ждем, пока какой-нибудь освободится
+            time.sleep(0.1)
+            proxy = acquire_proxy(exclude=task["tried_proxies"])
+        
+        if hedge_policy:
+            result, used_proxies = run_hedged_attempt(task, proxy)
+        else:
+            result, used_proxies = run_attempt(task, proxy), [proxy]
+        
+        finish_attempt(task, result, used_proxies, retry_queue, max_retries, on_result)
+    
+    def worker():
+        fresh_ids_done = False
+        while stop_event is None or not stop_event.is_set():
+            # Сначала повторы, время которых наступило, затем новые ID
+            task = retry_queue.pop_ready()
+            if task is not None:
+                process(task)
+                continue
+            
+            if fresh_ids_done:
+                # Новых ID больше не будет - дожидаемся отложенных повторов
+                if not len(retry_queue):
+                    return
+                time.sleep(min(0.5, retry_queue.next_ready_in()))
+                continue
+            
+            try:
+                declaration_id = id_queue.get(timeout=min(0.5, retry_queue.next_ready_in()))
+            except queue.Empty:
+                continue
+            
+            try:
+                if declaration_id is None:
+                    fresh_ids_done = True
+                    continue
+                process(RetryQueue.new_task(declaration_id))
+            finally:
+                id_queue.task_done()
+    
+    threads = []
+    for _ in range(workers):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    return threads
+
+def stop_details_workers(threads, stop_event, timeout=WORKER_STOP_TIMEOUT):
+    """Останавливает потоки run_details_workers и ждет их текущих запросов, но не дольше timeout.
+    
+    Вызывается перед закрытием кеша валидаторов и хранилища неудач, в
+    которые потоки записывают итоги запросов.
+    """
+    stop_event.set()
+    deadline = time.monotonic() + timeout
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+
+# Асинхронный вариант запроса с повторными попытками для движка asyncio
+async def make_request_with_retry_async(session_pool, url, proxy, max_retries=5, initial_delay=2.0, proxy_timeout=300, validators=None, outcome=None, raw=False):
+    """Выполняет запрос через прокси в цикле событий; ответы разбирает тот же handle_response, что и у потоков"""
+    if outcome is None:
+        outcome = {}
+    headers = get_random_headers()
+    if validators:
+        headers.update(get_conditional_headers(validators))
+    session, request_proxy = session_pool.get_session(proxy.url)
+    proxy_used = proxy.label
+    
+    attempt = 0
+    while attempt < max_retries:
+        attempt += 1
+        try:
+            # Если это повторная попытка, добавляем задержку
+            if attempt > 1:
+                print_message(f"Повторная попытка {attempt}/{max_retries} через {initial_delay:.1f} сек...", log_only=True)
+                await asyncio.sleep(initial_delay)
+            
+            request_start = time.monotonic()
+            async with session.get(url, headers=headers, proxy=request_proxy,
+                                   timeout=aiohttp.ClientTimeout(total=10)) as response:
+                content = await response.read()
+            latency = time.monotonic() - request_start
+            
+            result = handle_response(response.status, response.reason, content, response.headers, latency,
+                                     proxy, proxy_timeout, validators, outcome, raw)
+            if result is not RETRY:
+                return result
+            if outcome["error_class"] == "rate_limit" and attempt < max_retries:
+                await asyncio.sleep(RATE_LIMIT_DELAY)  # Та же задержка после 429, что и в очереди повторов
+        
+        except asyncio.TimeoutError:
+            print_message("Таймаут запроса", is_error=True)
+            outcome["error_class"] = "timeout"
+            update_proxy_stats(proxy, success=False)
+        
+        except aiohttp.ClientError:
+            print_message(f"Ошибка соединения через {proxy_used}", is_error=True)
+            outcome["error_class"] = "connection"
+            update_proxy_stats(proxy, success=False)
+        
+        except Exception as e:
+            print_message(f"Непредвиденная ошибка через {proxy_used}: {e}", is_error=True)
+            outcome["error_class"] = "unexpected"
+            update_proxy_stats(proxy, success=False)
+    
+    print_message("Все попытки выполнить запрос были неудачными", is_error=True, log_only=True)
+    return None
+
+async def fetch_and_save_declaration_async(session_pool, declaration_id, batch_folder, proxy, max_retries=5, initial_delay=2.0, proxy_timeout=300, cache=None,
+                                           save_mode="json"):
+    """Асинхронный вариант fetch_and_save_declaration; запись файла выполняется в пуле потоков"""
+    proxy_label = proxy.label
+    try:
+        url = f"{base_url}/{declaration_id}"
+        cached = cache.get(declaration_id) if cache else None
+        validators = cached or {}
+        outcome = {}
+        data = await make_request_with_retry_async(session_pool, url, proxy, max_retries, initial_delay, proxy_timeout, validators, outcome,
+                                                   raw=save_mode != "json")
+        
+        if data is NOT_MODIFIED:
+            cache.confirm(declaration_id)
+            return get_not_modified_result(declaration_id, cached, validators, proxy_label)
+        
+        if data is None:
+            return get_failed_result(declaration_id, outcome, proxy_label)
+        
+        filename = os.path.join(batch_folder, get_details_filename(declaration_id, save_mode))
+        loop = asyncio.get_running_loop()
+        if save_mode == "json":
+            await loop.run_in_executor(None, save_to_json, data, filename)
+            doc_id = data.get("DocId", "Unknown")
+        else:
+            await loop.run_in_executor(None, write_raw_details, data, filename, save_mode == "gzip")
+            doc_id = scan_doc_id(data)
+        if cache:
+            cache.update(declaration_id, validators, filename)
+        
+        return {
+            "id": declaration_id,
+            "success": True,
+            "doc_id": doc_id,
+            "proxy": proxy_label,
+            "bytes": validators.get("size", 0)
+        }
+    except Exception as e:
+        logger.error(f"Ошибка при обработке декларации {declaration_id}: {e}")
+        return {
+            "id": declaration_id,
+            "success": False,
+            "error": f"Ошибка: {str(e)}",
+            "error_class": "unexpected",
+            "proxy": proxy_label
+        }
+
+async def download_details_async(declaration_ids, batch_folder, concurrency, proxy_slots=1, max_retries=5,
+                                 initial_delay=2.0, proxy_timeout=300, on_result=None, cache=None, hedge_policy=None,
+                                 save_mode="json"):
+    """Загружает декларации движком asyncio.
+    
+    concurrency корутин берут ID из общей очереди; через каждый прокси
+    одновременно выполняется не больше proxy_slots запросов, темп задает
+    лимитер прокси. Неудачные попытки, как и у потоков, откладываются в
+    очередь повторов. Статистика ведется в тех же proxy_stats. С hedge_policy
+    медленные запросы дублируются, а проигравший запрос отменяется.
+    """
+    session_pool = AsyncSessionPool(limit_per_session=proxy_slots)
+    proxy_scheduler.set_max_in_flight(proxy_slots)
+    retry_queue = RetryQueue(base_delay=initial_delay)
+    id_queue = asyncio.Queue()
+    for declaration_id in declaration_ids:
+        id_queue.put_nowait(declaration_id)
+    
+    async def run_attempt(task, proxy, permitted=False):
+        # Прокси уже занят вызывающим, здесь он освобождается (в том числе при отмене).
+        # permitted - разрешение лимитера уже получено вызывающим
+        try:
+            if not permitted:
+                await proxy_limiters[proxy].wait_for_permission_async()
+            return await fetch_and_save_declaration_async(
+                session_pool, task["id"], batch_folder, proxy, 1, initial_delay, proxy_timeout, cache, save_mode
+            )
+        finally:
+            release_proxy(proxy)
+    
+    async def run_hedged_attempt(task, proxy):
+        """Выполняет попытку и при превышении порога дублирует ее; проигравший запрос отменяется"""
+        hedge_policy.count_request()
+        # Порог дублирования отсчитывается от выдачи разрешения лимитера
+        try:
+            await proxy_limiters[proxy].wait_for_permission_async()
+        except BaseException:
+            release_proxy(proxy)
+            raise
+        attempts = {asyncio.ensure_future(run_attempt(task, proxy, True)): proxy}
+        
+        delay = hedge_policy.get_delay(get_recent_latencies)
+        if delay is not None:
+            done, _ = await asyncio.wait(attempts, timeout=delay)
+            if not done:
+                hedge_proxy = acquire_proxy(exclude=task["tried_proxies"] + [proxy])
+                if hedge_proxy is not None and hedge_proxy != proxy and hedge_policy.try_hedge():
+                    print_message(f"Декларация {task['id']}: ответа нет дольше {delay:.2f} сек, дублируем через {hedge_proxy}", log_only=True)
+                    attempts[asyncio.ensure_future(run_attempt(task, hedge_proxy))] = hedge_proxy
+                elif hedge_proxy is not None:
+                    release_proxy(hedge_proxy)
+        
+        # Побеждает первый успешный ответ; неудачный ждет второй попытки, если она еще идет
+        pending = set(attempts)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            finished = next((t for t in done if t.result()["success"]), next(iter(done)))
+            result, winner = finished.result(), attempts[finished]
+            if result["success"]:
+                break
+        
+        for attempt in pending:
+            attempt.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if winner != proxy:
+            hedge_policy.count_hedge_win()
+        return result, list(attempts.values())
+    
+    async def process(task):
+        proxy = acquire_proxy(exclude=task["tried_proxies"])
+        while proxy is None:
+            # Все слоты заняты - ждем, пока какой-нибудь освободится
+            await asyncio.sleep(0.05)
+            proxy = acquire_proxy(exclude=task["tried_proxies"])
+        
+        if hedge_policy:
+            result, used_proxies = await run_hedged_attempt(task, proxy)
+        else:
+            result, used_proxies = await run_attempt(task, proxy), [proxy]
+        
+        finish_attempt(task, result, used_proxies, retry_queue, max_retries, on_result)
+    
+    async def worker():
+        while True:
+            # Сначала повторы, время которых наступило, затем новые ID
+            task = retry_queue.pop_ready()
+            if task is None:
+                try:
+                    task = RetryQueue.new_task(id_queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    # Новых ID больше нет - дожидаемся отложенных повторов
+                    if not len(retry_queue):
+                        return
+                    await asyncio.sleep(min(0.5, retry_queue.next_ready_in()))
+                    continue
+            await process(task)
+    
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        await session_pool.close()
+
+# Функция для поиска уже загруженных деклараций в последнем батче
+def find_completed_ids():
+    """Собирает ID уже загруженных деклараций из всех каталогов батчей.
+    
+    Каждое продолжение пишет в новый батч, поэтому просматриваются все
+    каталоги, а не только последний.
+    """
+    completed_ids = set()
+    for dirname in sorted(os.listdir(output_dir)):
+        batch_dir = os.path.join(output_dir, dirname)
+        if os.path.isdir(batch_dir) and dirname.startswith("batch_"):
+            for filename in os.listdir(batch_dir):
+                if is_details_file(filename):
+                    try:
+                        completed_ids.add(get_details_id(filename))
+                    except ValueError:
+                        pass
+    if completed_ids:
+        print_message(f"Найдено {len(completed_ids)} уже загруженных деклараций в {output_dir}", log_only=True)
+    return completed_ids
+
 # Функция для загрузки списка деклараций из файла
 def load_declarations_from_json(file_path):
     try:
@@ -594,15 +1226,27 @@ def load_declarations_from_json(file_path):
         print_message(f"Ошибка при загрузке файла {file_path}: {e}", True)
         return []
 
-# Функция для сканирования директории и поиска всех JSON файлов
+# Функция для потокового чтения ID деклараций из NDJSON файла (одна запись на строку)
+def iter_declarations_from_ndjson(file_path):
+    try:
+        for item in iter_ndjson_items(file_path):
+            if "certdecltr_id" in item:
+                yield item["certdecltr_id"]
+    except Exception as e:
+        print_message(f"Ошибка при чтении файла {file_path}: {e}", True)
+
+# Функция для сканирования директории и поиска всех JSON и NDJSON файлов
 def scan_directory_for_json(directory):
     all_ids = set()
     
     for filename in os.listdir(directory):
+        file_path = os.path.join(directory, filename)
         if filename.endswith(".json"):
-            file_path = os.path.join(directory, filename)
             ids = load_declarations_from_json(file_path)
             all_ids.update(ids)
+        elif is_ndjson_file(filename):
+            # NDJSON читается последовательно, без загрузки файла в память целиком
+            all_ids.update(iter_declarations_from_ndjson(file_path))
     
     return list(all_ids)
 
@@ -620,15 +1264,24 @@ def format_time(seconds):
 
 # Главная функция для загрузки деталей всех деклараций
 def download_all_declaration_details(declaration_ids, workers=50, resume=False, batch_size=500, 
-                                    initial_delay=2.0, max_retries=5, proxy_timeout=300):
+                                    initial_delay=2.0, max_retries=5, proxy_timeout=300, engine="threads", proxy_slots=1,
+                                    revalidate=True, cache=None, hedge_quantile=None, hedge_budget=0.05, save_mode="json"):
     # Проверяем наличие прокси
     if not proxy_list:
         print_message("Для режима '1 прокси - 1 декларация' требуются прокси-серверы. Завершаем работу.", is_error=True, important=True)
         return 0
     
+    if engine == "async" and aiohttp is None:
+        print("[ОШИБКА] Для движка asyncio требуется пакет aiohttp: pip install aiohttp")
+        return 0
+    
     # Определяем оптимальное количество рабочих потоков на основе доступных прокси
-    # В режиме "1 прокси - 1 декларация" количество одновременных запросов = количеству прокси, но не более заданного максимума
-    max_concurrent = min(len(proxy_list), workers)
+    # В режиме "1 прокси - 1 декларация" количество одновременных запросов = количеству прокси, но не более заданного максимума.
+    # Движок asyncio держит до proxy_slots запросов на каждый прокси
+    if engine == "async":
+        max_concurrent = min(len(proxy_list) * proxy_slots, workers)
+    else:
+        max_concurrent = min(len(proxy_list), workers)
     print_message(f"Одновременно будет обрабатываться до {max_concurrent} деклараций", important=True)
     
     # Создаем директорию для текущего батча
@@ -649,28 +1302,12 @@ def download_all_declaration_details(declaration_ids, workers=50, resume=False,
     print_message(f"Доступно прокси: {len(proxy_list)}", log_only=True)
     print_message(f"Одновременно обрабатывается: {max_concurrent} деклараций", log_only=True)
     print_message(f"Таймаут запросов: 10 секунд", log_only=True)
-    print_message(f"Пауза между циклами: 5 секунд", log_only=True)
+    print_message(f"Темп запросов через каждый прокси: {proxy_limiters[proxy_list[0]].get_rate():.2f} запр/с", log_only=True)
     print_message(f"Максимум повторов: {max_retries}", log_only=True)
+    print_message(f"Режим сохранения деталей: {save_mode}", log_only=True)
     
     # Проверяем, есть ли уже загруженные файлы, если режим продолжения
-    completed_ids = set()
-    if resume:
-        # Проверяем существующие каталоги с батчами
-        for dirname in sorted(os.listdir(output_dir), reverse=True):
-            batch_dir = os.path.join(output_dir, dirname)
-            if os.path.isdir(batch_dir) and dirname.startswith("batch_"):
-                # Проверяем файлы JSON в этом каталоге
-                for filename in os.listdir(batch_dir):
-                    if filename.endswith(".json") and not filename == "download_report.json":
-                        try:
-                            id_str = filename.split(".")[0]
-                            completed_ids.add(int(id_str))
-                        except (ValueError, IndexError):
-                            pass
-                # Берем только из самого последнего батча, чтобы быстрее обработать
-                if completed_ids:
-                    print_message(f"Найдено {len(completed_ids)} уже загруженных деклараций в {batch_dir}", log_only=True)
-                    break
+    completed_ids = find_completed_ids() if resume else set()
     
     # Удаляем уже загруженные ID из списка
     if completed_ids:
@@ -691,11 +1328,6 @@ def download_all_declaration_details(declaration_ids, workers=50, resume=False,
     # Создаем блокировку для обновления статистики
     stats_lock = threading.Lock()
     
-    # Создаем очередь задач для всех деклараций
-    task_queue = queue.Queue()
-    for declaration_id in declaration_ids:
-        task_queue.put(declaration_id)
-    
     # Создаем список для хранения результатов
     results = []
     
@@ -715,129 +1347,80 @@ def download_all_declaration_details(declaration_ids, workers=50, resume=False,
                 speed = all_completed_count / elapsed * 60  # декларации в минуту
                 
                 # Отображаем количество активных прокси
-                active_proxies = sum(1 for p in proxy_stats.values() if p.get("active", False))
+                active_proxies = proxy_scheduler.active_count
                 proxy_info = f"{active_proxies}/{len(proxy_list)} активных"
                 
                 # Обновляем строку статуса
                 update_status_line(all_completed_count, total_count, all_success_count, all_error_count, 
                                   rate=speed, proxy_info=proxy_info)
     
+    # Неудачи сразу записываются в постоянное хранилище, успехи снимают прежние неудачи
+    dead_letters = DeadLetterStore(output_dir)
+    
+    def on_result(result):
+        with stats_lock:
+            results.append(result)
+        dead_letters.record_result(result)
+        update_stats(success=result["success"])
+    
+    # Кеш валидаторов: ранее загруженные декларации запрашиваются условно.
+    # Переданный снаружи кеш (например, после планирования обновления) закрывает вызывающий
+    own_cache = cache is None and revalidate
+    if own_cache:
+        cache = ValidatorCache(output_dir)
+    if cache and cache.entries:
+        print_message(f"Известны валидаторы {len(cache.entries)} деклараций, будут выполняться условные запросы", log_only=True)
+    
+    # Дублирование медленных запросов через второй прокси
+    hedge_policy = HedgePolicy(quantile=hedge_quantile, budget=hedge_budget) if hedge_quantile else None
+    if hedge_policy:
+        print_message(f"Медленные запросы (дольше p{hedge_quantile * 100:g}) дублируются, бюджет: {hedge_budget * 100:g}% запросов", important=True)
+    
     # Основной цикл загрузки
     start_time = time.time()
+    threads = []
+    stop_event = threading.Event()
     try:
-        # Обрабатываем задачи пакетами, пока очередь не пуста
-        while not task_queue.empty():
-            batch_task_count = min(max_concurrent, task_queue.qsize())
-            batch_tasks = []
-            
-            # Получаем следующий пакет задач
-            for _ in range(batch_task_count):
-                try:
-                    declaration_id = task_queue.get(block=False)
-                    batch_tasks.append(declaration_id)
-                except queue.Empty:
-                    break
-            
-            if not batch_tasks:
-                break  # Если нет задач, завершаем цикл
-            
-            # Получаем уникальные прокси для каждой задачи
-            batch_proxies = []
-            with proxy_lock:
-                # Подсчитываем количество активных прокси
-                active_proxies = [p for p in proxy_list if proxy_stats[p]["active"]]
-                if len(active_proxies) < len(batch_tasks):
-                    print_message(f"Внимание: не хватает активных прокси ({len(active_proxies)}) для обработки пакета ({len(batch_tasks)})", log_only=True)
-                    # Активируем все прокси, если их не хватает
-                    for proxy in proxy_list:
-                        proxy_stats[proxy]["active"] = True
-                    active_proxies = proxy_list
-                
-                # Сортируем прокси по времени последнего использования
-                sorted_proxies = sorted(active_proxies, key=lambda p: proxy_stats[p]["last_used"])
-                
-                # Выбираем необходимое количество прокси
-                batch_proxies = sorted_proxies[:len(batch_tasks)]
-                
-                # Обновляем время использования для выбранных прокси
-                current_time = time.time()
-                for proxy in batch_proxies:
-                    proxy_stats[proxy]["last_used"] = current_time
-            
-            # Создаем результаты для каждой задачи
-            batch_results = [None] * len(batch_tasks)
-            
-            # Создаем и запускаем потоки для одновременной обработки задач
-            threads = []
-            
-            def process_task(index, declaration_id, proxy):
-                try:
-                    # Загружаем декларацию используя выделенный прокси
-                    url = f"{base_url}/{declaration_id}"
-                    data = make_request_with_retry(
-                        url, 
-                        proxy=proxy, 
-                        max_retries=max_retries, 
-                        initial_delay=initial_delay,
-                        proxy_timeout=proxy_timeout
-                    )
-                    
-                    # Обрабатываем результат
-                    if data is None:
-                        result = {
-                            "id": declaration_id,
-                            "success": False,
-                            "error": "Не удалось получить данные после нескольких попыток",
-                            "proxy": proxy.split('@')[-1] if '@' in proxy else proxy
-                        }
-                        with stats_lock:
-                            results.append(result)
-                        update_stats(success=False)
-                    else:
-                        # Сохраняем полученные данные
-                        filename = os.path.join(batch_folder, f"{declaration_id}.json")
-                        save_to_json(data, filename)
-                        
-                        result = {
-                            "id": declaration_id,
-                            "success": True,
-                            "doc_id": data.get("DocId", "Unknown"),
-                            "proxy": proxy.split('@')[-1] if '@' in proxy else proxy
-                        }
-                        with stats_lock:
-                            results.append(result)
-                        update_stats(success=True)
-                except Exception as e:
-                    # В случае непредвиденной ошибки
-                    logger.error(f"Ошибка при обработке декларации {declaration_id}: {e}")
-                    with stats_lock:
-                        results.append({
-                            "id": declaration_id,
-                            "success": False,
-                            "error": f"Ошибка: {str(e)}",
-                            "proxy": proxy.split('@')[-1] if '@' in proxy else proxy
-                        })
-                    update_stats(success=False)
+        if engine == "async":
+            asyncio.run(download_details_async(
+                declaration_ids,
+                batch_folder,
+                max_concurrent,
+                proxy_slots=proxy_slots,
+                max_retries=max_retries,
+                initial_delay=initial_delay,
+                proxy_timeout=proxy_timeout,
+                on_result=on_result,
+                cache=cache,
+                hedge_policy=hedge_policy,
+                save_mode=save_mode
+            ))
+        else:
+            # Пул потоков работает непрерывно, пока не получит сигнал завершения
+            task_queue = queue.Queue()
+            for declaration_id in declaration_ids:
+                task_queue.put(declaration_id)
             
-            # Запускаем потоки для каждой пары задача-прокси
-            for i, (declaration_id, proxy) in enumerate(zip(batch_tasks, batch_proxies)):
-                thread = threading.Thread(target=process_task, args=(i, declaration_id, proxy))
-                thread.daemon = True
-                thread.start()
-                threads.append(thread)
+            threads = run_details_workers(
+                task_queue,
+                batch_folder,
+                max_concurrent,
+                max_retries=max_retries,
+                initial_delay=initial_delay,
+                proxy_timeout=proxy_timeout,
+                on_result=on_result,
+                cache=cache,
+                hedge_policy=hedge_policy,
+                save_mode=save_mode,
+                stop_event=stop_event
+            )
+            for _ in threads:
+                task_queue.put(None)
             
-            # Ожидаем завершения всех потоков в пакете
+            # join с таймаутом, чтобы Ctrl+C обрабатывался в главном потоке
             for thread in threads:
-                thread.join()
-            
-            # Помечаем все задачи как выполненные
-            for _ in batch_tasks:
-                task_queue.task_done()
-            
-            # Делаем паузу между циклами запросов (5 секунд)
-            if not task_queue.empty():
-                print_message(f"Пауза 5 секунд между циклами запросов...", log_only=True)
-                time.sleep(5)
+                while thread.is_alive():
+                    thread.join(0.5)
         
         # Сохраняем отчет о загрузке
         report_file = os.path.join(batch_folder, "download_report.json")
@@ -847,15 +1430,25 @@ def download_all_declaration_details(declaration_ids, workers=50, resume=False,
             "completed": all_completed_count,
             "success": all_success_count,
             "errors": all_error_count,
+            "not_modified": sum(1 for r in results if r.get("not_modified")),
+            "bytes_received": sum(r.get("bytes", 0) for r in results),
             "time_elapsed": time.time() - start_time,
             "results": results
         }
+        if hedge_policy:
+            report_data["hedging"] = hedge_policy.get_stats()
         save_to_json(report_data, report_file)
     
     except KeyboardInterrupt:
         print_message("\nПрервано пользователем. Останавливаем процесс...", is_error=True, important=True)
     except Exception as e:
         print_message(f"\nНепредвиденная ошибка в основном процессе: {e}", is_error=True, important=True)
+    finally:
+        # Потоки могут еще выполнять запросы (после Ctrl+C) - сначала дожидаемся их, затем закрываем хранилища
+        stop_details_workers(threads, stop_event)
+        if own_cache:
+            cache.close()
+        dead_letters.close()
     
     # Выводим общие итоги
     total_elapsed = time.time() - start_time
@@ -868,6 +1461,15 @@ def download_all_declaration_details(declaration_ids, workers=50, resume=False,
     print_message(f"Всего обработано: {all_completed_count}/{total_count} ({all_completed_count/total_count*100:.1f}%)", important=True)
     print_message(f"Успешно загружено: {all_success_count} ({all_success_count/total_count*100:.1f}%)", important=True)
     print_message(f"Ошибок: {all_error_count} ({all_error_count/total_count*100:.1f}%)", important=True)
+    if all_error_count:
+        print(f"Неудачные загрузки записаны в {dead_letters.path}, повторить их: --retry-failed")
+    if cache:
+        not_modified_count = sum(1 for r in results if r.get("not_modified"))
+        print_message(f"Не изменились с прошлой загрузки: {not_modified_count}", important=True)
+    print_message(f"Получено данных: {sum(r.get('bytes', 0) for r in results) / (1024 * 1024):.1f} МБ", important=True)
+    if hedge_policy:
+        hedge_stats = hedge_policy.get_stats()
+        print(f"Дублированных запросов: {hedge_stats['hedges']} из {hedge_stats['requests']}, дубль ответил первым: {hedge_stats['hedge_wins']}")
     
     if total_elapsed > 0:
         overall_speed = all_completed_count / total_elapsed * 60
@@ -879,8 +1481,9 @@ def download_all_declaration_details(declaration_ids, workers=50, resume=False,
         active_proxies = sum(1 for p in proxy_stats.values() if p.get("active", False))
         print_message(f"Активных прокси: {active_proxies}/{len(proxy_list)}", log_only=True)
         
-        # Сохраняем работающие прокси
+        # Сохраняем работающие прокси и их историю для следующего запуска
         save_working_proxies()
+        save_proxy_reputation()
     
     print_message("=" * 80, important=True)
     
@@ -899,11 +1502,12 @@ def save_working_proxies(output_file="working_proxies.txt"):
             f.write("# Автоматически сгенерировано на основе статистики использования\n")
             f.write(f"# Дата: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
             
-            # Сортируем прокси по успешности запросов
+            # Сортируем прокси по оценке здоровья и успешности запросов
             sorted_proxies = sorted(
                 [p for p in proxy_list if p in proxy_stats],
                 key=lambda p: (
                     proxy_stats[p]["active"],  # Активные прокси в приоритете
+                    get_health_score(proxy_stats[p]),  # Затем по оценке здоровья
                     proxy_stats[p]["success"],  # Затем по успешности
                     -proxy_stats[p]["errors"]   # Затем по минимальному количеству ошибок
                 ),
@@ -925,47 +1529,35 @@ def save_working_proxies(output_file="working_proxies.txt"):
         print_message(f"Ошибка при сохранении рабочих прокси: {e}", True)
         return False
 
-def test_proxies(proxies_file, timeout=10):
-    """Тестирует прокси-серверы из файла и сохраняет рабочие в новый файл"""
+def test_proxies(proxies_file, timeout=10, workers=DEFAULT_CHECK_WORKERS):
+    """Тестирует прокси-серверы из файла и сохраняет рабочие в новый файл.
+    
+    Прокси проверяются параллельно (не более workers одновременно). Время
+    до первого байта учитывается в статистике прокси, а рядом с файлом
+    рабочих прокси сохраняется JSON-отчет с замерами по каждому прокси.
+    """
     # Загружаем список прокси из файла
     load_proxies(proxies_file)
     if not proxy_list:
         print_message("Не удалось загрузить прокси из файла", True)
         return
     
-    print_message(f"Тестирование {len(proxy_list)} прокси-серверов...")
+    print_message(f"Тестирование {len(proxy_list)} прокси-серверов (одновременно: {workers})...")
     
     # Тестовый URL для проверки прокси
     test_url = "https://api.belgiss.by/"
     
     # Создаем прогресс-бар
     with tqdm(total=len(proxy_list), desc="Тестирование прокси") as progress_bar:
-        # Тестируем каждый прокси
-        for proxy in proxy_list:
-            proxies = {"http": proxy, "https": proxy}
-            success = False
-            
-            try:
-                # Пытаемся выполнить запрос через прокси
-                response = requests.get(
-                    test_url,
-                    proxies=proxies,
-                    timeout=timeout,
-                    verify=False,
-                    headers=get_random_headers()
-                )
-                
-                if response.status_code == 200:
-                    success = True
-                    update_proxy_stats(proxy, success=True)
-                else:
-                    update_proxy_stats(proxy, success=False)
-            except Exception:
-                update_proxy_stats(proxy, success=False)
+        def on_result(result):
+            proxy = result["proxy"]
+            update_proxy_stats(proxy, success=result["success"], latency=result["ttfb"] if result["success"] else None)
             
             # Обновляем прогресс-бар
             progress_bar.update(1)
-            progress_bar.set_postfix_str(f"Текущий: {proxy.split('@')[-1] if '@' in proxy else proxy}, Результат: {'OK' if success else 'FAIL'}")
+            progress_bar.set_postfix_str(f"Последний: {result['label']}, Результат: {'OK' if result['success'] else 'FAIL'}")
+        
+        results = check_proxies(proxy_list, test_url, timeout, workers, headers=get_random_headers(), on_result=on_result)
     
     # Выводим результаты тестирования
     stats = get_proxy_stats()
@@ -977,6 +1569,9 @@ def test_proxies(proxies_file, timeout=10):
     # Сохраняем рабочие прокси в новый файл
     working_proxies_file = "working_" + os.path.basename(proxies_file)
     save_working_proxies(working_proxies_file)
+    report_file = get_report_filename(working_proxies_file)
+    save_check_report(results, report_file, test_url)
+    print_message(f"Отчет о проверке прокси сохранен в файл {report_file}")
     
     return working_proxies_file
 
@@ -1025,11 +1620,23 @@ def convert_proxy_file_to_utf8(input_file, output_file=None):
 if __name__ == "__main__":
     # Парсинг аргументов командной строки
     parser = argparse.ArgumentParser(description='Скачивание детальной информации о декларациях с API')
-    parser.add_argument('--source-dir', type=str, default="declarations_data", help='Директория с JSON-файлами списков деклараций (по умолчанию: declarations_data)')
+    parser.add_argument('--source-dir', type=str, default="declarations_data", help='Директория с JSON/NDJSON-файлами списков деклараций (по умолчанию: declarations_data)')
     parser.add_argument('--workers', type=int, default=50, help='Максимальное количество одновременных запросов (по умолчанию: 50)')
+    parser.add_argument('--engine', choices=['threads', 'async'], default='threads', help='Движок загрузки: threads (пул потоков) или async (asyncio) (по умолчанию: threads)')
+    parser.add_argument('--refresh', action='store_true', help='Сверить легкий список из --source-dir с сохраненными деталями и загрузить только новые и изменившиеся декларации')
+    parser.add_argument('--no-revalidate', action='store_true', help='Не использовать условные запросы: всегда загружать и сохранять декларации полностью')
+    parser.add_argument('--save-mode', choices=SAVE_MODES, default='json', help='Сохранение деталей: json (разобрать и записать с отступами), raw (записать ответ как есть), gzip (как raw, сжатым в .json.gz) (по умолчанию: json)')
+    parser.add_argument('--hedge', action='store_true', help='Дублировать через второй прокси запросы, которые идут дольше квантиля времени ответа пула')
+    parser.add_argument('--hedge-quantile', type=float, default=0.95, help='Квантиль времени ответа, после которого запрос дублируется (по умолчанию: 0.95)')
+    parser.add_argument('--hedge-budget', type=float, default=0.05, help='Максимальная доля дополнительных запросов при дублировании (по умолчанию: 0.05)')
+    parser.add_argument('--proxy-slots', type=int, default=1, help='Количество одновременных запросов через один прокси для движка async (по умолчанию: 1)')
+    parser.add_argument('--retry-failed', action='store_true', help='Повторить загрузку только деклараций из хранилища неудачных загрузок (failed.ndjson)')
+    parser.add_argument('--retry-workers', type=int, default=10, help='Количество одновременных запросов в режиме --retry-failed (по умолчанию: 10)')
+    parser.add_argument('--retry-max-retries', type=int, default=5, help='Максимальное количество попыток в режиме --retry-failed (по умолчанию: 5)')
     parser.add_argument('--ids', type=str, help='Список ID деклараций через запятую (если указан, директория не сканируется)')
     parser.add_argument('--limit', type=int, help='Ограничение количества деклараций для загрузки (для тестирования)')
     parser.add_argument('--resume', action='store_true', help='Продолжить загрузку с места остановки, пропуская уже загруженные декларации')
+    parser.add_argument('--priority', type=str, default="", help='Порядок загрузки по ключам через запятую: newest (сначала новые), active (сначала действующие), missing (сначала отсутствующие в последнем отчете), например missing,active,newest')
     parser.add_argument('--shuffle', action='store_true', help='Перемешать список ID для более равномерной загрузки')
     parser.add_argument('--batch-size', type=int, default=200, help='Размер пакета для сохранения промежуточных результатов (по умолчанию: 200)')
     parser.add_argument('--proxies', type=str, help='Путь к файлу со списком прокси-серверов (один прокси на строку)')
@@ -1039,12 +1646,22 @@ if __name__ == "__main__":
     parser.add_argument('--disable-proxies', action='store_true', help='Отключить использование прокси даже если они загружены')
     parser.add_argument('--test-proxies', action='store_true', help='Протестировать прокси-серверы перед загрузкой данных')
     parser.add_argument('--test-timeout', type=int, default=10, help='Таймаут при тестировании прокси в секундах (по умолчанию: 10)')
+    parser.add_argument('--test-workers', type=int, default=DEFAULT_CHECK_WORKERS, help=f'Количество прокси, тестируемых одновременно (по умолчанию: {DEFAULT_CHECK_WORKERS})')
+    parser.add_argument('--proxy-reputation', type=str, default=REPUTATION_FILENAME, help=f'Файл истории прокси: выученная скорость, доля успехов и время ответа сохраняются между запусками (по умолчанию: {REPUTATION_FILENAME})')
+    parser.add_argument('--no-proxy-reputation', action='store_true', help='Не загружать и не сохранять историю прокси')
     parser.add_argument('--save-working-proxies', action='store_true', help='Сохранить рабочие прокси в файл после завершения')
     parser.add_argument('--convert-proxy-file', action='store_true', help='Конвертировать файл с прокси-серверами в UTF-8 перед использованием')
     args = parser.parse_args()
     
+    unknown_keys = [k.strip() for k in args.priority.split(",") if k.strip() and k.strip() not in PRIORITY_KEYS]
+    if unknown_keys:
+        parser.error(f"неизвестный ключ приоритета: {', '.join(unknown_keys)} (доступны: {', '.join(PRIORITY_KEYS)})")
+    if args.hedge and not 0 < args.hedge_quantile < 1:
+        parser.error("--hedge-quantile должен быть в интервале (0, 1)")
+    
     try:
         # Загружаем прокси-серверы, если указаны и не отключены явно
+        proxy_reputation_file = None if args.no_proxy_reputation else args.proxy_reputation
         if args.proxies and not args.disable_proxies:
             # Если указана опция конвертации, пересохраняем файл в UTF-8
             if args.convert_proxy_file:
@@ -1057,18 +1674,38 @@ if __name__ == "__main__":
             # Тестируем прокси, если запрошено
             if args.test_proxies:
                 print_message("Тестирование прокси-серверов перед началом загрузки...")
-                working_proxies_file = test_proxies(args.proxies, args.test_timeout)
+                working_proxies_file = test_proxies(args.proxies, args.test_timeout, args.test_workers)
                 if working_proxies_file:
                     print_message(f"Загружаем рабочие прокси из файла {working_proxies_file}")
                     load_proxies(working_proxies_file)
             
         # Определяем список ID деклараций для загрузки
         declaration_ids = []
+        refresh_cache = None
         
-        if args.ids:
+        if args.retry_failed:
+            # Повторяем только неудачные загрузки, не сканируя весь список
+            dead_letters = DeadLetterStore(output_dir)
+            declaration_ids = dead_letters.get_failed_ids()
+            error_counts = dead_letters.get_error_counts()
+            dead_letters.close()
+            print(f"Неудачных загрузок в хранилище: {sum(error_counts.values())} "
+                  f"({', '.join(f'{k}: {v}' for k, v in sorted(error_counts.items())) or 'нет'}), "
+                  f"к повтору: {len(declaration_ids)}")
+            args.workers = args.retry_workers
+            args.max_retries = args.retry_max_retries
+        elif args.ids:
             # Если ID указаны через командную строку
             declaration_ids = [int(id_str.strip()) for id_str in args.ids.split(',') if id_str.strip().isdigit()]
             print_message(f"Загружаем {len(declaration_ids)} деклараций по указанным ID")
+        elif args.refresh:
+            # Сверяем легкий список с сохраненными деталями и загружаем только новые и изменившиеся
+            print(f"Сверка легкого списка из {args.source_dir} с сохраненными деталями...")
+            refresh_cache = ValidatorCache(output_dir)
+            declaration_ids, refresh_stats = plan_refresh(args.source_dir, output_dir, refresh_cache)
+            print(f"Строк в списке: {refresh_stats['rows']}, новых: {refresh_stats['new']}, "
+                  f"изменившихся: {refresh_stats['changed']}, статус обновлен на месте: {refresh_stats['status_updated']}, "
+                  f"без изменений: {refresh_stats['unchanged']}")
         else:
             # Сканируем директорию с файлами деклараций
             print_message(f"Сканирование директории {args.source_dir} для поиска ID деклараций...")
@@ -1080,12 +1717,21 @@ if __name__ == "__main__":
             random.shuffle(declaration_ids)
             print_message("Список ID перемешан для более равномерной загрузки")
         
+        # Упорядочиваем ID по приоритету (до ограничения, чтобы оно отсекало наименее важные)
+        if args.priority:
+            declaration_ids = order_declaration_ids(declaration_ids, args.priority, args.source_dir, output_dir)
+            print(f"Декларации упорядочены по приоритету: {args.priority}")
+        
         # Применяем ограничение, если оно задано
         if args.limit and args.limit > 0 and args.limit < len(declaration_ids):
             declaration_ids = declaration_ids[:args.limit]
             print_message(f"Ограничение: будет загружено только {args.limit} деклараций")
         
-        if not declaration_ids:
+        if not declaration_ids and args.retry_failed:
+            print("Неудачных загрузок для повтора нет.")
+        elif not declaration_ids and refresh_cache:
+            print("Все сохраненные детали соответствуют легкому списку, загружать нечего.")
+        elif not declaration_ids:
             print_message("Не найдено ID деклараций для загрузки! Проверьте директорию с файлами или укажите ID через параметр --ids.", True)
         else:
             download_all_declaration_details(
@@ -1095,13 +1741,23 @@ if __name__ == "__main__":
                 batch_size=args.batch_size,
                 initial_delay=args.delay,
                 max_retries=args.max_retries,
-                proxy_timeout=args.proxy_timeout
+                proxy_timeout=args.proxy_timeout,
+                engine=args.engine,
+                proxy_slots=args.proxy_slots,
+                revalidate=not args.no_revalidate,
+                cache=refresh_cache,
+                hedge_quantile=args.hedge_quantile if args.hedge else None,
+                hedge_budget=args.hedge_budget,
+                save_mode=args.save_mode
             )
             
             # Сохраняем рабочие прокси в файл, если указан соответствующий параметр
             if args.save_working_proxies and proxy_list:
                 working_proxies_file = f"working_proxies_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
                 save_working_proxies(working_proxies_file)
+        
+        if refresh_cache:
+            refresh_cache.close()
             
     except KeyboardInterrupt:
         # Даже при прерывании сохраняем рабочие прокси, если включена опция
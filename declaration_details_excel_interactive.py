@@ -17,7 +17,6 @@ import pandas as pd
 from openpyxl import load_workbook
 from openpyxl.utils import get_column_letter
 from openpyxl.styles import Alignment
-import requests
 import urllib3
 import concurrent.futures
 import threading
@@ -25,6 +24,9 @@ import time
 from tqdm import tqdm
 import queue
 import math
+from http_transport import http_get
+from ndjson_sink import is_ndjson_file, iter_ndjson_items
+from proxy_model import parse_proxies
 
 # Инициализация colorama для поддержки цветов в Windows
 init(autoreset=True)
@@ -123,13 +125,11 @@ def load_proxies(proxy_file=None):
         for encoding in encodings:
             try:
                 with open(proxy_file, 'r', encoding=encoding) as f:
-                    loaded_proxies = []
-                    for line in f:
-                        line = line.strip()
-                        if line and not line.startswith('#'):
-                            loaded_proxies.append(line)
-                    
+                    loaded_proxies, invalid = parse_proxies(f)
+
                     proxy_list = loaded_proxies
+                    if invalid:
+                        log_warning(f"Пропущено {len(invalid)} строк неподдерживаемого формата, например: {invalid[0]}")
                     
                     for proxy in proxy_list:
                         proxy_stats[proxy] = {
@@ -207,19 +207,13 @@ def make_request_with_retry(url, proxy=None, max_retries=5, initial_delay=2.0, p
     
     for attempt in range(max_retries):
         try:
-            if proxy:
-                proxies = {
-                    'http': f'http://{proxy}',
-                    'https': f'http://{proxy}'
-                }
-            else:
-                proxies = None
+            # Словарь proxies готов с момента загрузки списка (proxy_model.Proxy)
+            proxies = proxy.proxies if proxy else None
             
-            response = requests.get(
+            response = http_get(
                 url,
                 headers=headers,
                 proxies=proxies,
-                verify=False,
                 timeout=proxy_timeout
             )
             
@@ -273,8 +267,11 @@ def download_declaration_details(declaration_id, batch_folder, limiter):
         return False
 
 def load_declarations_from_json(file_path):
-    """Загружает список деклараций из JSON файла"""
+    """Загружает список деклараций из JSON или NDJSON файла"""
     try:
+        if is_ndjson_file(file_path):
+            # NDJSON читается построчно, по одной записи
+            return [item["certdecltr_id"] for item in iter_ndjson_items(file_path) if "certdecltr_id" in item]
         with open(file_path, 'r', encoding='utf-8') as f:
             data = json.load(f)
             items = data.get("items", [])
@@ -290,7 +287,7 @@ def scan_directory_for_json(directory):
     try:
         for root, _, files in os.walk(directory):
             for file in files:
-                if file.endswith('.json') and not file.endswith('download_report.json'):
+                if (file.endswith('.json') or is_ndjson_file(file)) and not file.endswith('download_report.json'):
                     file_path = os.path.join(root, file)
                     json_files.append(file_path)
                     log_debug(f"Найден JSON файл: {file_path}")
@@ -17,7 +17,7 @@ def check_requirements():
         print("[✓] PyInstaller установлен")
 
     # Проверяем наличие рабочих файлов
-    required_files = ['declarations_downloader_interactive.py', 'declarations_downloader.py']
+    required_files = ['declarations_downloader_interactive.py', 'declarations_downloader.py', 'http_transport.py', 'ndjson_sink.py', 'crawl_journal.py', 'rate_limiting.py', 'proxy_model.py']
     for file in required_files:
         if not os.path.exists(file):
             print(f"[✗] Ошибка: файл {file} не найден!")
@@ -37,7 +37,7 @@ def build_executable():
         'json', 'uuid', 'traceback', 'time', 'concurrent.futures',
         'tkinter', 'tkinter.filedialog', 'colorama', 'tqdm',
         'importlib', 'importlib.util', 'importlib.machinery',
-        'subprocess', 'math', 'random'
+        'subprocess', 'math', 'random', 'asyncio', 'aiohttp', 'aiohttp_socks'
     ]
     
     # Формируем команду для PyInstaller
@@ -54,6 +54,11 @@ def build_executable():
     
     # Добавляем data-файлы
     cmd.extend(["--add-data", f"declarations_downloader.py{os.pathsep}."]) 
+    cmd.extend(["--add-data", f"http_transport.py{os.pathsep}."])
+    cmd.extend(["--add-data", f"ndjson_sink.py{os.pathsep}."])
+    cmd.extend(["--add-data", f"crawl_journal.py{os.pathsep}."])
+    cmd.extend(["--add-data", f"rate_limiting.py{os.pathsep}."])
+    cmd.extend(["--add-data", f"proxy_model.py{os.pathsep}."])
     
     # Добавляем главный файл
     cmd.append("declarations_downloader_interactive.py")
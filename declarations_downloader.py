@@ -2,14 +2,20 @@ import requests
 import json
 import os
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 import urllib3
 import concurrent.futures
 import threading
 import argparse
 import math
 import random
+import asyncio
 from tqdm import tqdm
+from http_transport import http_get, AsyncSessionPool, aiohttp
+from ndjson_sink import NdjsonSink, is_ndjson_file, iter_ndjson_items, get_part_paths, get_next_part_path
+from crawl_journal import CrawlJournal
+from rate_limiting import TokenBucket, AdaptiveWindow
+from proxy_model import parse_proxies
 
 # Отключаем предупреждения для незащищенных запросов
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -31,6 +37,15 @@ default_params = {
     "query[trts]": 1
 }
 
+# Формат дат в фильтрах API
+DATE_FORMAT = "%d.%m.%Y"
+
+# Фильтр для keyset-пагинации: следующая порция берется ниже последнего полученного ID
+KEYSET_FILTER = "filter[certdecltr_id][lt]"
+
+# Файл состояния инкрементальной синхронизации
+sync_state_file = os.path.join(output_dir, "sync_state.json")
+
 # Список заголовков для имитации браузера
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
@@ -45,30 +60,9 @@ proxy_list = []
 current_proxy_index = 0
 proxy_lock = threading.Lock()
 
-class RateLimiter:
-    """Класс для ограничения частоты запросов к API"""
-    def __init__(self, max_calls_per_second=1):
-        self.max_calls = max_calls_per_second
-        self.calls = []
-        self.lock = threading.Lock()
-
-    def _cleanup_old_calls(self):
-        current_time = time.time()
-        self.calls = [t for t in self.calls if current_time - t < 1.0]
-
-    def wait_for_permission(self):
-        with self.lock:
-            self._cleanup_old_calls()
-            if len(self.calls) >= self.max_calls:
-                sleep_time = 1.0 - (time.time() - self.calls[0])
-                if sleep_time > 0:
-                    time.sleep(sleep_time + 0.1)  # Добавляем небольшую задержку
-                self._cleanup_old_calls()
-            
-            self.calls.append(time.time())
-
-# Создаем ограничитель запросов - максимум 2 запроса в секунду
-rate_limiter = RateLimiter(max_calls_per_second=2)
+# Создаем ограничитель запросов - в среднем 2 запроса в секунду, не больше 2 подряд.
+# Общий для потоков и движка asyncio: ожидание слота не держит блокировку
+rate_limiter = TokenBucket(rate=2, burst=2)
 
 def load_proxies(proxy_file):
     """Загружает прокси из файла"""
@@ -84,10 +78,13 @@ def load_proxies(proxy_file):
     for encoding in encodings:
         try:
             with open(proxy_file, 'r', encoding=encoding) as f:
-                proxies = [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+                # Строки разбираются один раз: запросы берут готовые URL и словарь proxies
+                proxies, invalid = parse_proxies(f)
             
             proxy_list = proxies
             print(f"Успешно загружено {len(proxy_list)} прокси из файла {proxy_file} (кодировка: {encoding})")
+            if invalid:
+                print(f"[ПРЕДУПРЕЖДЕНИЕ] Пропущено {len(invalid)} строк неподдерживаемого формата, например: {invalid[0]}")
             
             # Выводим первые 5 прокси для проверки формата
             if len(proxy_list) > 0:
@@ -139,40 +136,16 @@ def make_request_with_retry(url, params, max_retries=5, delay=3, use_proxy=False
             if use_proxy and proxy_list:
                 proxy = get_proxy()
                 if proxy:
-                    # Для SOCKS прокси мы используем схему прокси как есть
-                    if 'socks' in proxy.lower():
-                        proxies = {
-                            "http": proxy,
-                            "https": proxy
-                        }
-                    # Для HTTP/HTTPS прокси убедимся, что протокол соответствует запросу
-                    else:
-                        if 'http://' in proxy:
-                            proxy_http = proxy
-                            proxy_https = proxy.replace('http://', 'https://')
-                        elif 'https://' in proxy:
-                            proxy_https = proxy
-                            proxy_http = proxy.replace('https://', 'http://')
-                        else:
-                            # Если протокол не указан, добавим его
-                            proxy_http = f"http://{proxy}"
-                            proxy_https = f"https://{proxy}"
-                        
-                        proxies = {
-                            "http": proxy_http,
-                            "https": proxy_https
-                        }
-                    
-                    proxy_used = proxy
-                    print(f"[ИНФО] Использую прокси: {proxy}")
+                    proxies = proxy.proxies
+                    proxy_used = proxy.label
+                    print(f"[ИНФО] Использую прокси: {proxy_used}")
             
-            # Отключаем проверку SSL-сертификата
-            response = requests.get(
+            # Запрос идет через пул сессий с keep-alive, проверка SSL-сертификата отключена
+            response = http_get(
                 url, 
                 params=params, 
                 headers=headers,
                 proxies=proxies,
-                verify=False,
                 timeout=30  # Увеличиваем таймаут для работы через прокси
             )
             response.raise_for_status()  # Проверяем на ошибки HTTP
@@ -196,12 +169,256 @@ def make_request_with_retry(url, params, max_retries=5, delay=3, use_proxy=False
                 print("[ОШИБКА] Достигнуто максимальное количество попыток. Выход.")
                 raise
 
-def download_page(page_num, per_page, timestamp, batch_prefix, use_proxy=False):
-    """Загружает одну страницу деклараций"""
+async def make_request_with_retry_async(session_pool, limiter, url, params, max_retries=5, delay=3, use_proxy=False):
+    """Асинхронный аналог make_request_with_retry для движка asyncio"""
+    headers = {
+        "User-Agent": get_random_user_agent()
+    }
+    timeout = aiohttp.ClientTimeout(total=30)
+    
+    for attempt in range(max_retries):
+        proxy_used = None
+        try:
+            await limiter.wait_for_permission_async()
+            
+            proxy = get_proxy() if use_proxy and proxy_list else None
+            session, proxy_url = session_pool.get_session(proxy.url if proxy else None)
+            proxy_used = proxy.label if proxy else None
+            
+            async with session.get(url, params=params, headers=headers, proxy=proxy_url, timeout=timeout) as response:
+                response.raise_for_status()
+                return await response.json(content_type=None)
+        
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            proxy_info = f" через прокси {proxy_used}" if proxy_used else ""
+            print(f"[ОШИБКА] Ошибка при запросе{proxy_info} (попытка {attempt+1}/{max_retries}): {e!r}")
+            
+            if attempt < max_retries - 1:
+                await asyncio.sleep(delay * (attempt + 1))
+            else:
+                print("[ОШИБКА] Достигнуто максимальное количество попыток. Выход.")
+                raise
+
+async def download_page_async(session_pool, limiter, page_num, per_page, output, use_proxy=False, shard=None, before_id=None):
+    """Асинхронно загружает одну страницу деклараций"""
+    params = build_page_params(page_num, per_page, shard, before_id)
+    
+    data = await make_request_with_retry_async(session_pool, limiter, base_url, params, use_proxy=use_proxy)
+    items = data.get("items", [])
+    
+    # Запись на диск выполняем в пуле потоков, чтобы не блокировать цикл событий
+    max_id, newest_date = await asyncio.get_running_loop().run_in_executor(None, output.save_page, data, page_num, shard)
+    
+    return {
+        "page": page_num,
+        "count": len(items),
+        "total_count": data.get("_meta", {}).get("totalCount", 0),
+        "last_id": items[-1].get("certdecltr_id") if items else None,
+        "max_id": max_id,
+        "newest_date": newest_date
+    }
+
+async def download_pages_async(tasks, per_page, output, use_proxy, window, on_page_done, on_page_error):
+    """Загружает страницы движком asyncio, держа в полете не больше window.size запросов.
+    
+    Задачи берутся из итератора по мере освобождения окна, поэтому корутины
+    для всех страниц заранее не создаются.
+    """
+    session_pool = AsyncSessionPool()
+    limiter = rate_limiter
+    
+    async def run_page(task):
+        start = time.monotonic()
+        try:
+            result = await download_page_async(
+                session_pool, limiter, task["page"], per_page, output, use_proxy, task["shard"]
+            )
+        except Exception as e:
+            window.report_error()
+            on_page_error(task, e)
+        else:
+            window.report_success(time.monotonic() - start)
+            on_page_done(task, result)
+    
+    tasks = iter(tasks)
+    pending = set()
+    try:
+        while True:
+            while len(pending) < window.size:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                pending.add(asyncio.ensure_future(run_page(task)))
+            if not pending:
+                break
+            _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        await session_pool.close()
+
+async def download_shard_keyset_async(session_pool, limiter, shard, per_page, output, use_proxy, on_page_done, on_page_error,
+                                      start_page=1, before_id=None):
+    """Асинхронно загружает шард последовательно по certdecltr_id (keyset-пагинация)"""
+    page_num = start_page
+    
+    while True:
+        task = {"shard": shard, "page": page_num}
+        try:
+            result = await download_page_async(
+                session_pool, limiter, page_num, per_page, output, use_proxy, shard, before_id
+            )
+        except Exception as e:
+            # Без последнего ID продолжить цепочку нельзя
+            on_page_error(task, e)
+            return
+        
+        on_page_done(task, result)
+        if result["count"] < per_page or result["last_id"] is None:
+            return
+        
+        before_id = result["last_id"]
+        page_num += 1
+
+async def download_shards_keyset_async(chains, per_page, output, use_proxy, concurrency, on_page_done, on_page_error):
+    """Загружает цепочки (шард, начальная страница, before_id) в keyset-режиме, до concurrency одновременно"""
+    session_pool = AsyncSessionPool()
+    limiter = rate_limiter
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def run_chain(shard, start_page, before_id):
+        async with semaphore:
+            await download_shard_keyset_async(
+                session_pool, limiter, shard, per_page, output, use_proxy, on_page_done, on_page_error,
+                start_page, before_id
+            )
+    
+    try:
+        await asyncio.gather(*(run_chain(*chain) for chain in chains))
+    finally:
+        await session_pool.close()
+
+def build_page_params(page_num, per_page, shard=None, before_id=None):
+    """Формирует параметры запроса страницы, подставляя диапазон дат шарда.
+    
+    Если указан before_id, страница запрашивается в keyset-режиме: всегда
+    первая страница выборки с certdecltr_id меньше before_id.
+    """
     params = default_params.copy()
     params["page"] = page_num
     params["per-page"] = per_page
     
+    if shard:
+        params["filter[DocStartDate][gte]"] = shard["date_from"]
+        params["filter[DocStartDate][lte]"] = shard["date_to"]
+    
+    if before_id is not None:
+        params["page"] = 1
+        params[KEYSET_FILTER] = before_id
+    
+    return params
+
+# Сколько записей из NDJSON-файла прошлого запуска передается on_items за раз
+REPLAY_BATCH_SIZE = 500
+
+class CrawlOutput:
+    """Сохранение страниц одного обхода: отдельные JSON-файлы или общий NDJSON-файл.
+    
+    Если задан on_items, после сохранения каждой страницы ему передаются ее
+    записи - так следующий этап (например, загрузка деталей) может начинать
+    работу, не дожидаясь окончания обхода.
+    """
+    def __init__(self, timestamp, batch_prefix="declarations_batch", output_format="json", on_items=None):
+        self.timestamp = timestamp
+        self.batch_prefix = batch_prefix
+        self.output_format = output_format
+        self.on_items = on_items
+        self.sink = None
+        
+        # Максимальный certdecltr_id и самая поздняя DocStartDate среди сохраненных записей
+        self.max_id = None
+        self.newest_date = None
+        self.lock = threading.Lock()
+        
+        if output_format != "json":
+            # Все записи обхода дописываются в один файл по мере поступления страниц;
+            # продолженный обход пишет в следующую часть (.partN), а не в файл прерванного запуска
+            self.ndjson_path = os.path.join(output_dir, f"declarations_{timestamp}.{output_format}")
+            self.sink = NdjsonSink(get_next_part_path(self.ndjson_path))
+    
+    def page_filename(self, page_num, shard=None):
+        """Формирует имя файла страницы; для шардов в имя добавляется диапазон дат"""
+        if shard:
+            shard_label = f"{format_shard_date(shard['date_from'])}-{format_shard_date(shard['date_to'])}"
+            return os.path.join(output_dir, f"{self.batch_prefix}_{shard_label}_{page_num}_{self.timestamp}.json")
+        return os.path.join(output_dir, f"{self.batch_prefix}_{page_num}_{self.timestamp}.json")
+    
+    def save_page(self, data, page_num, shard=None):
+        """Сохраняет ответ API для страницы"""
+        max_id, newest_date = get_items_watermark(data.get("items", []))
+        self.track_watermark(max_id, newest_date)
+        
+        if self.sink:
+            self.sink.write_items(data.get("items", []))
+        else:
+            save_to_json(data, self.page_filename(page_num, shard))
+        
+        if self.on_items:
+            self.on_items(data.get("items", []))
+        
+        return max_id, newest_date
+    
+    def replay_saved_pages(self, tasks):
+        """Передает on_items записи страниц, сохраненных до прерывания обхода.
+        
+        При продолжении такие страницы повторно не запрашиваются, но
+        следующий этап мог не успеть обработать их записи. В режиме NDJSON
+        читаются все части обхода, записанные прошлыми запусками. Возвращает
+        количество переданных записей.
+        """
+        if not self.on_items:
+            return 0
+        
+        replayed_count = 0
+        if self.sink:
+            batch = []
+            for path in get_part_paths(self.ndjson_path):
+                if path == self.sink.path:
+                    continue
+                for item in iter_ndjson_items(path):
+                    batch.append(item)
+                    if len(batch) >= REPLAY_BATCH_SIZE:
+                        self.on_items(batch)
+                        replayed_count += len(batch)
+                        batch = []
+            if batch:
+                self.on_items(batch)
+                replayed_count += len(batch)
+            return replayed_count
+        
+        for task in tasks:
+            path = self.page_filename(task["page"], task["shard"])
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    items = json.load(f).get("items", [])
+            except (OSError, ValueError) as e:
+                print(f"[ПРЕДУПРЕЖДЕНИЕ] Не удалось прочитать сохраненную страницу {path}: {e}")
+                continue
+            self.on_items(items)
+            replayed_count += len(items)
+        return replayed_count
+    
+    def track_watermark(self, max_id, newest_date):
+        """Учитывает максимальный ID и дату сохраненных записей"""
+        with self.lock:
+            self.max_id, self.newest_date = merge_watermarks(self.max_id, self.newest_date, max_id, newest_date)
+    
+    def close(self):
+        if self.sink:
+            self.sink.close()
+
+def download_page(page_num, per_page, output, use_proxy=False, shard=None, before_id=None):
+    """Загружает одну страницу деклараций"""
+    params = build_page_params(page_num, per_page, shard, before_id)
+    
     # Выполняем запрос
     data = make_request_with_retry(base_url, params, use_proxy=use_proxy)
     
@@ -209,15 +426,256 @@ def download_page(page_num, per_page, timestamp, batch_prefix, use_proxy=False):
     items = data.get("items", [])
     
     # Сохраняем полученные данные
-    filename = os.path.join(output_dir, f"{batch_prefix}_{page_num}_{timestamp}.json")
-    save_to_json(data, filename)
+    max_id, newest_date = output.save_page(data, page_num, shard)
     
     return {
         "page": page_num,
         "count": len(items),
-        "total_count": data.get("_meta", {}).get("totalCount", 0)
+        "total_count": data.get("_meta", {}).get("totalCount", 0),
+        "last_id": items[-1].get("certdecltr_id") if items else None,
+        "max_id": max_id,
+        "newest_date": newest_date
     }
 
+def parse_api_date(date_str):
+    """Преобразует дату в формате API (ДД.ММ.ГГГГ) в объект date"""
+    return datetime.strptime(date_str, DATE_FORMAT).date()
+
+def format_api_date(value):
+    """Преобразует объект date в формат API (ДД.ММ.ГГГГ)"""
+    return value.strftime(DATE_FORMAT)
+
+def format_shard_date(date_str):
+    """Преобразует дату API в компактный вид ГГГГММДД для имен файлов"""
+    return parse_api_date(date_str).strftime("%Y%m%d")
+
+def parse_item_date(value):
+    """Разбирает дату из записи API (ГГГГ-ММ-ДД или ДД.ММ.ГГГГ), возвращает None при ошибке"""
+    if not value:
+        return None
+    value = str(value)[:10]
+    for date_format in ("%Y-%m-%d", DATE_FORMAT):
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+def merge_watermarks(max_id, newest_date, other_max_id, other_newest_date):
+    """Объединяет две пары (максимальный ID, самая поздняя дата), пропуская пустые значения"""
+    if other_max_id is not None and (max_id is None or other_max_id > max_id):
+        max_id = other_max_id
+    if other_newest_date is not None and (newest_date is None or other_newest_date > newest_date):
+        newest_date = other_newest_date
+    return max_id, newest_date
+
+def get_items_watermark(items):
+    """Возвращает максимальный certdecltr_id и самую позднюю DocStartDate среди записей"""
+    max_id = None
+    newest_date = None
+    for item in items:
+        max_id, newest_date = merge_watermarks(
+            max_id, newest_date, item.get("certdecltr_id"), parse_item_date(item.get("DocStartDate"))
+        )
+    return max_id, newest_date
+
+def load_sync_state():
+    """Загружает состояние последней синхронизации, если оно сохранено"""
+    if not os.path.exists(sync_state_file):
+        return None
+    try:
+        with open(sync_state_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[ПРЕДУПРЕЖДЕНИЕ] Не удалось прочитать файл состояния {sync_state_file}: {e}")
+        return None
+
+def save_sync_state(max_id, newest_date):
+    """Сохраняет состояние синхронизации, не уменьшая ранее запомненные значения"""
+    state = load_sync_state() or {}
+    max_id, newest_date = merge_watermarks(
+        state.get("max_certdecltr_id"),
+        parse_item_date(state.get("newest_doc_start_date")),
+        max_id,
+        newest_date
+    )
+    if max_id is None:
+        return
+    
+    save_to_json({
+        "max_certdecltr_id": max_id,
+        "newest_doc_start_date": format_api_date(newest_date) if newest_date else None,
+        "last_sync": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }, sync_state_file)
+
+def rebuild_sync_state_from_local():
+    """Определяет максимальный ID и самую позднюю дату по уже скачанным файлам списков"""
+    max_id = None
+    newest_date = None
+    
+    for filename in os.listdir(output_dir):
+        file_path = os.path.join(output_dir, filename)
+        try:
+            if is_ndjson_file(filename):
+                items = iter_ndjson_items(file_path)
+            elif filename.endswith(".json") and file_path != sync_state_file:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    items = json.load(f).get("items", [])
+            else:
+                continue
+            max_id, newest_date = merge_watermarks(max_id, newest_date, *get_items_watermark(items))
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"[ПРЕДУПРЕЖДЕНИЕ] Не удалось прочитать файл {file_path}: {e}")
+    
+    return max_id, newest_date
+
+def probe_total_count(date_from, date_to, use_proxy=False):
+    """Запрашивает одну запись, чтобы узнать общее количество деклараций в диапазоне дат"""
+    params = default_params.copy()
+    params["per-page"] = 1
+    params["filter[DocStartDate][gte]"] = date_from
+    params["filter[DocStartDate][lte]"] = date_to
+    
+    data = make_request_with_retry(base_url, params, use_proxy=use_proxy)
+    return data.get("_meta", {}).get("totalCount", 0)
+
+def plan_date_shards(date_from, date_to, target_size, use_proxy=False, workers=3):
+    """Делит диапазон дат на шарды не больше target_size записей.
+    
+    Для каждого поддиапазона запрашивается _meta.totalCount; диапазоны,
+    в которых записей больше целевого размера, делятся пополам, пока не
+    станут достаточно малыми или не сократятся до одного дня. Пустые
+    диапазоны отбрасываются. Возвращает список шардов, отсортированный
+    по дате начала.
+    """
+    shards = []
+    
+    pending = {}
+    
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        def submit_probe(start, end):
+            future = executor.submit(probe_total_count, format_api_date(start), format_api_date(end), use_proxy)
+            pending[future] = (start, end)
+        
+        submit_probe(parse_api_date(date_from), parse_api_date(date_to))
+        
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                start, end = pending.pop(future)
+                count = future.result()
+                
+                if count > target_size and start < end:
+                    # Делим диапазон пополам и проверяем каждую половину
+                    middle = start + (end - start) // 2
+                    submit_probe(start, middle)
+                    submit_probe(middle + timedelta(days=1), end)
+                elif count > 0:
+                    if count > target_size:
+                        print(f"[ПРЕДУПРЕЖДЕНИЕ] За {format_api_date(start)} найдено {count:,} записей, "
+                              f"день нельзя разделить дальше")
+                    shards.append({
+                        "date_from": format_api_date(start),
+                        "date_to": format_api_date(end),
+                        "total_count": count
+                    })
+    
+    shards.sort(key=lambda shard: parse_api_date(shard["date_from"]))
+    return shards
+
+def iter_page_tasks(shards, per_page, total_count):
+    """Перебирает задачи (шард, страница) по одной, не создавая список всех страниц.
+    
+    Без шардов перебираются страницы всего периода (shard=None).
+    """
+    for shard in shards or [None]:
+        count = shard["total_count"] if shard else total_count
+        for page in range(1, math.ceil(count / per_page) + 1):
+            yield {"shard": shard, "page": page}
+
+def count_pages(shards, per_page, total_count):
+    """Количество страниц по всем шардам"""
+    if not shards:
+        return math.ceil(total_count / per_page)
+    return sum(math.ceil(shard["total_count"] / per_page) for shard in shards)
+
+def download_pages_windowed(tasks, per_page, output, use_proxy, workers, window, on_page_done, on_page_error):
+    """Загружает страницы пулом потоков, держа в полете не больше window.size задач.
+    
+    Следующая страница отправляется в пул, только когда освобождается место
+    в окне, поэтому память не растет с числом страниц, а окно успевает
+    сократиться при ошибках и замедлении ответов.
+    """
+    tasks = iter(tasks)
+    in_flight = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            while len(in_flight) < window.size:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                future = executor.submit(download_page, task["page"], per_page, output, use_proxy, task["shard"])
+                in_flight[future] = (task, time.monotonic())
+            if not in_flight:
+                break
+            
+            done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                task, submitted_at = in_flight.pop(future)
+                try:
+                    result = future.result()
+                    window.report_success(time.monotonic() - submitted_at)
+                    on_page_done(task, result)
+                except Exception as e:
+                    window.report_error()
+                    on_page_error(task, e)
+
+def format_task_label(task):
+    """Возвращает подпись задачи для вывода в консоль"""
+    if task["shard"]:
+        return f"{task['shard']['date_from']}-{task['shard']['date_to']}/{task['page']}"
+    return str(task["page"])
+
+def download_shard_keyset(shard, per_page, output, use_proxy, on_page_done, on_page_error, start_page=1, before_id=None):
+    """Загружает шард последовательно по certdecltr_id (keyset-пагинация).
+    
+    Каждая следующая порция запрашивается фильтром certdecltr_id < последнего
+    полученного ID, поэтому сервер не пропускает N*per_page строк, а новые
+    декларации, появившиеся во время обхода, не сдвигают страницы.
+    При продолжении обхода цепочка начинается со start_page и before_id.
+    """
+    page_num = start_page
+    
+    while True:
+        task = {"shard": shard, "page": page_num}
+        try:
+            result = download_page(page_num, per_page, output, use_proxy, shard, before_id)
+        except Exception as e:
+            # Без последнего ID продолжить цепочку нельзя
+            on_page_error(task, e)
+            return
+        
+        on_page_done(task, result)
+        if result["count"] < per_page or result["last_id"] is None:
+            return
+        
+        before_id = result["last_id"]
+        page_num += 1
+
+def check_keyset_support(use_proxy=False):
+    """Проверяет, учитывает ли API фильтр по certdecltr_id, необходимый для keyset-пагинации"""
+    data = make_request_with_retry(base_url, build_page_params(1, 2), use_proxy=use_proxy)
+    items = data.get("items", [])
+    if len(items) < 2:
+        # Слишком мало данных, чтобы проверить фильтр; keyset здесь ничего не дает
+        return False
+    
+    data = make_request_with_retry(base_url, build_page_params(1, 1, before_id=items[0].get("certdecltr_id")), use_proxy=use_proxy)
+    filtered_items = data.get("items", [])
+    
+    # Если фильтр работает, первой окажется вторая запись исходной выборки
+    return bool(filtered_items) and filtered_items[0].get("certdecltr_id") == items[1].get("certdecltr_id")
+
 def format_time(seconds):
     """Форматирует время в читаемый вид"""
     if seconds < 60:
@@ -230,8 +688,16 @@ def format_time(seconds):
         minutes, seconds = divmod(remainder, 60)
         return f"{hours:.0f} ч {minutes:.0f} мин"
 
-def download_all_declarations(workers=3, per_page=500, use_proxy=False):
-    """Главная функция для загрузки всех деклараций"""
+def download_all_declarations(workers=3, per_page=500, use_proxy=False, engine="threads", concurrency=200, shard_size=0,
+                              pagination="offset", output_format="json", resume=False, on_items=None):
+    """Главная функция для загрузки всех деклараций.
+    
+    on_items вызывается с записями каждой сохраненной страницы (см. CrawlOutput).
+    """
+    if engine == "async" and aiohttp is None:
+        print("[ОШИБКА] Для движка asyncio требуется пакет aiohttp: pip install aiohttp")
+        return 0
+    
     print("="*80)
     print("Инструмент для загрузки деклараций")
     print("Многопоточная загрузка данных с API belgiss.by")
@@ -239,7 +705,10 @@ def download_all_declarations(workers=3, per_page=500, use_proxy=False):
     
     print("\nНачало загрузки деклараций...")
     print("ВНИМАНИЕ: Проверка SSL-сертификата отключена. Это может представлять риск безопасности.")
-    print(f"Используется {workers} параллельных потоков, {per_page} записей на страницу")
+    if engine == "async":
+        print(f"Используется движок asyncio, до {concurrency} запросов в полете, {per_page} записей на страницу")
+    else:
+        print(f"Используется {workers} параллельных потоков, {per_page} записей на страницу")
     if use_proxy and proxy_list:
         print(f"Используются прокси: {len(proxy_list)} шт.")
     else:
@@ -247,93 +716,200 @@ def download_all_declarations(workers=3, per_page=500, use_proxy=False):
     print()
     
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    batch_prefix = "declarations_batch"
+    date_from = default_params["filter[DocStartDate][gte]"]
+    date_to = default_params["filter[DocStartDate][lte]"]
     
-    # Сначала делаем один запрос, чтобы получить общее количество записей
-    print("Получение информации о количестве записей...")
-    params = default_params.copy()
-    params["per-page"] = 1
-    data = make_request_with_retry(base_url, params, use_proxy=use_proxy)
+    # Проверяем, можно ли использовать keyset-пагинацию
+    if pagination == "keyset":
+        if check_keyset_support(use_proxy=use_proxy):
+            print("Используется keyset-пагинация по certdecltr_id")
+        else:
+            print("[ПРЕДУПРЕЖДЕНИЕ] API не поддерживает фильтр по certdecltr_id, используется постраничная загрузка")
+            pagination = "offset"
+    
+    # Параметры, по которым журнал обхода сопоставляется при продолжении
+    crawl_params = {
+        "date_from": date_from,
+        "date_to": date_to,
+        "query": {key: value for key, value in default_params.items() if key not in ("page", "per-page")},
+        "per_page": per_page,
+        "shard_size": shard_size,
+        "pagination": pagination,
+        "output_format": output_format
+    }
+    
+    journal = CrawlJournal.find_resumable(output_dir, crawl_params) if resume else None
+    if journal:
+        # Продолжаем прерванный обход с теми же шардами и именами файлов
+        timestamp = journal.timestamp
+        shards = journal.header["shards"]
+        total_count = journal.header["total_count"]
+        print(f"Продолжение обхода {timestamp}: уже сохранено страниц {len(journal.pages):,}")
+    else:
+        if resume:
+            print("[ИНФО] Незавершенный обход с такими параметрами не найден, начинаем новый")
+        
+        if shard_size > 0:
+            # Делим период на шарды с неглубокой пагинацией
+            print(f"Планирование шардов по датам (не более {shard_size:,} записей в шарде)...")
+            shards = plan_date_shards(date_from, date_to, shard_size, use_proxy=use_proxy, workers=workers)
+            total_count = sum(shard["total_count"] for shard in shards)
+        else:
+            # Сначала делаем один запрос, чтобы получить общее количество записей
+            print("Получение информации о количестве записей...")
+            shards = []
+            total_count = probe_total_count(date_from, date_to, use_proxy=use_proxy)
     
-    total_count = data.get("_meta", {}).get("totalCount", 0)
     # Проверка на наличие данных в заданном периоде
     if total_count == 0:
         print("В указанном периоде не найдено данных деклараций. Пожалуйста, проверьте параметры поиска.")
         return 0
     
-    # Рассчитываем количество страниц
-    total_pages = math.ceil(total_count / per_page)
+    if journal is None:
+        journal = CrawlJournal.create(output_dir, timestamp, crawl_params, shards, total_count)
+    
+    # Количество страниц по всем шардам
+    total_pages = count_pages(shards, per_page, total_count)
     
     print(f"Всего записей: {total_count:,}")
+    if shards:
+        print(f"Шардов: {len(shards):,}")
     print(f"Страниц: {total_pages:,}")
-    print(f"Запуск многопоточной загрузки с {workers} потоками\n")
+    if engine == "async":
+        print(f"Запуск асинхронной загрузки, до {concurrency} запросов в полете\n")
+    else:
+        print(f"Запуск многопоточной загрузки с {workers} потоками\n")
     
-    # Словарь для отслеживания прогресса
-    page_statuses = {page: "в очереди" for page in range(1, total_pages + 1)}
     completed_pages = 0
     error_pages = 0
     downloaded_count = 0
     
+    # Страницы, сохраненные до прерывания, учитываем сразу и повторно не запрашиваем
+    if journal.pages:
+        completed_pages = sum(1 for task in iter_page_tasks(shards, per_page, total_count)
+                              if journal.is_page_done(task["shard"], task["page"]))
+        downloaded_count = journal.done_count()
+    
+    # Задачи создаются по мере отправки, а не списком на все страницы
+    tasks = (task for task in iter_page_tasks(shards, per_page, total_count)
+             if not journal.is_page_done(task["shard"], task["page"]))
+    
+    # Окно отправки: сколько страниц держать в полете; подстраивается по времени ответа и ошибкам
+    if engine == "async":
+        window = AdaptiveWindow(initial_size=max(1, concurrency // 4), max_size=concurrency)
+    else:
+        window = AdaptiveWindow(initial_size=workers, max_size=workers)
+    
+    # Блокировка для счетчиков: в keyset-режиме страницы учитываются из рабочих потоков
+    stats_lock = threading.Lock()
+    
     # Используем ThreadPoolExecutor для параллельной загрузки
     start_time = time.time()
     
     # Создаем прогресс-бар для отслеживания
-    progress_bar = tqdm(total=total_count, desc="Загрузка записей", unit="декл")
+    progress_bar = tqdm(total=total_count, initial=downloaded_count, desc="Загрузка записей", unit="декл")
+    
+    output = CrawlOutput(timestamp, output_format=output_format, on_items=on_items)
+    if output.sink:
+        print(f"Записи сохраняются в файл {output.sink.path}")
+    for record in journal.pages.values():
+        output.track_watermark(record.get("max_id"), parse_item_date(record.get("newest_date")))
+    
+    # Записи страниц, сохраненных до прерывания, тоже передаем следующему этапу
+    if journal.pages and on_items:
+        replayed_count = output.replay_saved_pages(
+            task for task in iter_page_tasks(shards, per_page, total_count)
+            if journal.is_page_done(task["shard"], task["page"])
+        )
+        print(f"Записей из ранее сохраненных страниц передано дальше: {replayed_count:,}")
     
+    def on_page_done(task, result):
+        """Учитывает успешно загруженную страницу (общий код для обоих движков)"""
+        nonlocal downloaded_count, completed_pages
+        journal.record_page(task["shard"], task["page"], result["count"], result["last_id"],
+                            result["max_id"], result["newest_date"])
+        with stats_lock:
+            page_count = result["count"]
+            page_label = format_task_label(task)
+            
+            # Увеличиваем счетчики
+            downloaded_count += page_count
+            completed_pages += 1
+            
+            # Обновляем прогресс-бар
+            progress_bar.update(page_count)
+            
+            # Выводим информацию в консоль каждые 10 страниц или первые 5
+            if completed_pages % 10 == 0 or completed_pages <= 5:
+                elapsed = time.time() - start_time
+                speed = int((downloaded_count / elapsed) * 60) if elapsed > 0 else 0
+                percent_complete = (downloaded_count / total_count) * 100 if total_count > 0 else 0
+                
+                # Оценка времени до завершения
+                if percent_complete > 0:
+                    est_total_time = elapsed / (percent_complete / 100)
+                    est_remaining = est_total_time - elapsed
+                    remaining_time = format_time(est_remaining)
+                else:
+                    remaining_time = "неизвестно"
+                
+                print(f"\n[ПРОГРЕСС] Стр. {page_label}: {downloaded_count}/{total_count} записей ({percent_complete:.1f}%), "
+                      f"стр. {completed_pages}/{total_pages}, скорость: {speed} декл/мин, "
+                      f"осталось: {remaining_time}, в полете до {window.size} стр.")
+    
+    def on_page_error(task, e):
+        """Учитывает страницу, загрузка которой завершилась ошибкой"""
+        nonlocal error_pages
+        page_label = format_task_label(task)
+        print(f"[ОШИБКА] Ошибка при загрузке страницы {page_label}: {e}")
+        with stats_lock:
+            error_pages += 1
+    
+    interrupted = False
     try:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
-            # Создаем задачи для всех страниц
-            future_to_page = {
-                executor.submit(download_page, page, per_page, timestamp, batch_prefix, use_proxy): page
-                for page in range(1, total_pages + 1)
-            }
+        if pagination == "keyset":
+            # Шарды (или весь период) загружаются независимыми цепочками по certdecltr_id;
+            # при продолжении каждая цепочка начинается после последней сохраненной страницы
+            chains = []
+            for shard in shards or [None]:
+                start_page, before_id, finished = journal.get_chain_state(shard, per_page)
+                if not finished:
+                    chains.append((shard, start_page, before_id))
             
-            # Обрабатываем результаты по мере их завершения
-            for future in concurrent.futures.as_completed(future_to_page):
-                page = future_to_page[future]
-                try:
-                    result = future.result()
-                    page_count = result["count"]
-                    
-                    # Увеличиваем счетчики
-                    downloaded_count += page_count
-                    completed_pages += 1
-                    
-                    # Обновляем прогресс-бар
-                    progress_bar.update(page_count)
-                    
-                    # Обновляем статус страницы
-                    page_statuses[page] = "завершено"
-                    
-                    # Выводим информацию в консоль каждые 10 страниц или первые 5
-                    if completed_pages % 10 == 0 or completed_pages <= 5:
-                        elapsed = time.time() - start_time
-                        speed = int((downloaded_count / elapsed) * 60) if elapsed > 0 else 0
-                        percent_complete = (downloaded_count / total_count) * 100 if total_count > 0 else 0
-                        
-                        # Оценка времени до завершения
-                        if percent_complete > 0:
-                            est_total_time = elapsed / (percent_complete / 100)
-                            est_remaining = est_total_time - elapsed
-                            remaining_time = format_time(est_remaining)
-                        else:
-                            remaining_time = "неизвестно"
-                        
-                        print(f"\n[ПРОГРЕСС] Стр. {page}: {downloaded_count}/{total_count} записей ({percent_complete:.1f}%), "
-                              f"стр. {completed_pages}/{total_pages}, скорость: {speed} декл/мин, "
-                              f"осталось: {remaining_time}")
-                    
-                except Exception as e:
-                    print(f"[ОШИБКА] Ошибка при загрузке страницы {page}: {e}")
-                    page_statuses[page] = "ошибка"
-                    error_pages += 1
+            if engine == "async":
+                asyncio.run(download_shards_keyset_async(
+                    chains, per_page, output, use_proxy,
+                    concurrency, on_page_done, on_page_error
+                ))
+            else:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = [
+                        executor.submit(download_shard_keyset, shard, per_page, output, use_proxy,
+                                        on_page_done, on_page_error, start_page, before_id)
+                        for shard, start_page, before_id in chains
+                    ]
+                    for future in concurrent.futures.as_completed(futures):
+                        future.result()
+        elif engine == "async":
+            asyncio.run(download_pages_async(
+                tasks, per_page, output, use_proxy,
+                window, on_page_done, on_page_error
+            ))
+        else:
+            download_pages_windowed(
+                tasks, per_page, output, use_proxy,
+                workers, window, on_page_done, on_page_error
+            )
     
     except KeyboardInterrupt:
+        interrupted = True
         print("\n[ИНФО] Загрузка прервана пользователем")
     except Exception as e:
+        interrupted = True
         print(f"[ОШИБКА] Ошибка при многопоточной загрузке: {e}")
     finally:
         progress_bar.close()
+        output.close()
     
     # Проверка завершенности загрузки и наличия файлов
     file_count = len(os.listdir(output_dir))
@@ -345,6 +921,13 @@ def download_all_declarations(workers=3, per_page=500, use_proxy=False):
     if completed_pages < total_pages:
         print(f"[ПРЕДУПРЕЖДЕНИЕ] Загружено {completed_pages} страниц из {total_pages}. Возможно, не все данные были получены.")
     
+    if not interrupted and error_pages == 0:
+        journal.mark_complete()
+        # Запоминаем последние данные полного обхода для последующей синхронизации
+        save_sync_state(output.max_id, output.newest_date)
+    else:
+        print("[ИНФО] Обход не завершен. Для загрузки недостающих страниц запустите с параметром --resume")
+    
     # Выводим итоговую статистику
     elapsed_time = time.time() - start_time
     minutes, seconds = divmod(int(elapsed_time), 60)
@@ -368,6 +951,83 @@ def download_all_declarations(workers=3, per_page=500, use_proxy=False):
     
     return downloaded_count
 
+def sync_declarations(per_page=500, use_proxy=False, output_format="json", lookback_days=30, pagination="offset"):
+    """Инкрементальная синхронизация: загружает только декларации новее уже известных.
+    
+    Страницы запрашиваются последовательно в порядке убывания certdecltr_id
+    за период от самой поздней известной DocStartDate (минус lookback_days)
+    до сегодняшнего дня. Обход останавливается на первой странице, где
+    встречается уже известный ID; сохраняются только новые записи.
+    """
+    print("="*80)
+    print("Инкрементальная синхронизация деклараций")
+    print("="*80)
+    
+    state = load_sync_state()
+    if state:
+        known_max_id = state.get("max_certdecltr_id")
+        newest_date = parse_item_date(state.get("newest_doc_start_date"))
+    else:
+        print("Файл состояния не найден, определяем последние данные по локальным файлам...")
+        known_max_id, newest_date = rebuild_sync_state_from_local()
+    
+    if known_max_id is None or newest_date is None:
+        print("[ОШИБКА] Локальные данные не найдены. Сначала выполните полную загрузку без --since-last-sync.")
+        return 0
+    
+    date_from = format_api_date(newest_date - timedelta(days=lookback_days))
+    date_to = format_api_date(datetime.now().date())
+    window = {"date_from": date_from, "date_to": date_to}
+    
+    print(f"Последний известный ID: {known_max_id}, последняя дата: {format_api_date(newest_date)}")
+    print(f"Проверяем период {date_from} - {date_to}")
+    
+    if pagination == "keyset" and not check_keyset_support(use_proxy=use_proxy):
+        print("[ПРЕДУПРЕЖДЕНИЕ] API не поддерживает фильтр по certdecltr_id, используется постраничная загрузка")
+        pagination = "offset"
+    
+    start_time = time.time()
+    output = CrawlOutput(datetime.now().strftime("%Y%m%d_%H%M%S"), batch_prefix="declarations_delta", output_format=output_format)
+    new_count = 0
+    page_num = 1
+    before_id = None
+    
+    try:
+        while True:
+            params = build_page_params(page_num, per_page, window, before_id if pagination == "keyset" else None)
+            data = make_request_with_retry(base_url, params, use_proxy=use_proxy)
+            items = data.get("items", [])
+            
+            # Записи отсортированы по убыванию ID: все, что не больше известного, уже есть локально
+            new_items = [item for item in items if item.get("certdecltr_id", 0) > known_max_id]
+            if new_items:
+                output.save_page({"items": new_items, "_meta": data.get("_meta", {})}, page_num)
+                new_count += len(new_items)
+                print(f"[ПРОГРЕСС] Стр. {page_num}: новых записей {len(new_items)}, всего {new_count}")
+            
+            if len(new_items) < len(items) or len(items) < per_page:
+                break
+            
+            before_id = items[-1].get("certdecltr_id")
+            page_num += 1
+    except KeyboardInterrupt:
+        print("\n[ИНФО] Синхронизация прервана пользователем")
+        return new_count
+    finally:
+        output.close()
+    
+    # Состояние обновляем только после успешного завершения, чтобы не пропустить записи
+    save_sync_state(output.max_id, output.newest_date)
+    
+    elapsed_time = time.time() - start_time
+    print("\n" + "="*80)
+    print(f"Новых деклараций: {new_count:,}")
+    print(f"Запрошено страниц: {page_num:,}")
+    print(f"Время выполнения: {format_time(elapsed_time)}")
+    print("="*80)
+    
+    return new_count
+
 def main():
     """Точка входа в модуль"""
     # Парсинг аргументов командной строки
@@ -378,6 +1038,14 @@ def main():
     parser.add_argument('--date-to', type=str, default="31.12.2020", help='Дата окончания периода (по умолчанию: 31.12.2020)')
     parser.add_argument('--proxies', type=str, help='Путь к файлу со списком прокси')
     parser.add_argument('--disable-proxies', action='store_true', help='Отключить использование прокси')
+    parser.add_argument('--engine', choices=['threads', 'async'], default='threads', help='Движок загрузки: threads (пул потоков) или async (asyncio) (по умолчанию: threads)')
+    parser.add_argument('--concurrency', type=int, default=200, help='Максимум запросов в полете для движка async (по умолчанию: 200)')
+    parser.add_argument('--pagination', choices=['offset', 'keyset'], default='offset', help='Пагинация: offset (по номерам страниц) или keyset (по certdecltr_id, с откатом на offset) (по умолчанию: offset)')
+    parser.add_argument('--output-format', choices=['json', 'ndjson', 'ndjson.gz'], default='json', help='Формат сохранения: json (файл на страницу) или ndjson/ndjson.gz (один файл на обход) (по умолчанию: json)')
+    parser.add_argument('--resume', action='store_true', help='Продолжить прерванный обход с теми же параметрами, загрузив только недостающие страницы')
+    parser.add_argument('--since-last-sync', action='store_true', help='Загрузить только декларации, появившиеся после последней синхронизации')
+    parser.add_argument('--sync-lookback-days', type=int, default=30, help='На сколько дней раньше последней известной даты начинать проверку при синхронизации (по умолчанию: 30)')
+    parser.add_argument('--shard-size', type=int, default=0, help='Делить период на шарды по датам не больше указанного числа записей (0 - не делить, по умолчанию: 0)')
     args = parser.parse_args()
     
     # Обновляем параметры запроса на основе аргументов командной строки
@@ -391,7 +1059,25 @@ def main():
             use_proxy = True
     
     try:
-        return download_all_declarations(workers=args.workers, per_page=args.per_page, use_proxy=use_proxy)
+        if args.since_last_sync:
+            return sync_declarations(
+                per_page=args.per_page,
+                use_proxy=use_proxy,
+                output_format=args.output_format,
+                lookback_days=args.sync_lookback_days,
+                pagination=args.pagination
+            )
+        return download_all_declarations(
+            workers=args.workers,
+            per_page=args.per_page,
+            use_proxy=use_proxy,
+            engine=args.engine,
+            concurrency=args.concurrency,
+            shard_size=args.shard_size,
+            pagination=args.pagination,
+            output_format=args.output_format,
+            resume=args.resume
+        )
     except Exception as e:
         print(f"[ОШИБКА] Ошибка при выполнении программы: {e}")
         return 0
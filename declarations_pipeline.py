@@ -0,0 +1,262 @@
+import argparse
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import declarations_downloader as list_downloader
+import declaration_details_downloader as details_downloader
+from declaration_details_downloader import update_status_line, save_to_json, format_time
+
+# Размер очереди ID между этапами по умолчанию: если загрузка деталей отстает,
+# обход списка приостанавливается, а не накапливает ID в памяти
+DEFAULT_QUEUE_SIZE = 5000
+
+def run_pipeline(workers=50, list_workers=3, per_page=500, list_use_proxy=False, engine="threads", concurrency=200,
+                 shard_size=0, pagination="offset", output_format="json", resume=False, queue_size=DEFAULT_QUEUE_SIZE,
+                 initial_delay=2.0, max_retries=3, proxy_timeout=300, revalidate=True, hedge_quantile=None, hedge_budget=0.05,
+                 save_mode="json"):
+    """Совмещенный режим: записи каждой страницы списка сразу передаются загрузчику деталей.
+
+    Обход списка выполняется в отдельном потоке, его страницы через
+    ограниченную очередь раздают ID потокам загрузки деталей, поэтому оба
+    этапа идут одновременно и общее время близко к длительности более
+    долгого из них.
+    """
+    if not details_downloader.proxy_list:
+        print("[ОШИБКА] Для загрузки деталей требуются прокси-серверы. Завершаем работу.")
+        return 0
+
+    detail_workers = min(len(details_downloader.proxy_list), workers)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    batch_folder = os.path.join(details_downloader.output_dir, f"batch_{timestamp}")
+    os.makedirs(batch_folder, exist_ok=True)
+
+    print("=" * 80)
+    print("Совмещенная загрузка списка и деталей деклараций")
+    print("=" * 80)
+    print(f"Потоков загрузки деталей: {detail_workers}, размер очереди ID: {queue_size}")
+    print(f"Детали сохраняются в {batch_folder}")
+
+    # Уже загруженные детали не запрашиваем повторно
+    completed_ids = details_downloader.find_completed_ids() if resume else set()
+    if completed_ids:
+        print(f"Пропускаем {len(completed_ids)} уже загруженных деклараций")
+
+    # Ранее загруженные детали запрашиваются условно и не перезаписываются, если не изменились
+    cache = details_downloader.ValidatorCache(details_downloader.output_dir) if revalidate else None
+
+    # Медленные запросы деталей дублируются через второй прокси
+    hedge_policy = details_downloader.HedgePolicy(quantile=hedge_quantile, budget=hedge_budget) if hedge_quantile else None
+
+    # Неудачи сразу записываются в постоянное хранилище (повтор: declaration_details_downloader --retry-failed)
+    dead_letters = details_downloader.DeadLetterStore(details_downloader.output_dir)
+
+    id_queue = queue.Queue(maxsize=queue_size)
+    seen_ids = set(completed_ids)
+    seen_lock = threading.Lock()
+    stats_lock = threading.Lock()
+    results = []
+    counters = {"queued": 0, "completed": 0, "success": 0, "errors": 0}
+    list_done = threading.Event()
+    stop_event = threading.Event()
+    start_time = time.time()
+
+    def on_items(items):
+        # Вызывается потоком обхода после сохранения страницы
+        if stop_event.is_set():
+            # Загрузка деталей остановлена - очередь больше никто не разбирает
+            return
+        new_ids = []
+        with seen_lock:
+            for item in items:
+                declaration_id = item.get("certdecltr_id")
+                if declaration_id and declaration_id not in seen_ids:
+                    seen_ids.add(declaration_id)
+                    new_ids.append(declaration_id)
+        for declaration_id in new_ids:
+            # Блокируется, если очередь заполнена
+            id_queue.put(declaration_id)
+        with stats_lock:
+            counters["queued"] += len(new_ids)
+
+    def on_result(result):
+        dead_letters.record_result(result)
+        with stats_lock:
+            results.append(result)
+            counters["completed"] += 1
+            if result["success"]:
+                counters["success"] += 1
+            else:
+                counters["errors"] += 1
+
+            # Строку статуса выводим только после обхода, чтобы не мешать его прогресс-бару
+            if list_done.is_set():
+                elapsed = time.time() - start_time
+                speed = counters["completed"] / elapsed * 60 if elapsed > 0 else 0.0
+                update_status_line(counters["completed"], counters["queued"], counters["success"],
+                                   counters["errors"], rate=speed)
+
+    threads = details_downloader.run_details_workers(
+        id_queue,
+        batch_folder,
+        detail_workers,
+        max_retries=max_retries,
+        initial_delay=initial_delay,
+        proxy_timeout=proxy_timeout,
+        on_result=on_result,
+        cache=cache,
+        hedge_policy=hedge_policy,
+        save_mode=save_mode,
+        stop_event=stop_event
+    )
+
+    def crawl_list():
+        try:
+            list_downloader.download_all_declarations(
+                workers=list_workers,
+                per_page=per_page,
+                use_proxy=list_use_proxy,
+                engine=engine,
+                concurrency=concurrency,
+                shard_size=shard_size,
+                pagination=pagination,
+                output_format=output_format,
+                resume=resume,
+                on_items=on_items
+            )
+        except Exception as e:
+            print(f"[ОШИБКА] Ошибка при загрузке списка деклараций: {e}")
+        finally:
+            list_done.set()
+
+    list_thread = threading.Thread(target=crawl_list)
+    list_thread.daemon = True
+    list_thread.start()
+
+    try:
+        # join с таймаутом, чтобы Ctrl+C обрабатывался в главном потоке
+        while list_thread.is_alive():
+            list_thread.join(0.5)
+
+        print(f"\nОбход списка завершен, ожидаем загрузку оставшихся {id_queue.qsize()} деклараций...")
+
+        # Сигнал завершения для каждого потока загрузки деталей
+        for _ in threads:
+            id_queue.put(None)
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
+    except KeyboardInterrupt:
+        print("\nПрервано пользователем. Ожидаем завершения текущих запросов...")
+        details_downloader.stop_details_workers(threads, stop_event)
+
+    total_elapsed = time.time() - start_time
+    if cache:
+        cache.close()
+    dead_letters.close()
+
+    with stats_lock:
+        report_data = {
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "total_ids": counters["queued"],
+            "completed": counters["completed"],
+            "success": counters["success"],
+            "errors": counters["errors"],
+            "not_modified": sum(1 for r in results if r.get("not_modified")),
+            "bytes_received": sum(r.get("bytes", 0) for r in results),
+            "time_elapsed": total_elapsed,
+            "results": list(results)
+        }
+        if hedge_policy:
+            report_data["hedging"] = hedge_policy.get_stats()
+    save_to_json(report_data, os.path.join(batch_folder, "download_report.json"))
+
+    print("\n" + "=" * 80)
+    print("РЕЗУЛЬТАТЫ СОВМЕЩЕННОЙ ЗАГРУЗКИ")
+    print("=" * 80)
+    print(f"ID получено из списка: {report_data['total_ids']}")
+    print(f"Успешно загружено деталей: {report_data['success']}")
+    print(f"Ошибок: {report_data['errors']}")
+    if report_data['errors']:
+        print(f"Неудачные загрузки записаны в {dead_letters.path}")
+    if cache:
+        print(f"Не изменились с прошлой загрузки: {report_data['not_modified']}")
+    print(f"Получено данных: {report_data['bytes_received'] / (1024 * 1024):.1f} МБ")
+    if hedge_policy:
+        print(f"Дублированных запросов: {report_data['hedging']['hedges']}, дубль ответил первым: {report_data['hedging']['hedge_wins']}")
+    print(f"Общее время выполнения: {format_time(total_elapsed)}")
+    print("=" * 80)
+
+    # История прокси пригодится следующему запуску
+    details_downloader.save_proxy_reputation()
+
+    return report_data["success"]
+
+if __name__ == "__main__":
+    # Парсинг аргументов командной строки
+    parser = argparse.ArgumentParser(description='Совмещенная загрузка списка деклараций и их деталей')
+    parser.add_argument('--date-from', type=str, default="01.01.2020", help='Дата начала периода (по умолчанию: 01.01.2020)')
+    parser.add_argument('--date-to', type=str, default="31.12.2020", help='Дата окончания периода (по умолчанию: 31.12.2020)')
+    parser.add_argument('--per-page', type=int, default=500, help='Количество записей на странице списка (по умолчанию: 500)')
+    parser.add_argument('--list-workers', type=int, default=3, help='Количество потоков загрузки списка (по умолчанию: 3)')
+    parser.add_argument('--engine', choices=['threads', 'async'], default='threads', help='Движок загрузки списка: threads или async (по умолчанию: threads)')
+    parser.add_argument('--concurrency', type=int, default=200, help='Максимум запросов в полете для движка async (по умолчанию: 200)')
+    parser.add_argument('--pagination', choices=['offset', 'keyset'], default='offset', help='Пагинация списка: offset или keyset (по умолчанию: offset)')
+    parser.add_argument('--shard-size', type=int, default=0, help='Делить период на шарды по датам не больше указанного числа записей (0 - не делить, по умолчанию: 0)')
+    parser.add_argument('--output-format', choices=['json', 'ndjson', 'ndjson.gz'], default='json', help='Формат сохранения списка (по умолчанию: json)')
+    parser.add_argument('--resume', action='store_true', help='Продолжить прерванный обход списка и пропустить уже загруженные детали')
+    parser.add_argument('--workers', type=int, default=50, help='Максимальное количество одновременных запросов деталей (по умолчанию: 50)')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help=f'Максимальное количество ID в очереди между этапами (по умолчанию: {DEFAULT_QUEUE_SIZE})')
+    parser.add_argument('--no-revalidate', action='store_true', help='Не использовать условные запросы: всегда загружать и сохранять детали полностью')
+    parser.add_argument('--save-mode', choices=details_downloader.SAVE_MODES, default='json', help='Сохранение деталей: json (разобрать и записать с отступами), raw (записать ответ как есть), gzip (как raw, сжатым в .json.gz) (по умолчанию: json)')
+    parser.add_argument('--hedge', action='store_true', help='Дублировать через второй прокси запросы деталей, которые идут дольше квантиля времени ответа пула')
+    parser.add_argument('--hedge-quantile', type=float, default=0.95, help='Квантиль времени ответа, после которого запрос дублируется (по умолчанию: 0.95)')
+    parser.add_argument('--hedge-budget', type=float, default=0.05, help='Максимальная доля дополнительных запросов при дублировании (по умолчанию: 0.05)')
+    parser.add_argument('--proxies', type=str, help='Путь к файлу со списком прокси-серверов (один прокси на строку)')
+    parser.add_argument('--disable-list-proxies', action='store_true', help='Загружать список без прокси (прокси используются только для деталей)')
+    parser.add_argument('--delay', type=float, default=2.0, help='Начальная задержка между запросами в секундах при ошибке (по умолчанию: 2.0)')
+    parser.add_argument('--max-retries', type=int, default=3, help='Максимальное количество повторных попыток при ошибке (по умолчанию: 3)')
+    parser.add_argument('--proxy-timeout', type=int, default=300, help='Время деактивации прокси после частых ошибок в секундах (по умолчанию: 300)')
+    parser.add_argument('--proxy-reputation', type=str, default=details_downloader.REPUTATION_FILENAME, help=f'Файл истории прокси для загрузки деталей (по умолчанию: {details_downloader.REPUTATION_FILENAME})')
+    parser.add_argument('--no-proxy-reputation', action='store_true', help='Не загружать и не сохранять историю прокси')
+    args = parser.parse_args()
+
+    if args.hedge and not 0 < args.hedge_quantile < 1:
+        parser.error("--hedge-quantile должен быть в интервале (0, 1)")
+
+    list_downloader.default_params["filter[DocStartDate][gte]"] = args.date_from
+    list_downloader.default_params["filter[DocStartDate][lte]"] = args.date_to
+
+    list_use_proxy = False
+    if args.proxies:
+        details_downloader.proxy_reputation_file = None if args.no_proxy_reputation else args.proxy_reputation
+        details_downloader.load_proxies(args.proxies)
+        if not args.disable_list_proxies and list_downloader.load_proxies(args.proxies):
+            list_use_proxy = True
+
+    try:
+        run_pipeline(
+            workers=args.workers,
+            list_workers=args.list_workers,
+            per_page=args.per_page,
+            list_use_proxy=list_use_proxy,
+            engine=args.engine,
+            concurrency=args.concurrency,
+            shard_size=args.shard_size,
+            pagination=args.pagination,
+            output_format=args.output_format,
+            resume=args.resume,
+            queue_size=args.queue_size,
+            initial_delay=args.delay,
+            max_retries=args.max_retries,
+            proxy_timeout=args.proxy_timeout,
+            revalidate=not args.no_revalidate,
+            hedge_quantile=args.hedge_quantile if args.hedge else None,
+            hedge_budget=args.hedge_budget,
+            save_mode=args.save_mode
+        )
+    except Exception as e:
+        print(f"[ОШИБКА] Ошибка при выполнении программы: {e}")
@@ -0,0 +1,80 @@
+import json
+import os
+
+from refresh_planner import iter_light_rows, get_light_value, parse_date_value
+
+# Код статуса действующей декларации (как в DocStatusDetails.DocStatusCode)
+ACTIVE_STATUS_CODE = "01"
+
+def load_light_index(source_dir):
+    """Возвращает последнюю версию строки легкого списка для каждого ID"""
+    rows = {}
+    for row in iter_light_rows(source_dir):
+        declaration_id = row.get("certdecltr_id")
+        if declaration_id:
+            rows[declaration_id] = row
+    return rows
+
+def load_last_report_successes(details_dir):
+    """Возвращает ID, успешно загруженные по последнему отчету download_report.json"""
+    batch_dirs = sorted(
+        (d for d in os.listdir(details_dir) if d.startswith("batch_")),
+        reverse=True
+    )
+    for dirname in batch_dirs:
+        report_file = os.path.join(details_dir, dirname, "download_report.json")
+        if not os.path.exists(report_file):
+            continue
+        try:
+            with open(report_file, 'r', encoding='utf-8') as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            continue
+        return {r["id"] for r in report.get("results", []) if r.get("success")}
+    return set()
+
+def newest_first(declaration_id, context):
+    """Сначала декларации с самой поздней DocStartDate; без даты - в конце"""
+    row = context["rows"].get(declaration_id, {})
+    start_date = parse_date_value(get_light_value(row, ("DocStartDate",), "DocStartDate"))
+    return -start_date.toordinal() if start_date else 0
+
+def active_first(declaration_id, context):
+    """Сначала действующие декларации"""
+    row = context["rows"].get(declaration_id, {})
+    status_code = get_light_value(row, ("DocStatusDetails", "DocStatusCode"), "DocStatusCode")
+    return 0 if status_code == ACTIVE_STATUS_CODE else 1
+
+def missing_first(declaration_id, context):
+    """Сначала декларации, которых нет среди успешно загруженных в последнем отчете"""
+    return 1 if declaration_id in context["report_successes"] else 0
+
+# Доступные ключи приоритета; их можно сочетать, например "missing,active,newest"
+PRIORITY_KEYS = {
+    "newest": newest_first,
+    "active": active_first,
+    "missing": missing_first,
+}
+
+def order_declaration_ids(declaration_ids, priority, source_dir, details_dir):
+    """Упорядочивает ID по ключам приоритета, перечисленным через запятую.
+
+    Сортировка устойчивая: при равных ключах сохраняется исходный порядок
+    (в том числе перемешанный). Строки легкого списка и отчет читаются,
+    только если нужны выбранным ключам.
+    """
+    key_names = [name.strip() for name in priority.split(",") if name.strip()]
+    unknown = [name for name in key_names if name not in PRIORITY_KEYS]
+    if unknown:
+        raise ValueError(f"Неизвестный ключ приоритета: {', '.join(unknown)} (доступны: {', '.join(PRIORITY_KEYS)})")
+    if not key_names:
+        return list(declaration_ids)
+
+    context = {"rows": {}, "report_successes": set()}
+    if {"newest", "active"} & set(key_names) and os.path.isdir(source_dir):
+        context["rows"] = load_light_index(source_dir)
+    if "missing" in key_names and os.path.isdir(details_dir):
+        context["report_successes"] = load_last_report_successes(details_dir)
+
+    key_functions = [PRIORITY_KEYS[name] for name in key_names]
+    return sorted(declaration_ids, key=lambda i: tuple(key(i, context) for key in key_functions))
@@ -0,0 +1,88 @@
+import gzip
+import json
+import os
+import re
+import threading
+
+# Режимы сохранения деталей:
+# json - разобрать ответ и записать его с отступами (как раньше),
+# raw - записать тело ответа как есть, без разбора и повторной сериализации,
+# gzip - то же, что raw, но в сжатый файл <ID>.json.gz
+SAVE_MODES = ("json", "raw", "gzip")
+
+# Расширения файлов с деталями деклараций
+DETAILS_EXTENSIONS = (".json", ".json.gz")
+
+REPORT_FILENAME = "download_report.json"
+
+# Номер документа ищется в теле ответа без полного разбора JSON
+DOC_ID_PATTERN = re.compile(rb'"DocId"\s*:\s*(?:"((?:[^"\\]|\\.)*)"|(-?\d+))')
+
+def is_details_file(filename):
+    """Проверяет, что файл в каталоге батча - сохраненные детали декларации, а не отчет"""
+    return filename.endswith(DETAILS_EXTENSIONS) and filename != REPORT_FILENAME
+
+def get_details_id(filename):
+    """Возвращает ID декларации по имени файла деталей; ValueError, если имя не числовое"""
+    return int(filename.split(".")[0])
+
+def get_details_filename(declaration_id, save_mode="json"):
+    return f"{declaration_id}.json.gz" if save_mode == "gzip" else f"{declaration_id}.json"
+
+def open_details_file(path, mode="r", compressed=None):
+    """Открывает файл деталей в текстовом режиме; файлы .gz (или при compressed=True) - через gzip"""
+    if compressed is None:
+        compressed = path.endswith(".gz")
+    if compressed:
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+def looks_like_json_object(content):
+    """Быстрая проверка тела ответа: непустой JSON-объект начинается с { и заканчивается }"""
+    content = content.strip()
+    return len(content) >= 2 and content[:1] == b"{" and content[-1:] == b"}"
+
+def scan_doc_id(content):
+    """Находит DocId в теле ответа без разбора всего документа"""
+    match = DOC_ID_PATTERN.search(content)
+    if not match:
+        return "Unknown"
+    if match.group(2) is not None:
+        return int(match.group(2))
+    try:
+        # Разбираем только саму строку, чтобы раскрыть экранированные символы
+        return json.loads(b'"' + match.group(1) + b'"')
+    except ValueError:
+        return "Unknown"
+
+def get_temp_path(path):
+    """Имя временного файла рядом с path, свое для каждого потока.
+
+    Основной и дублирующий запрос одной декларации могут записывать ее
+    одновременно: каждый пишет в свой временный файл и затем атомарно
+    заменяет им итоговый, поэтому файл деталей никогда не бывает смешанным
+    или недописанным.
+    """
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+def replace_with_temp(path, write):
+    """Вызывает write(temp_path) и атомарно переименовывает временный файл в path"""
+    temp_path = get_temp_path(path)
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def write_raw_details(content, path, compress=False):
+    """Записывает тело ответа в файл как есть (или сжатым) через временный файл"""
+    def write(temp_path):
+        if compress:
+            with gzip.open(temp_path, "wb", compresslevel=6) as f:
+                f.write(content)
+        else:
+            with open(temp_path, "wb") as f:
+                f.write(content)
+    replace_with_temp(path, write)
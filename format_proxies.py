@@ -1,6 +1,7 @@
 import os
 import sys
 import chardet
+from proxy_model import Proxy
 
 def format_proxies(input_file, output_file=None, proxy_type='socks5'):
     """
@@ -67,33 +68,11 @@ def format_proxies(input_file, output_file=None, proxy_type='socks5'):
                 formatted_proxies.append(proxy)
                 continue
             
-            # Убираем префикс с протоколом, если есть
-            if '://' in proxy:
-                proxy = proxy.split('://', 1)[1]
-            
-            # Разбиваем строку прокси на компоненты
-            parts = proxy.split(':')
-            if len(parts) == 2:
-                # Формат IP:PORT
-                ip, port = parts
-                formatted_proxy = f"{proxy_type}://{ip}:{port}"
-            elif len(parts) == 4:
-                # Формат IP:PORT:LOGIN:PASSWORD
-                ip, port, login, password = parts
-                formatted_proxy = f"{proxy_type}://{login}:{password}@{ip}:{port}"
-            else:
-                # Пробуем извлечь логин/пароль в формате IP:PORT@LOGIN:PASSWORD
-                if '@' in proxy:
-                    auth_parts = proxy.split('@')
-                    if len(auth_parts) == 2:
-                        credentials, address = auth_parts
-                        if ':' in address and ':' in credentials:
-                            login, password = credentials.split(':', 1)
-                            ip, port = address.split(':', 1)
-                            formatted_proxy = f"{proxy_type}://{login}:{password}@{ip}:{port}"
-                            formatted_proxies.append(formatted_proxy)
-                            continue
-                
+            # Разбор общий с загрузчиками: IP:PORT, IP:PORT:LOGIN:PASSWORD,
+            # LOGIN:PASSWORD@IP:PORT и IP:PORT@LOGIN:PASSWORD (протокол отбрасывается)
+            try:
+                formatted_proxy = Proxy.parse(proxy).format(proxy_type)
+            except ValueError:
                 print(f"[ПРЕДУПРЕЖДЕНИЕ] Неподдерживаемый формат прокси: {proxy}")
                 continue
                 
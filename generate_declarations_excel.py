@@ -9,6 +9,8 @@ from openpyxl.styles import Alignment
 import re
 import argparse
 
+from details_storage import is_details_file, open_details_file
+
 
 def extract_date_from_filename(filename):
     """Извлекает дату из имени файла или директории с батчем"""
@@ -58,9 +60,9 @@ def find_declaration_files(base_dir="declarations_details"):
     batch_dirs = glob.glob(os.path.join(base_dir, "batch_*"))
     
     for batch_dir in sorted(batch_dirs, key=extract_date_from_filename):
-        # Ищем все JSON файлы в каждой поддиректории (кроме файлов отчетов)
-        json_files = [f for f in glob.glob(os.path.join(batch_dir, "*.json")) 
-                     if not f.endswith("download_report.json")]
+        # Ищем все JSON файлы (в том числе сжатые .json.gz) в каждой поддиректории (кроме файлов отчетов)
+        json_files = [os.path.join(batch_dir, f) for f in sorted(os.listdir(batch_dir))
+                     if is_details_file(f)]
         
         # Добавляем все файлы в список
         declaration_files.extend(json_files)
@@ -109,7 +111,7 @@ def get_value_safely(data, *keys, default=""):
 def extract_declaration_data(file_path):
     """Извлекает необходимые данные из JSON файла декларации"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
+        with open_details_file(file_path) as f:
             try:
                 data = json.load(f)
             except json.JSONDecodeError:
@@ -305,7 +307,7 @@ def process_declaration_files(files, batch_size=1000, output_dir="batch_results"
     if debug_mode and files:
         print(f"ОТЛАДКА: Подробный анализ файла {files[0]}")
         try:
-            with open(files[0], 'r', encoding='utf-8') as f:
+            with open_details_file(files[0]) as f:
                 data = json.load(f)
                 print(json.dumps(data, indent=2, ensure_ascii=False)[:1000] + "...")
                 
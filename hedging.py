@@ -0,0 +1,79 @@
+import threading
+import time
+
+# Сколько последних успешных ответов учитывается при расчете порога
+LATENCY_WINDOW = 1000
+
+class HedgePolicy:
+    """Решает, когда дублировать медленный запрос через второй прокси.
+
+    Порог - квантиль (p90/p95) времени ответа по всему пулу прокси за
+    последние LATENCY_WINDOW успешных запросов. Если запрос идет дольше
+    порога, тот же ID отправляется через другой прокси; побеждает первый
+    ответ. Бюджет ограничивает долю дублей: не больше budget от числа
+    основных запросов (0.05 - не больше 5% дополнительной нагрузки).
+    """
+    def __init__(self, quantile=0.95, budget=0.05, min_samples=50, min_delay=0.2, refresh_interval=1.0):
+        self.quantile = quantile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+        # Порог пересчитывается не чаще refresh_interval, чтобы не сортировать окно на каждый запрос
+        self.delay = None
+        self.refreshed_at = 0
+
+    def get_delay(self, get_samples):
+        """Возвращает порог в секундах или None, пока статистики недостаточно.
+
+        get_samples - функция, возвращающая список последних времен ответа;
+        вызывается только при пересчете порога.
+        """
+        now = time.monotonic()
+        with self.lock:
+            if now - self.refreshed_at < self.refresh_interval:
+                return self.delay
+            self.refreshed_at = now
+
+        samples = sorted(get_samples())
+        delay = None
+        if len(samples) >= self.min_samples:
+            index = min(len(samples) - 1, int(len(samples) * self.quantile))
+            delay = max(self.min_delay, samples[index])
+
+        with self.lock:
+            self.delay = delay
+        return delay
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def try_hedge(self):
+        """Резервирует дубль, если бюджет позволяет; возвращает True, если дубль можно отправить"""
+        with self.lock:
+            if self.hedges + 1 > self.budget * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def count_hedge_win(self):
+        with self.lock:
+            self.hedge_wins += 1
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "quantile": self.quantile,
+                "budget": self.budget,
+                "delay": round(self.delay, 3) if self.delay is not None else None,
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins
+            }
@@ -0,0 +1,144 @@
+import ssl
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+import urllib3
+from urllib3.util.ssl_ import create_urllib3_context
+
+try:
+    import aiohttp
+except ImportError:  # Асинхронные сессии доступны только при установленном aiohttp
+    aiohttp = None
+
+try:
+    from aiohttp_socks import ProxyConnector
+except ImportError:  # Без aiohttp_socks SOCKS-прокси в асинхронном режиме не поддерживаются
+    ProxyConnector = None
+
+# Отключаем предупреждения для незащищенных запросов
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# Параметры пулов соединений по умолчанию
+POOL_CONNECTIONS = 10   # Количество пулов (хостов) в одной сессии
+POOL_MAXSIZE = 64       # Максимум соединений к одному хосту в пуле
+ASYNC_LIMIT_PER_SESSION = 100  # Максимум соединений в одной асинхронной сессии
+ASYNC_KEEPALIVE_TIMEOUT = 60   # Время жизни простаивающего соединения в секундах
+
+# Общий SSL-контекст: создается один раз на процесс и разделяется всеми
+# соединениями, поэтому загрузка настроек TLS не повторяется для каждого
+# нового сокета. Проверка сертификата отключена, как и во всех загрузчиках.
+SSL_CONTEXT = create_urllib3_context(cert_reqs=ssl.CERT_NONE)
+SSL_CONTEXT.check_hostname = False
+SSL_CONTEXT.verify_mode = ssl.CERT_NONE
+
+# Долгоживущие сессии, по одной на каждый прокси (ключ None - прямые запросы)
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTP-адаптер с настроенным пулом соединений и общим SSL-контекстом"""
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["ssl_context"] = SSL_CONTEXT
+        return super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        # Менеджер прокси кэшируется адаптером, поэтому туннель CONNECT
+        # и TLS-соединение внутри него переиспользуются между запросами
+        proxy_kwargs["ssl_context"] = SSL_CONTEXT
+        return super().proxy_manager_for(proxy, **proxy_kwargs)
+
+def _create_session():
+    """Создает сессию requests с keep-alive и настроенным пулом соединений"""
+    session = requests.Session()
+    adapter = PooledHTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        max_retries=0,   # Повторы выполняют сами загрузчики
+        pool_block=False
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.verify = False
+    return session
+
+def get_proxy_key(proxies):
+    """Возвращает ключ сессии для словаря прокси requests"""
+    if not proxies:
+        return None
+    return proxies.get("https") or proxies.get("http")
+
+def get_session(proxy_key=None):
+    """Возвращает долгоживущую сессию для указанного прокси, создавая ее при необходимости"""
+    session = _sessions.get(proxy_key)
+    if session is not None:
+        return session
+
+    with _sessions_lock:
+        session = _sessions.get(proxy_key)
+        if session is None:
+            session = _create_session()
+            _sessions[proxy_key] = session
+        return session
+
+def http_get(url, params=None, headers=None, proxies=None, timeout=30, **kwargs):
+    """Выполняет GET-запрос через пул сессий, переиспользуя соединения с сервером и прокси"""
+    session = get_session(get_proxy_key(proxies))
+    return session.get(
+        url,
+        params=params,
+        headers=headers,
+        proxies=proxies,
+        verify=False,
+        timeout=timeout,
+        **kwargs
+    )
+
+def close_all_sessions():
+    """Закрывает все сессии и соединения в пулах"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+class AsyncSessionPool:
+    """Пул сессий aiohttp: одна долгоживущая сессия на каждый прокси"""
+    def __init__(self, limit_per_session=ASYNC_LIMIT_PER_SESSION):
+        if aiohttp is None:
+            raise RuntimeError("Для асинхронного режима требуется пакет aiohttp: pip install aiohttp")
+        self.limit_per_session = limit_per_session
+        self.sessions = {}
+
+    def _create_connector(self, proxy_url):
+        """Создает коннектор с keep-alive и общим SSL-контекстом"""
+        if proxy_url and proxy_url.lower().startswith("socks"):
+            if ProxyConnector is None:
+                raise RuntimeError("Для SOCKS прокси в асинхронном режиме установите пакет aiohttp-socks")
+            return ProxyConnector.from_url(
+                proxy_url,
+                ssl=SSL_CONTEXT,
+                limit=self.limit_per_session,
+                keepalive_timeout=ASYNC_KEEPALIVE_TIMEOUT
+            )
+        return aiohttp.TCPConnector(
+            ssl=SSL_CONTEXT,
+            limit=self.limit_per_session,
+            keepalive_timeout=ASYNC_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300
+        )
+
+    def get_session(self, proxy_url=None):
+        """Возвращает сессию и адрес HTTP-прокси для запроса (None для SOCKS и прямых запросов)"""
+        session = self.sessions.get(proxy_url)
+        if session is None:
+            session = aiohttp.ClientSession(connector=self._create_connector(proxy_url))
+            self.sessions[proxy_url] = session
+
+        # SOCKS-прокси уже встроен в коннектор, HTTP-прокси передается в каждом запросе
+        if proxy_url and not proxy_url.lower().startswith("socks"):
+            return session, proxy_url
+        return session, None
+
+    async def close(self):
+        for session in self.sessions.values():
+            await session.close()
+        self.sessions.clear()
@@ -0,0 +1,115 @@
+import gzip
+import json
+import os
+import threading
+import zlib
+
+# Расширения файлов NDJSON (одна запись JSON на строку)
+NDJSON_EXTENSIONS = (".ndjson", ".ndjson.gz")
+
+def is_ndjson_file(filename):
+    """Проверяет, является ли файл NDJSON (в том числе сжатым)"""
+    return filename.endswith(NDJSON_EXTENSIONS)
+
+def get_part_path(path, part):
+    """Имя части NDJSON-файла: declarations_X.ndjson.gz -> declarations_X.partN.ndjson.gz"""
+    for extension in sorted(NDJSON_EXTENSIONS, key=len, reverse=True):
+        if path.endswith(extension):
+            return f"{path[:-len(extension)]}.part{part}{extension}"
+    return f"{path}.part{part}"
+
+def get_part_paths(path):
+    """Существующие части файла: сам файл и его продолжения .partN по порядку"""
+    paths = [path] if os.path.exists(path) else []
+    part = 1
+    while os.path.exists(get_part_path(path, part)):
+        paths.append(get_part_path(path, part))
+        part += 1
+    return paths
+
+def get_next_part_path(path):
+    """Файл для новых записей: сам path, если его еще нет, иначе следующая свободная часть.
+
+    В существующий файл не дописываем: после аварийного завершения его
+    последний gzip-блок оборван, и все, что дописано после него, читается
+    уже с ошибкой.
+    """
+    if not os.path.exists(path):
+        return path
+    return get_part_path(path, len(get_part_paths(path)))
+
+def open_ndjson(path, mode="r"):
+    """Открывает NDJSON-файл в текстовом режиме; файлы .gz открываются через gzip"""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+class NdjsonSink:
+    """Потокобезопасный приемник записей, дописывающий их в NDJSON-файл.
+
+    Каждая запись сериализуется в одну компактную строку без отступов,
+    поэтому страницы можно записывать по мере поступления из любого
+    количества потоков, а читать файл потом последовательно, строка за строкой.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.count = 0
+        # Файл открывается при первой записи, чтобы пустые обходы не оставляли пустых файлов
+        self.file = None
+        self.closed = False
+
+    def write_items(self, items):
+        """Дописывает список записей в файл, по одной на строку.
+
+        После close записи отбрасываются: так поток, завершивший запрос уже
+        после остановки загрузки, не падает на закрытом файле.
+        """
+        if not items:
+            return
+
+        # Сериализацию выполняем до захвата блокировки
+        chunk = "".join(json.dumps(item, ensure_ascii=False, separators=(",", ":")) + "\n" for item in items)
+        with self.lock:
+            if self.closed:
+                return
+            if self.file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self.file = open_ndjson(self.path, "a")
+            self.file.write(chunk)
+            self.file.flush()
+            self.count += len(items)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            if self.file is not None and not self.file.closed:
+                self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def iter_ndjson_items(path):
+    """Построчно читает NDJSON-файл и возвращает записи по одной.
+
+    Поврежденные строки (например, недописанная последняя строка после
+    аварийного завершения) пропускаются. Если оборван или поврежден сжатый
+    файл, возвращаются записи до места повреждения.
+    """
+    with open_ndjson(path, "r") as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+        except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+            # Сжатый файл оборван или поврежден - читаем то, что успели записать
+            print(f"[ПРЕДУПРЕЖДЕНИЕ] Конец файла {path} не читается ({e}), используются записи до повреждения")
+            return
@@ -0,0 +1,140 @@
+import concurrent.futures
+import json
+import socket
+import time
+
+import requests
+import urllib3
+
+# Отключаем предупреждения о небезопасных SSL соединениях
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# Количество прокси, проверяемых одновременно
+DEFAULT_CHECK_WORKERS = 200
+
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+def measure_connect_time(proxy, timeout=10):
+    """Время установки TCP-соединения с самим прокси в секундах"""
+    start_time = time.perf_counter()
+    with socket.create_connection((proxy.host, proxy.port), timeout=timeout):
+        return time.perf_counter() - start_time
+
+def check_proxy(proxy, target_url, timeout=10, headers=None):
+    """Проверяет работу прокси (proxy_model.Proxy) для доступа к целевому URL.
+
+    Кроме результата замеряются время соединения с прокси (connect_time),
+    время до первого байта ответа (ttfb), полное время запроса и скорость
+    получения тела ответа (throughput, байт/сек). Для каждой проверки
+    создается отдельная сессия, чтобы соединение не переиспользовалось.
+    """
+    result = {
+        "proxy": str(proxy),
+        "label": proxy.label,
+        "success": False,
+        "status_code": None,
+        "connect_time": None,
+        "ttfb": None,
+        "time": None,
+        "response_size": 0,
+        "throughput": None,
+        "error": None
+    }
+
+    try:
+        result["connect_time"] = measure_connect_time(proxy, timeout)
+
+        with requests.Session() as session:
+            start_time = time.perf_counter()
+            # stream=True: запрос возвращается после получения заголовков ответа
+            response = session.get(
+                target_url,
+                proxies=proxy.proxies,
+                timeout=timeout,
+                verify=False,  # Отключаем проверку SSL сертификата
+                headers=headers or {"User-Agent": DEFAULT_USER_AGENT},
+                stream=True
+            )
+            result["ttfb"] = time.perf_counter() - start_time
+            content = response.content
+            result["time"] = time.perf_counter() - start_time
+
+        result["status_code"] = response.status_code
+        result["success"] = response.status_code == 200
+        result["response_size"] = len(content)
+        read_time = result["time"] - result["ttfb"]
+        if content and read_time > 0:
+            result["throughput"] = len(content) / read_time
+        if not result["success"]:
+            result["error"] = f"Статус {response.status_code}"
+    except requests.exceptions.ProxyError as e:
+        result["error"] = f"Ошибка прокси: {e}"
+    except requests.exceptions.ConnectTimeout:
+        result["error"] = "Таймаут соединения"
+    except requests.exceptions.ReadTimeout:
+        result["error"] = "Таймаут чтения"
+    except socket.timeout:
+        result["error"] = "Таймаут сокета"
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+def check_proxies(proxies, target_url, timeout=10, workers=DEFAULT_CHECK_WORKERS, headers=None, on_result=None):
+    """Проверяет прокси параллельно, не более workers одновременно.
+
+    on_result вызывается в вызывающем потоке по мере готовности каждого
+    результата (например, для прогресс-бара). Возвращает список результатов
+    check_proxy в порядке завершения.
+    """
+    results = []
+    if not proxies:
+        return results
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(workers, len(proxies)))) as executor:
+        futures = [
+            executor.submit(check_proxy, proxy, target_url, timeout, headers)
+            for proxy in proxies
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if on_result:
+                on_result(result)
+    return results
+
+def rank_results(results):
+    """Упорядочивает результаты: рабочие прокси по времени до первого байта, затем нерабочие"""
+    working = sorted((r for r in results if r["success"]), key=lambda r: (r["ttfb"], r["time"]))
+    failed = [r for r in results if not r["success"]]
+    return working + failed
+
+def get_report_filename(working_file):
+    """Имя JSON-отчета рядом со списком рабочих прокси"""
+    return working_file.rsplit(".", 1)[0] + "_report.json"
+
+def save_check_report(results, report_file, target_url):
+    """Сохраняет JSON-отчет по всем проверкам: рабочие прокси от быстрых к медленным, затем нерабочие"""
+    ranked = rank_results(results)
+    report = {
+        "target_url": target_url,
+        "checked_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "total": len(results),
+        "working": sum(1 for r in ranked if r["success"]),
+        "results": ranked
+    }
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+def save_check_results(results, working_file, target_url):
+    """Сохраняет рабочие прокси (от быстрых к медленным) и JSON-отчет рядом с ними.
+
+    Возвращает имя файла отчета.
+    """
+    with open(working_file, 'w', encoding='utf-8') as f:
+        for result in rank_results(results):
+            if result["success"]:
+                f.write(f"{result['proxy']}\n")
+
+    report_file = get_report_filename(working_file)
+    save_check_report(results, report_file, target_url)
+    return report_file
@@ -0,0 +1,49 @@
+# Вес нового наблюдения в сглаженных (EWMA) показателях прокси
+HEALTH_SMOOTHING = 0.1
+LATENCY_SMOOTHING = 0.2
+
+# Время ответа, при котором оценка за скорость снижается вдвое
+LATENCY_REFERENCE = 1.0
+
+# Минимальная оценка: вероятность успеха не считается ниже этого значения
+MIN_HEALTH_WEIGHT = 0.02
+
+# Во сколько секунд обходится неудачная попытка (повтор откладывается примерно на столько)
+FAILURE_COST = 2.0
+
+# Потолок стоимости: даже плохой прокси получает запрос, если простаивал дольше этого,
+# поэтому его восстановление будет замечено
+MAX_PROXY_COST = 30.0
+
+def update_health(stats, success, rate_limit_error=False, latency=None):
+    """Обновляет сглаженные доли успехов и ответов 429, а также время ответа прокси"""
+    success_rate = stats.get("success_rate", 1.0)
+    stats["success_rate"] = success_rate + HEALTH_SMOOTHING * ((1.0 if success else 0.0) - success_rate)
+    rate_limit_rate = stats.get("rate_limit_rate", 0.0)
+    stats["rate_limit_rate"] = rate_limit_rate + HEALTH_SMOOTHING * ((1.0 if rate_limit_error else 0.0) - rate_limit_rate)
+    if latency is not None:
+        previous = stats.get("latency")
+        stats["latency"] = latency if previous is None else previous + LATENCY_SMOOTHING * (latency - previous)
+
+def get_success_probability(stats):
+    """Сглаженная вероятность успешного ответа с учетом ответов 429"""
+    return max(MIN_HEALTH_WEIGHT, stats.get("success_rate", 1.0) * (1.0 - stats.get("rate_limit_rate", 0.0)))
+
+def get_expected_cost(stats):
+    """Ожидаемое время (сек) до успешного ответа через прокси: время ответа и цена неудачных попыток.
+
+    Пока время ответа неизвестно, оно считается нулевым, поэтому новые
+    прокси пробуются в первую очередь.
+    """
+    probability = get_success_probability(stats)
+    latency = stats.get("latency") or 0.0
+    cost = latency / probability + (1.0 - probability) / probability * FAILURE_COST
+    return min(MAX_PROXY_COST, cost)
+
+def get_health_score(stats):
+    """Оценка прокси от MIN_HEALTH_WEIGHT до 1: доля успехов, штраф за 429 и за медленные ответы"""
+    score = get_success_probability(stats)
+    latency = stats.get("latency")
+    if latency is not None:
+        score *= LATENCY_REFERENCE / (LATENCY_REFERENCE + latency)
+    return max(MIN_HEALTH_WEIGHT, score)
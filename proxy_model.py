@@ -0,0 +1,111 @@
+# Протоколы прокси, которые понимают requests (с requests[socks]) и aiohttp-socks
+PROXY_SCHEMES = ("http", "https", "socks4", "socks5", "socks5h")
+
+def _is_address(text):
+    """Похожа ли строка на адрес хост:порт (порт - число)"""
+    host, _, port = text.rpartition(":")
+    return bool(host) and port.isdigit()
+
+class Proxy:
+    """Прокси-сервер, разобранный один раз при загрузке списка.
+
+    Понимает строки ip:port, ip:port:логин:пароль, логин:пароль@ip:port
+    и ip:port@логин:пароль, с протоколом (http://, https://, socks4://,
+    socks5://, socks5h://) или без него (тогда http). Готовые URL (он же
+    ключ сессии в пулах соединений http_transport), словарь proxies для
+    requests и подпись без логина и пароля вычисляются при разборе,
+    поэтому запросы не разбирают строку заново.
+
+    Прокси сравнивается и хешируется как исходная строка из файла: она же
+    выводится через str(), записывается в списки рабочих прокси и служит
+    ключом словарей статистики.
+    """
+    __slots__ = ("raw", "scheme", "host", "port", "username", "password", "url", "label", "proxies")
+
+    def __init__(self, raw, scheme, host, port, username=None, password=None):
+        self.raw = raw
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.url = self.format()
+        self.label = f"{host}:{port}"  # Для логов и отчетов: без логина и пароля
+        self.proxies = {"http": self.url, "https": self.url}
+
+    @classmethod
+    def parse(cls, line, default_scheme="http"):
+        """Разбирает строку прокси; ValueError, если формат не распознан"""
+        raw = line.strip()
+        text = raw
+        scheme = default_scheme
+        if "://" in text:
+            scheme, text = text.split("://", 1)
+            scheme = scheme.lower()
+            if scheme not in PROXY_SCHEMES:
+                raise ValueError(f"неизвестный протокол прокси: {scheme}")
+
+        username = password = None
+        if "@" in text:
+            credentials, address = text.rsplit("@", 1)
+            if _is_address(credentials) and not _is_address(address):
+                # Формат ip:port@логин:пароль
+                credentials, address = address, credentials
+            if ":" not in credentials or not _is_address(address):
+                raise ValueError(f"неподдерживаемый формат прокси: {raw}")
+            username, password = credentials.split(":", 1)
+            host, port = address.rsplit(":", 1)
+        else:
+            parts = text.split(":")
+            if len(parts) == 2:
+                host, port = parts
+            elif len(parts) == 4:
+                host, port, username, password = parts
+            else:
+                raise ValueError(f"неподдерживаемый формат прокси: {raw}")
+
+        if not host or not port.isdigit():
+            raise ValueError(f"неподдерживаемый формат прокси: {raw}")
+        return cls(raw, scheme, host, int(port), username, password)
+
+    @property
+    def is_socks(self):
+        return self.scheme.startswith("socks")
+
+    def format(self, scheme=None):
+        """URL прокси вида протокол://логин:пароль@ip:port (протокол можно заменить)"""
+        auth = f"{self.username}:{self.password}@" if self.username is not None else ""
+        return f"{scheme or self.scheme}://{auth}{self.host}:{self.port}"
+
+    def __str__(self):
+        return self.raw
+
+    def __repr__(self):
+        return f"Proxy({self.label!r}, {self.scheme!r})"
+
+    def __eq__(self, other):
+        if isinstance(other, Proxy):
+            return self.raw == other.raw
+        if isinstance(other, str):
+            return self.raw == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.raw)
+
+def parse_proxies(lines, default_scheme="http"):
+    """Разбирает строки файла прокси, пропуская пустые и комментарии.
+
+    Возвращает (список Proxy, список нераспознанных строк).
+    """
+    proxies = []
+    invalid = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            proxies.append(Proxy.parse(line, default_scheme))
+        except ValueError:
+            invalid.append(line)
+    return proxies, invalid
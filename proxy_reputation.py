@@ -0,0 +1,82 @@
+import json
+import os
+import time
+
+# Файл репутации прокси по умолчанию (в текущем каталоге, как и working_proxies.txt)
+REPUTATION_FILENAME = "proxy_reputation.json"
+
+# Сколько последних времен ответа хранится для расчета процентилей
+LATENCY_SAMPLES = 100
+
+# Процентили времени ответа, которые записываются в репутацию
+LATENCY_PERCENTILES = (50, 90, 99)
+
+# Если прокси получал бан (открывался автомат защиты) не раньше этого
+# срока, запуск начинается с половины выученной скорости
+BAN_MEMORY = 3600
+
+def get_percentile(sorted_samples, percentile):
+    """Процентиль по отсортированной выборке (ближайший ранг)"""
+    index = min(len(sorted_samples) - 1, int(len(sorted_samples) * percentile / 100))
+    return sorted_samples[index]
+
+def get_initial_rate(entry, default_rate, min_rate, max_rate, now=None):
+    """Начальная скорость лимитера прокси: выученная в прошлых запусках, после недавнего бана - вдвое ниже"""
+    rate = entry.get("safe_rate") or default_rate
+    last_ban = entry.get("last_ban")
+    if last_ban and (now or time.time()) - last_ban < BAN_MEMORY:
+        rate *= 0.5
+    return max(min_rate, min(max_rate, rate))
+
+class ProxyReputationStore:
+    """Постоянная история прокси между запусками.
+
+    Для каждого прокси хранятся сглаженные доли успехов и ответов 429,
+    сглаженное время ответа, последние времена ответа и их процентили,
+    выученная безопасная скорость запросов (safe_rate), время последнего
+    бана и накопленные счетчики запросов. Файл - компактный JSON,
+    который целиком переписывается через временный файл в конце запуска.
+    """
+    def __init__(self, path=REPUTATION_FILENAME):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f).get("proxies", {})
+            except (ValueError, OSError, AttributeError) as e:
+                print(f"[ВНИМАНИЕ] Не удалось прочитать репутацию прокси из {path}: {e}")
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, proxy):
+        return self.entries.get(proxy)
+
+    def update(self, proxy, stats, safe_rate, latencies):
+        """Записывает итоги запуска для прокси: сглаженные показатели, скорость, времена ответа и счетчики"""
+        entry = self.entries.setdefault(proxy, {})
+        for key in ("success_rate", "rate_limit_rate", "latency", "last_ban"):
+            if stats.get(key) is not None:
+                entry[key] = stats[key]
+        entry["safe_rate"] = safe_rate
+
+        samples = list(latencies)[-LATENCY_SAMPLES:]
+        if samples:
+            entry["latency_samples"] = [round(s, 4) for s in samples]
+            sorted_samples = sorted(samples)
+            for percentile in LATENCY_PERCENTILES:
+                entry[f"latency_p{percentile}"] = round(get_percentile(sorted_samples, percentile), 4)
+
+        # Счетчики копятся между запусками
+        for key in ("success", "errors", "rate_limit_errors"):
+            entry[f"{key}_total"] = entry.get(f"{key}_total", 0) + stats.get(key, 0)
+        if stats.get("success", 0) or stats.get("errors", 0):
+            entry["last_used"] = time.time()
+
+    def save(self):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"updated_at": time.strftime("%Y-%m-%d %H:%M:%S"), "proxies": self.entries},
+                      f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temp_path, self.path)
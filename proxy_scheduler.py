@@ -0,0 +1,157 @@
+import heapq
+import itertools
+import threading
+import time
+from array import array
+
+class ProxyScheduler:
+    """Индексированный планировщик прокси: выбор и освобождение за O(log n).
+
+    Вместо перебора всего списка прокси под общей блокировкой планировщик
+    держит кучу готовых прокси, упорядоченную по моменту, когда прокси
+    сможет выполнить следующий запрос (его сообщает get_ready_time, обычно
+    это лимитер прокси). В куче только активные прокси со свободными
+    слотами; устаревшие записи не удаляются сразу, а отбрасываются при
+    извлечении (у каждой записи есть версия).
+
+    Если задан get_cost (ожидаемое время получения успешного ответа через
+    прокси, см. proxy_health), ключом служит момент готовности плюс эта
+    стоимость, то есть ожидаемое время завершения запроса: быстрые и чистые
+    прокси получают больше запросов, а слабые выбираются, лишь когда их
+    давняя готовность перевешивает стоимость.
+
+    Состояние хранится массивами по индексу прокси (active, in_flight,
+    last_used, versions), а не словарем словарей.
+    """
+    def __init__(self, proxies, max_in_flight=1, get_ready_time=None, get_cost=None):
+        self.proxies = list(proxies)
+        self.index = {proxy: i for i, proxy in enumerate(self.proxies)}
+        self.max_in_flight = max_in_flight
+        self.get_ready_time = get_ready_time
+        self.get_cost = get_cost
+        self.lock = threading.Lock()
+
+        count = len(self.proxies)
+        self.active = bytearray([1]) * count
+        self.in_flight = array('i', [0]) * count
+        self.last_used = array('d', [0.0]) * count
+        self.versions = array('q', [0]) * count
+        self.active_count = count
+
+        self.heap = []
+        self.counter = itertools.count()
+        for i in range(count):
+            self._push(i)
+
+    def _get_key(self, i):
+        """Ключ в куче: момент готовности по time.monotonic (без лимитера - момент добавления) плюс стоимость"""
+        proxy = self.proxies[i]
+        key = self.get_ready_time(proxy) if self.get_ready_time else time.monotonic()
+        if self.get_cost:
+            key += self.get_cost(proxy)
+        return key
+
+    def _push(self, i):
+        """Добавляет прокси в кучу; прежние записи этого прокси становятся устаревшими"""
+        self.versions[i] += 1
+        heapq.heappush(self.heap, (self._get_key(i), next(self.counter), i, self.versions[i]))
+        # Если устаревших записей накопилось много, перестраиваем кучу
+        if len(self.heap) > 2 * len(self.proxies) + 64:
+            self.heap = [entry for entry in self.heap if self._is_valid(entry)]
+            heapq.heapify(self.heap)
+
+    def _is_valid(self, entry):
+        i, version = entry[2], entry[3]
+        return version == self.versions[i] and self.active[i] and self.in_flight[i] < self.max_in_flight
+
+    def set_max_in_flight(self, max_in_flight):
+        """Меняет количество одновременных запросов через один прокси"""
+        with self.lock:
+            self.max_in_flight = max_in_flight
+            for i in range(len(self.proxies)):
+                if self.active[i] and self.in_flight[i] < max_in_flight:
+                    self._push(i)
+
+    def acquire(self, exclude=None):
+        """Занимает прокси, который раньше других сможет выполнить запрос.
+
+        Прокси из exclude выбираются, только если других активных прокси нет.
+        Возвращает None, если все подходящие прокси заняты.
+        """
+        with self.lock:
+            excluded = set()
+            if exclude:
+                excluded = {self.index[p] for p in exclude if p in self.index}
+            skipped = []
+            selected = None
+            while self.heap:
+                entry = heapq.heappop(self.heap)
+                if not self._is_valid(entry):
+                    continue
+                if entry[2] in excluded:
+                    skipped.append(entry)
+                    continue
+                selected = entry[2]
+                break
+
+            if selected is None and skipped:
+                # Если свободны только исключенные прокси, а других активных нет, берем лучший из них
+                other_active = self.active_count - sum(1 for i in excluded if self.active[i])
+                if other_active == 0:
+                    selected = skipped.pop(0)[2]
+            for entry in skipped:
+                heapq.heappush(self.heap, entry)
+
+            if selected is None:
+                return None
+
+            self.in_flight[selected] += 1
+            self.last_used[selected] = time.time()
+            if self.in_flight[selected] < self.max_in_flight:
+                self._push(selected)
+            return self.proxies[selected]
+
+    def release(self, proxy):
+        """Освобождает слот прокси и возвращает его в кучу с новым моментом готовности"""
+        i = self.index.get(proxy)
+        if i is None:
+            return
+        with self.lock:
+            if self.in_flight[i] > 0:
+                self.in_flight[i] -= 1
+            if self.active[i]:
+                self._push(i)
+
+    def deactivate(self, proxy):
+        i = self.index.get(proxy)
+        if i is None:
+            return
+        with self.lock:
+            if self.active[i]:
+                self.active[i] = 0
+                self.active_count -= 1
+                self.versions[i] += 1
+
+    def activate(self, proxy):
+        i = self.index.get(proxy)
+        if i is None:
+            return
+        with self.lock:
+            if not self.active[i]:
+                self.active[i] = 1
+                self.active_count += 1
+                if self.in_flight[i] < self.max_in_flight:
+                    self._push(i)
+
+    def activate_all(self):
+        with self.lock:
+            for i in range(len(self.proxies)):
+                if not self.active[i]:
+                    self.active[i] = 1
+                    if self.in_flight[i] < self.max_in_flight:
+                        self._push(i)
+            self.active_count = len(self.proxies)
+
+    def is_active(self, proxy):
+        i = self.index.get(proxy)
+        return i is not None and bool(self.active[i])
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+import time
+
+class TokenBucket:
+    """Ограничитель частоты запросов «маркерная корзина» (алгоритм GCRA).
+
+    Вместо списка времен последних вызовов хранится одно число - теоретическое
+    время прибытия следующего запроса (tat). Под блокировкой выполняется
+    только арифметика: вызывающий резервирует слот и получает время ожидания,
+    а спит уже без блокировки. Поэтому потоки не выстраиваются в очередь
+    за тем, кто ждет, а каждый сразу узнает свое время.
+
+    rate - средняя скорость (запросов в секунду), burst - сколько запросов
+    можно выполнить подряд без ожидания после простоя.
+    """
+    def __init__(self, rate=1.0, burst=1):
+        self.lock = threading.Lock()
+        self.burst = max(1, burst)
+        self.tat = 0.0
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        """Меняет скорость; уже выданные слоты сохраняются"""
+        with self.lock:
+            self.rate = rate
+            self.interval = 1.0 / rate
+            self.tolerance = self.interval * (self.burst - 1)
+
+    def reserve(self):
+        """Резервирует слот и возвращает, сколько секунд нужно подождать до него"""
+        with self.lock:
+            now = time.monotonic()
+            tat = max(self.tat, now)
+            self.tat = tat + self.interval
+        return max(0.0, tat - self.tolerance - now)
+
+    def delay_until_ready(self):
+        """Возвращает время ожидания следующего слота, не резервируя его"""
+        with self.lock:
+            return max(0.0, self.tat - self.tolerance - time.monotonic())
+
+    def next_ready_time(self):
+        """Момент (по time.monotonic), с которого следующий слот выдается без ожидания"""
+        with self.lock:
+            return self.tat - self.tolerance
+
+    def try_acquire(self):
+        """Резервирует слот, только если он доступен сразу; возвращает True при успехе"""
+        with self.lock:
+            now = time.monotonic()
+            tat = max(self.tat, now)
+            if tat - self.tolerance > now:
+                return False
+            self.tat = tat + self.interval
+            return True
+
+    def wait_for_permission(self):
+        """Блокирует текущий поток до зарезервированного слота"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def wait_for_permission_async(self):
+        """Асинхронный вариант: ждет слот, не блокируя цикл событий"""
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+class AdaptiveWindow:
+    """Адаптивный размер окна: сколько запросов держать в полете одновременно.
+
+    Окно растет на единицу за каждые size успешных ответов (аддитивный
+    рост), пока время ответа остается близким к лучшему наблюдавшемуся, и
+    уменьшается на единицу, когда сглаженное время ответа превышает лучшее
+    в latency_tolerance раз. При ошибке окно сразу уменьшается вдвое, поэтому
+    на волну ответов 429 загрузчик реагирует, не отправив весь остаток работы.
+    """
+    def __init__(self, initial_size, min_size=1, max_size=None, latency_tolerance=2.0, smoothing=0.2):
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size or initial_size)
+        self.size = min(self.max_size, max(self.min_size, initial_size))
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self.lock = threading.Lock()
+
+        self.best_latency = None
+        self.latency = None
+        self.successes = 0
+
+    def report_success(self, latency):
+        with self.lock:
+            if self.best_latency is None or latency < self.best_latency:
+                self.best_latency = latency
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.smoothing * (latency - self.latency)
+
+            self.successes += 1
+            if self.successes < self.size:
+                return
+            self.successes = 0
+            if self.latency > self.best_latency * self.latency_tolerance:
+                # Сервер отвечает заметно медленнее - разгружаем его
+                self.size = max(self.min_size, self.size - 1)
+            else:
+                self.size = min(self.max_size, self.size + 1)
+
+    def report_error(self):
+        with self.lock:
+            self.size = max(self.min_size, self.size // 2)
+            self.successes = 0
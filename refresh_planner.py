@@ -0,0 +1,197 @@
+import gzip
+import hashlib
+import json
+import os
+import zlib
+from datetime import datetime
+
+from ndjson_sink import is_ndjson_file, iter_ndjson_items
+from details_storage import is_details_file, get_details_id, open_details_file, replace_with_temp
+
+# Ошибки чтения файла: недоступный, неразборчивый JSON или поврежденный gzip
+READ_ERRORS = (OSError, ValueError, EOFError, zlib.error, gzip.BadGzipFile)
+
+# Поля, которые сравниваются между строкой легкого списка и сохраненной детальной записью:
+# (путь внутри certdecltr_ConformityDocDetails, имя поля в плоской строке списка, статусное ли поле).
+# Различия только в статусных полях исправляются прямо в сохраненном файле,
+# различия в остальных полях требуют повторной загрузки деталей
+COMPARED_FIELDS = [
+    (("DocStatusDetails", "DocStatusCode"), "DocStatusCode", True),
+    (("DocStatusDetails", "StartDate"), "DocStatusStartDate", True),
+    (("DocStatusDetails", "EndDate"), "DocStatusEndDate", True),
+    (("DocStartDate",), "DocStartDate", False),
+    (("DocValidityDate",), "DocValidityDate", False),
+]
+
+DETAILS_KEY = "certdecltr_ConformityDocDetails"
+
+def get_light_fingerprint(row):
+    """Возвращает отпечаток строки легкого списка (хеш ее содержимого)"""
+    return hashlib.sha1(json.dumps(row, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def parse_date_value(value):
+    """Разбирает дату в формате ISO (с временем или без) или ДД.ММ.ГГГГ; возвращает None, если это не дата"""
+    if not isinstance(value, str):
+        return None
+    for parse in (lambda v: datetime.strptime(v[:10], "%Y-%m-%d"), lambda v: datetime.strptime(v, "%d.%m.%Y")):
+        try:
+            return parse(value).date()
+        except ValueError:
+            continue
+    return None
+
+def normalize_value(value):
+    """Приводит значение к виду для сравнения: даты - к ISO, остальное - к строке"""
+    if value is None:
+        return None
+    parsed = parse_date_value(value)
+    if parsed:
+        return parsed.isoformat()
+    return str(value).strip()
+
+def convert_like(value, sample):
+    """Приводит дату из списка к формату значения, уже сохраненного в детальной записи"""
+    parsed = parse_date_value(value)
+    if parsed is None or not isinstance(sample, str):
+        return value
+    if parse_date_value(sample) and "." in sample[:10]:
+        return parsed.strftime("%d.%m.%Y")
+    if parse_date_value(sample):
+        return parsed.isoformat() + sample[10:]
+    return value
+
+def get_detail_value(details, path):
+    current = details.get(DETAILS_KEY, {})
+    for key in path:
+        if not isinstance(current, dict):
+            return None
+        current = current.get(key)
+    return current
+
+def set_detail_value(details, path, value):
+    current = details.setdefault(DETAILS_KEY, {})
+    for key in path[:-1]:
+        current = current.setdefault(key, {})
+    current[path[-1]] = convert_like(value, current.get(path[-1]))
+
+def get_light_value(row, path, flat_name):
+    """Ищет поле в строке списка: во вложенной структуре, как у деталей, или в плоском виде"""
+    if isinstance(row.get(DETAILS_KEY), dict):
+        return get_detail_value(row, path)
+    return row.get(flat_name)
+
+def compare_row_with_details(row, details):
+    """Возвращает списки различающихся статусных и прочих полей"""
+    status_changes = []
+    other_changes = []
+    for path, flat_name, is_status in COMPARED_FIELDS:
+        light_value = get_light_value(row, path, flat_name)
+        # Поля, которых нет в строке списка, не сравниваются
+        if light_value is None:
+            continue
+        if normalize_value(light_value) != normalize_value(get_detail_value(details, path)):
+            (status_changes if is_status else other_changes).append((path, light_value))
+    return status_changes, other_changes
+
+def iter_light_rows(source_dir):
+    """Возвращает строки легкого списка из JSON-страниц и NDJSON-файлов каталога (старые файлы первыми)"""
+    filenames = [f for f in os.listdir(source_dir) if f.endswith(".json") or is_ndjson_file(f)]
+    filenames.sort(key=lambda f: os.path.getmtime(os.path.join(source_dir, f)))
+
+    for filename in filenames:
+        file_path = os.path.join(source_dir, filename)
+        try:
+            if is_ndjson_file(filename):
+                yield from iter_ndjson_items(file_path)
+            else:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    yield from data.get("items", [])
+        except READ_ERRORS as e:
+            print(f"[ОШИБКА] Ошибка при чтении файла {file_path}: {e}")
+
+def find_saved_details(details_dir):
+    """Находит сохраненные детальные записи во всех батчах: {ID: путь}, более новые батчи важнее"""
+    saved = {}
+    for dirname in sorted(os.listdir(details_dir)):
+        batch_dir = os.path.join(details_dir, dirname)
+        if not (os.path.isdir(batch_dir) and dirname.startswith("batch_")):
+            continue
+        for filename in os.listdir(batch_dir):
+            if is_details_file(filename):
+                try:
+                    saved[get_details_id(filename)] = os.path.join(batch_dir, filename)
+                except ValueError:
+                    pass
+    return saved
+
+def save_details(details, path):
+    """Перезаписывает файл деталей через временный файл, чтобы сбой не оставил его обрезанным"""
+    def write(temp_path):
+        with open_details_file(temp_path, 'w', compressed=path.endswith(".gz")) as f:
+            json.dump(details, f, ensure_ascii=False, indent=2)
+    replace_with_temp(path, write)
+
+def plan_refresh(source_dir, details_dir, cache):
+    """Сравнивает легкий список с сохраненными деталями и возвращает ID, детали которых нужно загрузить.
+
+    Новые декларации и декларации с изменившимися датами попадают в список
+    загрузки. Если изменился только статус, он исправляется прямо в
+    сохраненном файле. Отпечаток строки списка запоминается в кеше
+    валидаторов, поэтому при следующем обновлении неизменившиеся строки
+    отбрасываются без чтения файлов деталей.
+    """
+    # Последняя версия строки для каждого ID
+    rows = {}
+    for row in iter_light_rows(source_dir):
+        declaration_id = row.get("certdecltr_id")
+        if declaration_id:
+            rows[declaration_id] = row
+
+    saved_paths = find_saved_details(details_dir)
+    stats = {"rows": len(rows), "new": 0, "changed": 0, "status_updated": 0, "unchanged": 0}
+    to_fetch = []
+
+    for declaration_id, row in rows.items():
+        fingerprint = get_light_fingerprint(row)
+        entry = cache.get(declaration_id)
+        path = entry["path"] if entry else saved_paths.get(declaration_id)
+
+        if not path:
+            stats["new"] += 1
+            to_fetch.append(declaration_id)
+            cache.expect_light_hash(declaration_id, fingerprint)
+            continue
+
+        if entry and entry.get("light_hash") == fingerprint:
+            stats["unchanged"] += 1
+            continue
+
+        try:
+            with open_details_file(path) as f:
+                details = json.load(f)
+        except READ_ERRORS:
+            # Поврежденный файл деталей загружается заново
+            details = None
+
+        status_changes, other_changes = compare_row_with_details(row, details) if isinstance(details, dict) else ([], [None])
+
+        if other_changes or (entry and entry.get("light_hash") and not status_changes):
+            # Изменились даты или поля, которые не сравниваются напрямую, - загружаем заново
+            stats["changed"] += 1
+            to_fetch.append(declaration_id)
+            cache.expect_light_hash(declaration_id, fingerprint)
+            continue
+
+        if status_changes:
+            for field_path, value in status_changes:
+                set_detail_value(details, field_path, value)
+            save_details(details, path)
+            stats["status_updated"] += 1
+        else:
+            stats["unchanged"] += 1
+
+        cache.set_light_hash(declaration_id, fingerprint, path)
+
+    return to_fetch, stats
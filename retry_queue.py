@@ -0,0 +1,66 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+# Классы ошибок, после которых повтор бессмыслен
+NON_RETRYABLE_ERRORS = {"not_found"}
+
+# Минимальная задержка перед повтором после ответа 429
+RATE_LIMIT_DELAY = 5.0
+
+class RetryQueue:
+    """Очередь отложенных повторов, упорядоченная по времени, когда задачу можно повторить.
+
+    Неудачная попытка не повторяется на месте: задача откладывается с
+    экспоненциальной задержкой, а поток тем временем берет новые ID. Задача
+    помнит прокси, через которые уже пробовали, чтобы повтор ушел через другой.
+    Очередь потокобезопасна и не блокирует, поэтому годится и для asyncio.
+    """
+    def __init__(self, base_delay=2.0, max_delay=60.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.heap = []
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def new_task(declaration_id):
+        return {"id": declaration_id, "attempts": 0, "tried_proxies": []}
+
+    def get_delay(self, attempts, error_class=None):
+        """Экспоненциальная задержка с разбросом; после 429 - не меньше RATE_LIMIT_DELAY"""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        delay *= random.uniform(0.8, 1.2)
+        if error_class == "rate_limit":
+            delay = max(delay, RATE_LIMIT_DELAY)
+        return delay
+
+    def defer(self, task, delay):
+        with self.lock:
+            heapq.heappush(self.heap, (time.monotonic() + delay, next(self.counter), task))
+
+    def pop_ready(self):
+        """Возвращает задачу, время повтора которой наступило, или None"""
+        with self.lock:
+            if self.heap and self.heap[0][0] <= time.monotonic():
+                return heapq.heappop(self.heap)[2]
+        return None
+
+    def next_ready_in(self, default=0.5):
+        """Сколько секунд до ближайшего повтора (default, если очередь пуста)"""
+        with self.lock:
+            if not self.heap:
+                return default
+            return max(0.0, self.heap[0][0] - time.monotonic())
+
+    def __len__(self):
+        with self.lock:
+            return len(self.heap)
+
+def should_retry(result, task, max_attempts):
+    """Нужно ли отложить повтор задачи после неудачной попытки"""
+    return (not result["success"]
+            and result.get("error_class") not in NON_RETRYABLE_ERRORS
+            and task["attempts"] < max_attempts)
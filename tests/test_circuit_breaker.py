@@ -0,0 +1,101 @@
+import threading
+import unittest
+
+from circuit_breaker import CircuitBreakers, CLOSED, OPEN, HALF_OPEN
+
+# Сколько ждать фонового перехода в полуоткрытое состояние, секунд
+WAIT_TIMEOUT = 2.0
+
+class CircuitBreakersTest(unittest.TestCase):
+    def setUp(self):
+        self.events = []
+        self.half_opened = threading.Event()
+
+        def on_half_open(proxy):
+            self.events.append(("half_open", proxy))
+            self.half_opened.set()
+
+        self.breakers = CircuitBreakers(
+            failure_threshold=2,
+            open_timeout=0.05,
+            on_open=lambda proxy: self.events.append(("open", proxy)),
+            on_half_open=on_half_open,
+            on_close=lambda proxy: self.events.append(("close", proxy))
+        )
+
+    def open_and_wait_half_open(self, proxy):
+        """Открывает автомат двумя ответами 429 и ждет перехода в полуоткрытое состояние"""
+        self.breakers.record_failure(proxy, rate_limit_error=True)
+        self.assertTrue(self.breakers.record_failure(proxy, rate_limit_error=True))
+        self.assertTrue(self.half_opened.wait(WAIT_TIMEOUT))
+        self.half_opened.clear()
+        self.assertEqual(self.breakers.get_state(proxy), HALF_OPEN)
+
+    def test_only_rate_limit_errors_open_closed_breaker(self):
+        for _ in range(5):
+            self.assertFalse(self.breakers.record_failure("a"))
+        self.assertEqual(self.breakers.get_state("a"), CLOSED)
+
+        self.assertFalse(self.breakers.record_failure("a", rate_limit_error=True))
+        self.assertTrue(self.breakers.record_failure("a", rate_limit_error=True, timeout=60))
+        self.assertEqual(self.breakers.get_state("a"), OPEN)
+        # Ответы на запросы, отправленные до открытия, автомат не трогают
+        self.assertFalse(self.breakers.record_failure("a", rate_limit_error=True))
+        self.assertEqual(self.breakers.get_state_counts(), {OPEN: 1, HALF_OPEN: 0})
+
+    def test_half_open_allows_single_trial(self):
+        self.open_and_wait_half_open("a")
+        self.assertTrue(self.breakers.start_trial("a"))
+        self.assertFalse(self.breakers.start_trial("a"))
+
+        self.breakers.record_success("a")
+        self.assertEqual(self.breakers.get_state("a"), CLOSED)
+        self.assertFalse(self.breakers.finish_trial("a"))
+        self.assertEqual(self.events, [("open", "a"), ("half_open", "a"), ("close", "a")])
+
+    def test_failed_trial_reopens(self):
+        self.open_and_wait_half_open("a")
+        self.assertTrue(self.breakers.start_trial("a"))
+        # В полуоткрытом состоянии автомат открывает любая неудача, не только 429
+        self.assertTrue(self.breakers.record_failure("a", timeout=60))
+        self.assertEqual(self.breakers.get_state("a"), OPEN)
+        self.assertFalse(self.breakers.start_trial("a"))
+
+    def test_cancelled_trial_rearms(self):
+        self.open_and_wait_half_open("a")
+        self.assertTrue(self.breakers.start_trial("a"))
+        # Пробный запрос отменен без результата - автомат ждет следующей пробы
+        self.assertTrue(self.breakers.finish_trial("a"))
+        self.assertEqual(self.breakers.get_state("a"), HALF_OPEN)
+        self.assertTrue(self.breakers.start_trial("a"))
+
+    def test_success_outside_half_open_is_ignored(self):
+        self.breakers.record_failure("a", rate_limit_error=True)
+        self.breakers.record_success("a")
+        self.assertEqual(self.events, [])
+        # Счетчик 429 в закрытом состоянии успехом не сбрасывается
+        self.assertTrue(self.breakers.record_failure("a", rate_limit_error=True, timeout=60))
+
+    def test_reset_all_closes_and_drops_deadlines(self):
+        self.breakers.record_failure("a", rate_limit_error=True)
+        self.breakers.record_failure("a", rate_limit_error=True)
+        self.breakers.record_failure("b", rate_limit_error=True)
+        self.breakers.reset_all()
+
+        self.assertEqual(self.breakers.get_state("a"), CLOSED)
+        self.assertEqual(self.breakers.heap, [])
+        self.assertFalse(self.half_opened.wait(0.2))
+        # Счетчики 429 тоже сброшены
+        self.assertFalse(self.breakers.record_failure("b", rate_limit_error=True))
+
+    def test_stale_deadline_is_skipped(self):
+        with self.breakers.condition:
+            self.breakers._open("a", 0.05)
+            # Повторное открытие с долгим сроком делает первую запись в куче устаревшей
+            self.breakers._open("a", 60)
+        self.assertFalse(self.half_opened.wait(0.3))
+        self.assertEqual(self.breakers.get_state("a"), OPEN)
+        self.assertEqual(len(self.breakers.heap), 1)
+
+if __name__ == "__main__":
+    unittest.main()
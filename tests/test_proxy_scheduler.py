@@ -0,0 +1,69 @@
+import unittest
+
+from proxy_scheduler import ProxyScheduler
+
+class ProxySchedulerTest(unittest.TestCase):
+    def setUp(self):
+        # Моменты готовности прокси задаются тестом: "a" готов раньше "b"
+        self.ready = {"a": 1.0, "b": 2.0}
+        self.scheduler = ProxyScheduler(["a", "b"], get_ready_time=self.ready.get)
+
+    def test_acquires_earliest_ready(self):
+        self.assertEqual(self.scheduler.acquire(), "a")
+        self.assertEqual(self.scheduler.acquire(), "b")
+        self.assertIsNone(self.scheduler.acquire())
+
+    def test_release_returns_proxy(self):
+        self.assertEqual(self.scheduler.acquire(), "a")
+        self.ready["a"] = 3.0
+        self.scheduler.release("a")
+        self.assertEqual(self.scheduler.acquire(), "b")
+        self.assertEqual(self.scheduler.acquire(), "a")
+
+    def test_exclude_skips_proxy(self):
+        self.assertEqual(self.scheduler.acquire(exclude=["a"]), "b")
+        # Исключенный прокси остается в куче для следующих запросов
+        self.assertEqual(self.scheduler.acquire(), "a")
+
+    def test_exclude_waits_for_busy_other_proxy(self):
+        self.assertEqual(self.scheduler.acquire(exclude=["a"]), "b")
+        # "b" активен, но занят: исключенный "a" не выдается, нужно подождать
+        self.assertIsNone(self.scheduler.acquire(exclude=["a"]))
+        self.scheduler.release("b")
+        self.assertEqual(self.scheduler.acquire(exclude=["a"]), "b")
+
+    def test_exclude_falls_back_when_no_other_active(self):
+        self.scheduler.deactivate("b")
+        self.assertEqual(self.scheduler.acquire(exclude=["a"]), "a")
+
+        self.scheduler.release("a")
+        self.assertEqual(self.scheduler.acquire(exclude=["a", "b"]), "a")
+
+    def test_deactivated_proxy_not_acquired_until_activated(self):
+        self.scheduler.deactivate("a")
+        self.assertFalse(self.scheduler.is_active("a"))
+        self.assertEqual(self.scheduler.acquire(), "b")
+        self.assertIsNone(self.scheduler.acquire())
+
+        self.scheduler.activate("a")
+        self.assertEqual(self.scheduler.acquire(), "a")
+
+    def test_set_max_in_flight(self):
+        scheduler = ProxyScheduler(["a"], get_ready_time=self.ready.get)
+        self.assertEqual(scheduler.acquire(), "a")
+        self.assertIsNone(scheduler.acquire())
+
+        # Новый слот освободившегося лимита выдается сразу, без release
+        scheduler.set_max_in_flight(2)
+        self.assertEqual(scheduler.acquire(), "a")
+        self.assertIsNone(scheduler.acquire())
+
+        scheduler.set_max_in_flight(1)
+        scheduler.release("a")
+        # Занят еще один слот из одного - прокси не выдается
+        self.assertIsNone(scheduler.acquire())
+        scheduler.release("a")
+        self.assertEqual(scheduler.acquire(), "a")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import hashlib
+import os
+import threading
+
+from ndjson_sink import NdjsonSink, iter_ndjson_items
+
+# Имя индекса валидаторов в каталоге с деталями деклараций
+VALIDATORS_FILENAME = "validators.ndjson"
+
+# Сентинел, который возвращают запросы, если декларация не изменилась
+NOT_MODIFIED = object()
+
+def get_content_hash(content):
+    """Возвращает хеш тела ответа для сравнения, когда сервер не присылает ETag/Last-Modified"""
+    return hashlib.sha1(content).hexdigest()
+
+def get_conditional_headers(validators):
+    """Формирует заголовки условного запроса по сохраненным валидаторам"""
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+def update_validators(validators, headers, content):
+    """Записывает в словарь валидаторы и размер ответа 200"""
+    validators["etag"] = headers.get("ETag")
+    validators["last_modified"] = headers.get("Last-Modified")
+    validators["hash"] = get_content_hash(content)
+    validators["size"] = len(content)
+
+class ValidatorCache:
+    """Индекс валидаторов сохраненных деклараций для условных запросов.
+
+    Для каждой декларации хранятся ETag, Last-Modified, хеш содержимого, путь
+    к сохраненному файлу и отпечаток строки легкого списка, с которой эта
+    запись сверена (light_hash). Индекс - NDJSON-файл, в который дописываются
+    новые записи; при чтении действует последняя запись для каждого ID, а при
+    заметном разрастании файл переписывается.
+    """
+    def __init__(self, directory):
+        self.path = os.path.join(directory, VALIDATORS_FILENAME)
+        self.entries = {}
+        self.lock = threading.Lock()
+        
+        # Отпечатки строк списка для деклараций, поставленных в очередь загрузки
+        self.pending_light_hashes = {}
+
+        line_count = 0
+        if os.path.exists(self.path):
+            for record in iter_ndjson_items(self.path):
+                line_count += 1
+                if "id" in record:
+                    self.entries[record["id"]] = record
+
+        if line_count > 2 * len(self.entries) + 1000:
+            self._compact()
+
+        self.sink = NdjsonSink(self.path)
+
+    def _compact(self):
+        """Переписывает индекс, оставляя по одной записи на декларацию"""
+        temp_path = self.path + ".tmp"
+        with NdjsonSink(temp_path) as sink:
+            sink.write_items(list(self.entries.values()))
+        os.replace(temp_path, self.path)
+
+    def get(self, declaration_id):
+        """Возвращает копию валидаторов декларации, если ее файл все еще на месте"""
+        with self.lock:
+            entry = self.entries.get(declaration_id)
+        if entry and os.path.exists(entry.get("path", "")):
+            return dict(entry)
+        return None
+
+    def update(self, declaration_id, validators, path):
+        """Сохраняет валидаторы декларации, записанной в path"""
+        with self.lock:
+            entry = {
+                "id": declaration_id,
+                "etag": validators.get("etag"),
+                "last_modified": validators.get("last_modified"),
+                "hash": validators.get("hash"),
+                "path": path,
+                "light_hash": self.pending_light_hashes.pop(declaration_id, None)
+            }
+            self.entries[declaration_id] = entry
+        self.sink.write_items([entry])
+
+    def expect_light_hash(self, declaration_id, light_hash):
+        """Запоминает отпечаток строки списка; он сохранится, когда детали будут загружены"""
+        with self.lock:
+            self.pending_light_hashes[declaration_id] = light_hash
+
+    def confirm(self, declaration_id):
+        """Сохраняет ожидающий отпечаток, если сервер подтвердил, что детали не изменились"""
+        with self.lock:
+            light_hash = self.pending_light_hashes.pop(declaration_id, None)
+            entry = self.entries.get(declaration_id)
+        if light_hash and entry:
+            self.set_light_hash(declaration_id, light_hash, entry["path"])
+
+    def set_light_hash(self, declaration_id, light_hash, path):
+        """Отмечает, что сохраненная в path запись соответствует строке списка с этим отпечатком"""
+        with self.lock:
+            entry = dict(self.entries.get(declaration_id) or {"id": declaration_id})
+            entry["path"] = path
+            entry["light_hash"] = light_hash
+            self.entries[declaration_id] = entry
+        self.sink.write_items([entry])
+
+    def close(self):
+        self.sink.close()